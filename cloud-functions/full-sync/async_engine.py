@@ -0,0 +1,358 @@
+"""
+asyncio/httpx 同步引擎
+
+与 main.full_sync_site 的线程引擎输出一致（相同的 update_data、进度行和取消语义），
+但请求在单个事件循环中并发执行，在途请求数（商品分页和变体）只受 concurrency 限制，不再受线程数限制；
+商品转换和结果组装复用 main 的 ProductTransformer 和 process_woo_product。
+通过 full_sync_site(..., engine='async') 或请求参数 {"engine": "async"} 使用。
+"""
+
+import asyncio
+import itertools
+import time
+from datetime import datetime
+from typing import Optional, Dict, List, Any, Tuple
+
+import httpx
+
+import codec
+from main import (
+    SITES,
+    PRODUCT_FIELDS,
+    VARIATION_FIELDS,
+    PRICE_STOCK_FIELDS,
+    ASYNC_DEFAULT_CONCURRENCY,
+    RETRY_STATUS_CODES,
+    retry_after_seconds,
+    SyncMetrics,
+    metrics_phase,
+    ProductTransformer,
+    BatchWriter,
+    VariationCache,
+    process_woo_product,
+    load_variation_cache,
+    load_content_fingerprints,
+    update_progress,
+    check_if_cancelled,
+    ProgressReporter,
+    logger,
+)
+
+# 每个 httpx 连接池的连接数上限。
+# httpcore 分配请求时会遍历整个连接池（开销约为 等待请求数 × 连接数），
+# 大连接池在高并发下 CPU 开销明显，因此把连接分散到多个小连接池中轮询使用
+POOL_SHARD_SIZE = 8
+
+
+class AsyncWooCommerceClient:
+    """WooCommerce REST API 异步客户端（多个 httpx 长连接池轮询，每个请求占用一个信号量名额，在途请求数不超过 concurrency）"""
+
+    def __init__(
+        self,
+        site: str,
+        concurrency: int = ASYNC_DEFAULT_CONCURRENCY,
+        product_fields: Optional[List[str]] = None,
+        variation_fields: Optional[List[str]] = None,
+        metrics: Optional[SyncMetrics] = None,
+    ):
+        self.site = site
+        self.metrics = metrics
+        config = SITES.get(site)
+        if not config:
+            raise ValueError(f"Unknown site: {site}")
+
+        self.base_url = f"{config['url']}/wp-json/wc/v3"
+        self.product_fields = ','.join(product_fields or PRODUCT_FIELDS)
+        self.variation_fields = ','.join(variation_fields or VARIATION_FIELDS)
+        shards = max(1, -(-concurrency // POOL_SHARD_SIZE))
+        self.clients = [
+            httpx.AsyncClient(
+                auth=(config['key'], config['secret']),
+                headers={'Accept-Encoding': 'gzip'},
+                timeout=30,
+                limits=httpx.Limits(max_connections=POOL_SHARD_SIZE, max_keepalive_connections=POOL_SHARD_SIZE),
+            )
+            for _ in range(shards)
+        ]
+        self._next_client = itertools.cycle(self.clients)
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+    async def aclose(self):
+        for client in self.clients:
+            await client.aclose()
+
+    async def _send(self, url: str, params: Optional[Dict[str, Any]], endpoint: str) -> httpx.Response:
+        """发送一次 GET 请求，有 metrics 时按 endpoint 记录延迟、状态码和接收字节数"""
+        async with self.semaphore:
+            started = time.monotonic()
+            try:
+                response = await next(self._next_client).get(url, params=params)
+            except httpx.HTTPError:
+                if self.metrics:
+                    self.metrics.record_request(endpoint, time.monotonic() - started)
+                raise
+            if self.metrics:
+                length = response.headers.get('Content-Length', '')
+                size = int(length) if length.isdigit() else len(response.content)
+                self.metrics.record_request(endpoint, time.monotonic() - started, response.status_code, size)
+        return response
+
+    async def _request_with_retry(self, url: str, params: Optional[Dict[str, Any]] = None, max_retries: int = 3, endpoint: str = 'other') -> httpx.Response:
+        """带重试的请求（与 WooCommerceClient._request_with_retry 相同的重试策略）"""
+        for attempt in range(max_retries):
+            try:
+                response = await self._send(url, params, endpoint)
+                if response.status_code in RETRY_STATUS_CODES:
+                    if attempt < max_retries - 1:
+                        if self.metrics:
+                            self.metrics.record_retry()
+                        wait_time = retry_after_seconds(response.headers, (attempt + 1) * 2)  # 默认 2, 4, 6 秒
+                        logger.warning(f"{response.status_code} 错误，{wait_time:.0f}秒后重试 ({attempt + 1}/{max_retries})")
+                        await asyncio.sleep(wait_time)
+                        continue
+                response.raise_for_status()
+                return response
+            except httpx.HTTPError as e:
+                # 4xx（429 除外）是请求本身的问题，重试没有意义
+                status = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else None
+                if status and 400 <= status < 500 and status not in RETRY_STATUS_CODES:
+                    raise
+                if attempt < max_retries - 1:
+                    if self.metrics:
+                        self.metrics.record_retry()
+                    wait_time = (attempt + 1) * 2
+                    logger.warning(f"请求失败: {e}，{wait_time}秒后重试")
+                    await asyncio.sleep(wait_time)
+                else:
+                    raise
+        raise Exception("Max retries exceeded")
+
+    async def get_products_page(self, page: int = 1, per_page: int = 100, modified_after: Optional[str] = None) -> Tuple[List[Dict[str, Any]], httpx.Headers]:
+        """获取一页商品，同时返回响应头（X-WP-TotalPages）"""
+        params = {'page': page, 'per_page': per_page, '_fields': self.product_fields}
+        if modified_after:
+            params.update({'modified_after': modified_after, 'dates_are_gmt': 'true'})
+        with metrics_phase(self.metrics, 'list_pages'):
+            response = await self._request_with_retry(f"{self.base_url}/products", params=params, endpoint='products')
+        return codec.loads(response.content), response.headers
+
+    async def get_all_products(self, modified_after: Optional[str] = None) -> List[Dict[str, Any]]:
+        """获取所有商品：先取第 1 页，再按 X-WP-TotalPages 并发获取其余页面（在途请求受信号量限制），结果按页码顺序合并"""
+        first_page, headers = await self.get_products_page(1, 100, modified_after)
+        if not first_page:
+            return []
+
+        total_pages = headers.get('X-WP-TotalPages', '')
+        all_products = list(first_page)
+        if total_pages.isdigit():
+            pages = await asyncio.gather(*(
+                self.get_products_page(page, 100, modified_after)
+                for page in range(2, int(total_pages) + 1)
+            ))
+            for products, _ in pages:
+                all_products.extend(products)
+        else:
+            # 没有分页响应头时逐页获取
+            products, page = first_page, 1
+            while len(products) >= 100:
+                page += 1
+                products, _ = await self.get_products_page(page, 100, modified_after)
+                all_products.extend(products)
+        return all_products
+
+    async def get_product_variations(self, product_id: int) -> List[Dict[str, Any]]:
+        """获取商品的全部变体（超过 100 个时按 X-WP-TotalPages 并发获取其余页面）"""
+        url = f"{self.base_url}/products/{product_id}/variations"
+        params = {'per_page': 100, '_fields': self.variation_fields}
+        with metrics_phase(self.metrics, 'fetch_variations'):
+            response = await self._request_with_retry(url, params={**params, 'page': 1}, endpoint='variations')
+            variations = codec.loads(response.content)
+            total_pages = response.headers.get('X-WP-TotalPages', '')
+            if total_pages.isdigit() and int(total_pages) > 1:
+                pages = await asyncio.gather(*(
+                    self._request_with_retry(url, params={**params, 'page': page}, endpoint='variations')
+                    for page in range(2, int(total_pages) + 1)
+                ))
+                for page_response in pages:
+                    variations.extend(codec.loads(page_response.content))
+        return variations
+
+
+class _FetchedVariations:
+    """异步获取的变体（或获取时的异常），以 VariationHarvester.get 的接口交给 main.process_woo_product"""
+
+    def __init__(self, variations: Optional[List[Dict[str, Any]]] = None, error: Optional[Exception] = None):
+        self.variations = variations
+        self.error = error
+
+    def get(self, product_id: int) -> Optional[List[Dict[str, Any]]]:
+        if self.error:
+            raise self.error
+        return self.variations
+
+
+async def _process_woo_product(
+    client: AsyncWooCommerceClient,
+    woo_product: Dict[str, Any],
+    site: str,
+    price_stock_only: bool,
+    variation_cache: Optional[VariationCache] = None,
+    update_data: Optional[Dict[str, Any]] = None,
+) -> Optional[Dict[str, Any]]:
+    """异步获取需要的变体，然后交给 main.process_woo_product 组装结果（返回结构、变体缓存语义和失败处理与线程引擎相同）"""
+    fetched = None
+    if woo_product.get('sku') and woo_product.get('type') == 'variable' and not isinstance(update_data, Exception) and not (variation_cache and variation_cache.is_cached(woo_product['sku'], woo_product.get('date_modified_gmt'))):
+        try:
+            fetched = _FetchedVariations(await client.get_product_variations(woo_product.get('id')))
+        except Exception as e:
+            fetched = _FetchedVariations(error=e)
+    return process_woo_product(client, woo_product, site, price_stock_only, variation_cache, fetched, update_data)
+
+
+async def _async_sync_site(
+    supabase,
+    site: str,
+    concurrency: int,
+    progress_id: str,
+    modified_after: Optional[str],
+    price_stock_only: bool,
+    refresh_variations: bool,
+    force_write: bool,
+) -> Dict[str, Any]:
+    logger.info(f"🚀 开始全量同步站点: {site} (asyncio 引擎, 在途请求: {concurrency})")
+    start_time = datetime.utcnow()
+
+    # 数据库调用是同步的，放到线程中执行，避免阻塞事件循环
+    db = asyncio.to_thread
+
+    client = AsyncWooCommerceClient(
+        site,
+        concurrency=concurrency,
+        product_fields=PRICE_STOCK_FIELDS if price_stock_only else None,
+        metrics=SyncMetrics(site),
+    )
+    try:
+        # ==================== 步骤1: 批量获取主商品 ====================
+        await db(update_progress, supabase, site, 0, 0, 0, 0, 'running', f'步骤1: 从 {site} 批量获取商品...', progress_id=progress_id)
+
+        try:
+            woo_products = await client.get_all_products(modified_after)
+        except Exception as e:
+            logger.error(f"❌ [{site}] 获取商品列表失败: {e}")
+            await db(update_progress, supabase, site, 0, 0, 0, 0, 'error', f'获取商品列表失败: {e}', progress_id=progress_id)
+            return {'site': site, 'total': 0, 'success': 0, 'failed': 0, 'skipped': 0, 'error': str(e), 'engine': 'async', 'metrics': client.metrics.to_dict()}
+
+        if not woo_products:
+            message = '没有商品变更' if modified_after else '没有找到商品'
+            await db(update_progress, supabase, site, 0, 0, 0, 0, 'completed', message, progress_id=progress_id)
+            return {'site': site, 'total': 0, 'success': 0, 'failed': 0, 'skipped': 0, 'watermark': modified_after, 'engine': 'async'}
+
+        total = len(woo_products)
+        watermark = max((p.get('date_modified_gmt') or '' for p in woo_products), default='') or modified_after
+        logger.info(f"📦 [{site}] 获取到 {total} 个商品")
+
+        if await db(check_if_cancelled, supabase, progress_id):
+            await db(update_progress, supabase, site, 0, total, 0, 0, 'cancelled', '用户取消', progress_id=progress_id)
+            return {'site': site, 'total': total, 'success': 0, 'failed': 0, 'skipped': 0, 'cancelled': True, 'engine': 'async'}
+
+        # ==================== 步骤2: 处理商品数据并获取变体 ====================
+        await db(update_progress, supabase, site, 0, total, 0, 0, 'running', f'步骤2: 处理 {total} 个商品，{concurrency}个并发请求获取变体...', progress_id=progress_id)
+
+        variation_cache = await db(load_variation_cache, supabase, site, price_stock_only, refresh_variations, client.metrics)
+        fingerprints = await db(load_content_fingerprints, supabase, site, force_write, client.metrics)
+        progress = {'completed': 0, 'success': 0, 'failed': 0, 'cancelled': False}
+        pending_updates = []
+        BATCH_SIZE = 300
+
+        # 进度写入和取消检查由后台心跳线程完成，数据库写入由写后缓冲的写入线程完成，都不占用事件循环
+        reporter = ProgressReporter(supabase, site, progress_id).start()
+        writer = BatchWriter(supabase, site, batch_size=BATCH_SIZE, fingerprints=fingerprints, metrics=client.metrics)
+        transformed = ProductTransformer(site, price_stock_only, client.metrics).transform_page(woo_products)
+        tasks = [
+            asyncio.ensure_future(_process_woo_product(client, p, site, price_stock_only, variation_cache, u))
+            for p, u in zip(woo_products, transformed)
+        ]
+        del woo_products, transformed
+
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    result = await next_done
+                    if result is None:
+                        continue
+
+                    progress['completed'] += 1
+                    if result.get('success'):
+                        progress['success'] += 1
+                        if result.get('data'):
+                            pending_updates.append(result['data'])
+                    else:
+                        progress['failed'] += 1
+
+                    if len(pending_updates) >= BATCH_SIZE:
+                        # 写入队列满时在线程中等待，形成背压而不阻塞事件循环
+                        batch_to_write, pending_updates = pending_updates, []
+                        await db(writer.put_batch, batch_to_write)
+
+                    if reporter.is_cancelled():
+                        progress['cancelled'] = True
+                        break
+                    reporter.report(progress['completed'], total, progress['success'], progress['failed'], f"进度: {progress['completed']}/{total}")
+                    if progress['completed'] % 50 == 0 or progress['completed'] == total:
+                        logger.info(f"[{site}] 进度: {progress['completed']}/{total} (成功: {progress['success']}, 失败: {progress['failed']})")
+
+                except Exception as e:
+                    logger.error(f"任务异常: {e}")
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        final_status = 'error'
+        try:
+            progress['cancelled'] = progress['cancelled'] or reporter.is_cancelled()
+            if pending_updates and not progress['cancelled']:
+                await db(writer.put_batch, pending_updates)
+            final_status = 'cancelled' if progress['cancelled'] else 'completed'
+        finally:
+            writes = await db(writer.close)
+            progress['success'] -= writer.dead_letter_count()
+            progress['failed'] += writer.dead_letter_count()
+            duration = (datetime.utcnow() - start_time).total_seconds()
+            message = '同步异常中断' if final_status == 'error' else f'同步完成 ({duration:.1f}s)'
+            await db(reporter.close, final_status, progress['completed'], total, progress['success'], progress['failed'], message)
+        logger.info(f"✅ [{site}] 同步完成: {progress['success']}/{total} 成功, {progress['failed']} 失败 ({duration:.1f}s)")
+
+        result = {
+            'site': site,
+            'total': total,
+            'success': progress['success'],
+            'failed': progress['failed'],
+            'duration': duration,
+            'cancelled': progress['cancelled'],
+            'watermark': watermark,
+            'writes': {k: v for k, v in writes.items() if k != 'dead_letter'},
+            'dead_letter': writes['dead_letter'],
+            'engine': 'async',
+        }
+        if variation_cache:
+            result['variation_cache'] = variation_cache.stats()
+        result['changes'] = fingerprints.stats()
+        result['metrics'] = client.metrics.to_dict()
+        return result
+    finally:
+        await client.aclose()
+
+
+def async_sync_site(
+    supabase,
+    site: str,
+    concurrency: int = ASYNC_DEFAULT_CONCURRENCY,
+    progress_id: str = 'current',
+    modified_after: Optional[str] = None,
+    price_stock_only: bool = False,
+    refresh_variations: bool = False,
+    force_write: bool = False,
+) -> Dict[str, Any]:
+    """使用 asyncio 引擎同步单个站点（同步调用入口，在新的事件循环中运行）"""
+    return asyncio.run(_async_sync_site(supabase, site, concurrency, progress_id, modified_after, price_stock_only, refresh_variations, force_write))
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+JSON 编解码微基准测试
+
+对比标准库 json 与 codec（有 orjson 时为 orjson）在 full-sync 和客户同步脚本实际处理的载荷上的解码/编码耗时：
+  woo_page         一页 100 个商品的 WooCommerce 列表响应（完整字段，含 HTML 描述）
+  woo_variations   一页 100 个变体的列表响应
+  product_upsert   一批 WRITE_BATCH_SIZE 行商品写入（build_product_update + 变体）
+  customer_upsert  1000 行客户写入（与 sync_woo_customers_v2 新建客户的字段相同）
+载荷从 WooCommerce 替身录制；也可以用 --payload 传入从线上保存的响应文件（例如 curl 保存的商品列表页），
+文件名作为载荷名。
+
+标准库一侧按调用方原来的用法计时：解码为 requests 的 response.json()（先把字节解码为文本再解析），
+编码为 requests 的 json= 参数（ensure_ascii 的 json.dumps 再编码为 UTF-8）
+
+用法:
+  python bench/bench_codec.py
+  python bench/bench_codec.py --payload /tmp/products-page-1.json --repeat 50
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+COLUMNS = ['payload', 'kb', 'op', 'json_ms', 'codec_ms', 'speedup', 'codec_mb_per_sec']
+
+
+def record_payloads() -> dict:
+    """从 WooCommerce 替身录制响应，并用 full-sync 的转换函数生成写入载荷"""
+    import main
+    import codec
+    from fake_woo import make_catalog, FakeWooServer
+
+    catalog, variations = make_catalog(main.WRITE_BATCH_SIZE, 100)
+    server = FakeWooServer(catalog, variations).start()
+    try:
+        base = f"{server.url}/wp-json/wc/v3"
+        session = requests.Session()
+        pages = [session.get(f"{base}/products", params={'per_page': 100, 'page': page}).content for page in (1, 2, 3)]
+        woo_variations = session.get(f"{base}/products/{catalog[0]['id']}/variations", params={'per_page': 100}).content
+    finally:
+        server.stop()
+
+    updates = []
+    for product in (p for page in pages for p in json.loads(page)):
+        update = main.build_product_update(product, 'com')
+        site_variations = main.build_site_variations(variations[product['id']][:8])
+        update['variations'] = {'com': site_variations}
+        update['variation_counts'] = {'com': len(site_variations)}
+        updates.append(update)
+
+    address = {
+        'first_name': 'Max', 'last_name': 'Müller', 'company': '', 'address_1': 'Hauptstraße 12',
+        'address_2': '', 'city': 'München', 'state': 'BY', 'postcode': '80331', 'country': 'DE',
+        'email': '', 'phone': '+49 89 1234567',
+    }
+    customers = [
+        {
+            'email': f"kunde{i}@example.de",
+            'first_name': 'Max',
+            'last_name': 'Müller',
+            'phone': address['phone'],
+            'woo_ids': {'de': 100000 + i},
+            'billing_address': {**address, 'email': f"kunde{i}@example.de"},
+            'shipping_address': address,
+            'assigned_site': 'de',
+            'assignment_method': 'address',
+            'assignment_confidence': 0.85,
+            'assignment_reason': 'Based on WooCommerce address: DE',
+            'order_stats': {
+                'total_orders': 0, 'total_spent': 0,
+                'valid_orders': 0, 'valid_spent': 0,
+                'invalid_orders': 0, 'invalid_spent': 0,
+                'first_order_date': None, 'last_order_date': None,
+                'by_site': {},
+            },
+        }
+        for i in range(1000)
+    ]
+    return {
+        'woo_page': pages[0],
+        'woo_variations': woo_variations,
+        'product_upsert': codec.dumps(updates),
+        'customer_upsert': codec.dumps(customers),
+    }
+
+
+def measure(func, repeat: int) -> float:
+    """重复执行 repeat 次，返回中位数耗时（毫秒）"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+def bench_payload(name: str, raw: bytes, repeat: int) -> list:
+    import codec
+
+    obj = json.loads(raw)
+    kb = len(raw) / 1024
+    ops = {
+        'decode': (lambda: json.loads(raw.decode('utf-8')), lambda: codec.loads(raw)),
+        'encode': (lambda: json.dumps(obj).encode('utf-8'), lambda: codec.dumps(obj)),
+    }
+    rows = []
+    for op, (stdlib_func, codec_func) in ops.items():
+        json_ms = measure(stdlib_func, repeat)
+        codec_ms = measure(codec_func, repeat)
+        rows.append({
+            'payload': name,
+            'kb': round(kb),
+            'op': op,
+            'json_ms': round(json_ms, 2),
+            'codec_ms': round(codec_ms, 2),
+            'speedup': f"{json_ms / codec_ms:.1f}x" if codec_ms else '-',
+            'codec_mb_per_sec': round(kb / 1024 / (codec_ms / 1000)) if codec_ms else '-',
+        })
+    return rows
+
+
+def print_table(rows: list):
+    widths = [max(len(c), *(len(str(r[c])) for r in rows)) for c in COLUMNS]
+    print('  '.join(c.ljust(w) for c, w in zip(COLUMNS, widths)))
+    for row in rows:
+        print('  '.join(str(row[c]).ljust(w) for c, w in zip(COLUMNS, widths)))
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description='JSON 编解码微基准测试')
+    parser.add_argument('--payload', action='append', help='线上保存的 JSON 响应文件（可重复），不指定时录制替身载荷')
+    parser.add_argument('--repeat', type=int, default=30, help='每项测量的重复次数（取中位数）')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出结果')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    import codec
+
+    if args.payload:
+        payloads = {}
+        for path in args.payload:
+            with open(path, 'rb') as f:
+                payloads[os.path.basename(path)] = f.read()
+    else:
+        payloads = record_payloads()
+
+    rows = [row for name, raw in payloads.items() for row in bench_payload(name, raw, args.repeat)]
+    if args.json:
+        print(json.dumps({'backend': codec.BACKEND, 'results': rows}, indent=2))
+    else:
+        print(f"codec 后端: {codec.BACKEND}")
+        print_table(rows)
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+full-sync 吞吐基准测试
+
+WooCommerce 替身（fake_woo.py）运行在独立进程中，每个用例在独立子进程中运行，
+保证峰值内存（ru_maxrss）和线程数互不影响。数据库目标三选一：
+  memory     进程内的 FakeSupabase（默认，只统计调用次数）
+  postgrest  独立进程的 PostgREST 替身（fake_postgrest.py），被测代码使用真实的 supabase-py 客户端
+  --supabase-url/--supabase-key  本地 Supabase（supabase start 并已应用迁移），每个用例都强制写入全部商品
+
+用例格式为 engine:workers[+选项...]，选项: stream / adaptive / resumable / price（价格库存同步）
+
+用法:
+  python bench/bench_engines.py --products 2000 --variations 8 --latency 0.05
+  python bench/bench_engines.py --case thread:10 --case thread:10+stream --case async:100 --case async:400
+  python bench/bench_engines.py --bulk-variations --case thread:10   # 替身支持批量列出变体
+  python bench/bench_engines.py --error-rate 0.05 --case thread:10 --case thread:10+adaptive
+  python bench/bench_engines.py --db postgrest --db-latency 0.005
+  python bench/bench_engines.py --supabase-url http://127.0.0.1:54321 --supabase-key <service_role key>
+"""
+
+import argparse
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+DEFAULT_CASES = ['thread:10', 'thread:50', 'thread:10+stream', 'async:100', 'async:400']
+CASE_OPTIONS = {
+    'stream': {'stream': True},
+    'adaptive': {'adaptive': True},
+    'resumable': {'resumable': True},
+    'price': {'price_stock_only': True},
+}
+COLUMNS = [
+    'case', 'products', 'failed', 'seconds', 'products_per_sec', 'requests_per_sec',
+    'woo_503', 'peak_threads', 'peak_rss_mb', 'db_round_trips',
+]
+
+
+def parse_case(case: str) -> tuple:
+    """engine:workers+opt+opt -> (engine, workers, full_sync_site 参数)"""
+    head, *flags = case.split('+')
+    engine, workers = head.split(':')
+    options = {'engine': engine}
+    for flag in flags:
+        if flag not in CASE_OPTIONS:
+            raise SystemExit(f"未知的用例选项: {flag}（可选: {', '.join(CASE_OPTIONS)}）")
+        options.update(CASE_OPTIONS[flag])
+    return engine, int(workers), options
+
+
+def connect_db(db: dict):
+    """返回 (supabase 客户端, 读取数据库往返次数的函数, 清理函数)"""
+    if db['target'] == 'memory':
+        from fake_supabase import FakeSupabase
+        supabase = FakeSupabase()
+        return supabase, lambda: supabase.round_trips, lambda: None
+
+    from supabase import create_client
+    process = None
+    if db['target'] == 'postgrest':
+        from fake_postgrest import spawn_fake_postgrest, BENCH_SERVICE_KEY
+        process, url = spawn_fake_postgrest(db['latency'])
+        key = BENCH_SERVICE_KEY
+    else:
+        url, key = db['url'], db['key']
+    supabase = create_client(url, key)
+
+    # 在 supabase-py 的 httpx 会话上计数，表查询和 rpc 都经过这个会话
+    round_trips = [0]
+    lock = threading.Lock()
+
+    def count(_request):
+        with lock:
+            round_trips[0] += 1
+
+    supabase.postgrest.session.event_hooks['request'].append(count)
+    return supabase, lambda: round_trips[0], (process.terminate if process else lambda: None)
+
+
+def run_case(case: str, woo_url: str, db: dict) -> dict:
+    """在当前进程中运行一次同步并返回测量结果"""
+    import requests
+    import main
+
+    logging.getLogger().setLevel(logging.WARNING)
+    engine, workers, options = parse_case(case)
+    if db['target'] == 'supabase':
+        # 外部数据库里可能已有数据：跳过变体缓存和内容指纹，每个用例做同样的完整工作量
+        options.update(refresh_variations=True, force_write=True)
+
+    main.SITES['com'].update(url=woo_url, key='ck_bench', secret='cs_bench')
+    supabase, db_round_trips, close_db = connect_db(db)
+    woo_before = requests.get(f"{woo_url}/__stats").json()
+
+    # 采样峰值线程数
+    peak_threads = [threading.active_count()]
+    sampling = threading.Event()
+
+    def sample_threads():
+        while not sampling.wait(0.05):
+            peak_threads[0] = max(peak_threads[0], threading.active_count())
+
+    sampler = threading.Thread(target=sample_threads, daemon=True)
+    sampler.start()
+
+    try:
+        start = time.perf_counter()
+        result = main.full_sync_site(supabase, 'com', workers, **options)
+        elapsed = time.perf_counter() - start
+    finally:
+        sampling.set()
+        sampler.join()
+        close_db()
+    woo_after = requests.get(f"{woo_url}/__stats").json()
+    woo_requests = woo_after['requests'] - woo_before['requests'] - 1
+
+    return {
+        'case': case,
+        'products': result['success'],
+        'failed': result['failed'],
+        'seconds': round(elapsed, 2),
+        'products_per_sec': round(result['success'] / elapsed, 1) if elapsed else 0,
+        'requests_per_sec': round(woo_requests / elapsed, 1) if elapsed else 0,
+        'woo_503': woo_after['errors'] - woo_before['errors'],
+        'peak_threads': peak_threads[0],
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'db_round_trips': db_round_trips(),
+    }
+
+
+def print_table(rows: list):
+    widths = [max(len(c), *(len(str(r[c])) for r in rows)) for c in COLUMNS]
+    print('  '.join(c.ljust(w) for c, w in zip(COLUMNS, widths)))
+    for row in rows:
+        print('  '.join(str(row[c]).ljust(w) for c, w in zip(COLUMNS, widths)))
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description='full-sync 吞吐基准测试')
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--variations', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.05, help='每个请求的模拟服务端延迟（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='替身随机返回 503 的请求比例（0-1）')
+    parser.add_argument('--page-size', type=int, default=100, help='替身允许的 per_page 上限')
+    parser.add_argument('--bulk-variations', action='store_true', help='替身支持 /products?type=variation 批量列出变体')
+    parser.add_argument('--db', choices=['memory', 'postgrest'], default='memory', help='数据库目标（见模块说明）')
+    parser.add_argument('--db-latency', type=float, default=0.0, help='PostgREST 替身每个请求的模拟延迟（秒）')
+    parser.add_argument('--supabase-url', help='本地 Supabase 地址（优先于 --db）')
+    parser.add_argument('--supabase-key', help='本地 Supabase service_role key')
+    parser.add_argument('--case', action='append', help='engine:workers[+选项]，例如 async:200 或 thread:10+adaptive（可重复）')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出结果')
+    parser.add_argument('--run-one', help=argparse.SUPPRESS)
+    parser.add_argument('--woo-url', help=argparse.SUPPRESS)
+    parser.add_argument('--db-spec', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        print(json.dumps(run_case(args.run_one, args.woo_url, json.loads(args.db_spec))))
+        return
+
+    if args.supabase_url:
+        db = {'target': 'supabase', 'url': args.supabase_url, 'key': args.supabase_key}
+    else:
+        db = {'target': args.db, 'latency': args.db_latency}
+    cases = args.case or DEFAULT_CASES
+    for case in cases:
+        parse_case(case)
+
+    from fake_woo import spawn_fake_woo
+    woo_process, woo_url = spawn_fake_woo(
+        args.products, args.variations, args.latency,
+        bulk_variations=args.bulk_variations, error_rate=args.error_rate, page_size=args.page_size,
+    )
+    rows = []
+    try:
+        for case in cases:
+            output = subprocess.run(
+                [sys.executable, __file__, '--run-one', case, '--woo-url', woo_url, '--db-spec', json.dumps(db)],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            rows.append(json.loads(output.strip().splitlines()[-1]))
+    finally:
+        woo_process.terminate()
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    extras = [f"请求延迟 {args.latency * 1000:.0f}ms"]
+    if args.error_rate:
+        extras.append(f"503 比例 {args.error_rate:.0%}")
+    if args.page_size != 100:
+        extras.append(f"每页上限 {args.page_size}")
+    if args.bulk_variations:
+        extras.append('支持批量列出变体')
+    extras.append(f"数据库 {db['target']}")
+    print(f"目录: {args.products} 个商品 × {args.variations} 个变体, {', '.join(extras)}")
+    print_table(rows)
+
+
+if __name__ == '__main__':
+    main_cli()
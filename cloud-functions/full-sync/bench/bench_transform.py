@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+商品转换微基准测试
+
+在 fake_woo.make_catalog 生成的商品目录（默认 10000 个商品）上测量 WooCommerce 商品 → products 写入数据的
+单商品转换耗时，不涉及网络和数据库：
+  legacy     重构前的写法（逐个商品取时间戳，属性名逐个 lower/replace 后走 if/elif 判断），作为基线
+  per_product  build_product_update 逐个商品转换（async 引擎之外的单商品调用方）
+  page       ProductTransformer.transform_page 整页一次遍历（各同步路径实际使用的方式）
+每个站点/模式先校验三种写法的输出一致（忽略 last_synced_at），再计时。
+
+用法:
+  python bench/bench_transform.py
+  python bench/bench_transform.py --products 10000 --repeat 5 --site com --site uk --json
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+COLUMNS = ['site', 'mode', 'case', 'products', 'total_ms', 'us_per_product', 'speedup']
+
+
+def legacy_build_product_update(woo_product, site, price_stock_only=False):
+    """重构前 build_product_update / fetch_product_from_woo 的转换逻辑（原样保留，仅作基线和校验）"""
+    import main
+
+    update_data = {
+        'sku': woo_product.get('sku', ''),
+        'prices': {site: float(woo_product.get('sale_price') or woo_product.get('price') or 0)},
+        'regular_prices': {site: float(woo_product.get('regular_price') or woo_product.get('price') or 0)},
+        'stock_quantities': {site: woo_product.get('stock_quantity') or 100},
+        'stock_statuses': {site: woo_product.get('stock_status', 'instock')},
+        'statuses': {site: woo_product.get('status', 'publish')},
+        'content': {
+            site: {
+                'name': woo_product.get('name', ''),
+                'description': woo_product.get('description', ''),
+                'short_description': woo_product.get('short_description', ''),
+            }
+        },
+        'sync_status': {site: 'synced'},
+        'last_synced_at': datetime.utcnow().isoformat(),
+        'woo_ids': {site: woo_product.get('id')},
+    }
+    if price_stock_only:
+        return {key: update_data[key] for key in main.PRICE_STOCK_KEYS}
+    if site == 'com':
+        update_data['name'] = woo_product.get('name', '')
+        update_data['images'] = [img['src'] for img in woo_product.get('images', [])]
+        update_data['categories'] = [c['name'] for c in woo_product.get('categories', [])]
+        attributes = {}
+        for attr in woo_product.get('attributes', []):
+            attr_name = (attr.get('name', '') or '').lower().replace(' ', '')
+            value = (attr.get('options') or [''])[0] if attr.get('options') else ''
+            if attr_name in ('genderage', 'gender'):
+                attributes['gender'] = value
+            elif attr_name == 'season':
+                attributes['season'] = value
+            elif attr_name in ('jerseytype', 'type'):
+                attributes['type'] = value
+            elif attr_name in ('style', 'version'):
+                attributes['version'] = value
+            elif attr_name in ('sleevelength', 'sleeve'):
+                attributes['sleeve'] = value
+            elif attr_name == 'team':
+                attributes['team'] = value
+            elif attr_name in ('event', 'events'):
+                attributes['events'] = attr.get('options', [])
+        if attributes:
+            update_data['attributes'] = attributes
+    return update_data
+
+
+def measure(func, repeat: int) -> float:
+    """
+    重复执行 repeat 次，返回中位数耗时（毫秒）
+    与 timeit 相同，计时期间关闭垃圾回收，避免上一轮保留的输出触发的回收停顿淹没转换本身的耗时
+    """
+    samples = []
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            started = time.perf_counter()
+            func()
+            samples.append(time.perf_counter() - started)
+        finally:
+            gc.enable()
+    return statistics.median(samples) * 1000
+
+
+def without_timestamp(update):
+    return {key: value for key, value in update.items() if key != 'last_synced_at'}
+
+
+def bench_site(catalog: list, site: str, price_stock_only: bool, repeat: int) -> list:
+    import main
+
+    transformer = main.ProductTransformer(site, price_stock_only)
+    cases = {
+        'legacy': lambda: [legacy_build_product_update(p, site, price_stock_only) for p in catalog],
+        'per_product': lambda: [main.build_product_update(p, site, price_stock_only) for p in catalog],
+        'page': lambda: transformer.transform_page(catalog),
+    }
+
+    expected = [without_timestamp(u) for u in cases['legacy']()]
+    for name in ('per_product', 'page'):
+        if [without_timestamp(u) for u in cases[name]()] != expected:
+            raise SystemExit(f"❌ {site}/{name} 的输出与重构前不一致")
+
+    rows = []
+    baseline_ms = None
+    for name, func in cases.items():
+        total_ms = measure(func, repeat)
+        baseline_ms = baseline_ms or total_ms
+        rows.append({
+            'site': site,
+            'mode': 'price' if price_stock_only else 'full',
+            'case': name,
+            'products': len(catalog),
+            'total_ms': round(total_ms, 1),
+            'us_per_product': round(total_ms * 1000 / len(catalog), 2),
+            'speedup': f"{baseline_ms / total_ms:.2f}x",
+        })
+    return rows
+
+
+def print_table(rows: list):
+    widths = [max(len(c), *(len(str(r[c])) for r in rows)) for c in COLUMNS]
+    print('  '.join(c.ljust(w) for c, w in zip(COLUMNS, widths)))
+    for row in rows:
+        print('  '.join(str(row[c]).ljust(w) for c, w in zip(COLUMNS, widths)))
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description='商品转换微基准测试')
+    parser.add_argument('--products', type=int, default=10000, help='商品目录大小')
+    parser.add_argument('--repeat', type=int, default=10, help='每项测量的重复次数（取中位数）')
+    parser.add_argument('--site', action='append', help='站点（可重复），默认 com 和 uk')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出结果')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    from fake_woo import make_catalog
+
+    catalog, _ = make_catalog(args.products, 0)
+    rows = []
+    for site in args.site or ['com', 'uk']:
+        for price_stock_only in (False, True):
+            rows.extend(bench_site(catalog, site, price_stock_only, args.repeat))
+
+    if args.json:
+        print(json.dumps({'results': rows}, indent=2))
+    else:
+        print_table(rows)
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,199 @@
+"""
+本地 PostgREST 替身（仅用于基准测试）
+
+以 fake_supabase.FakeSupabase 为存储，在本地端口上提供 supabase-py 实际发出的 PostgREST 请求：
+  GET   /rest/v1/{table}?select=..&col=eq.x&col=lt.x&col=in.(..)&offset=&limit=   查询（按 select 裁剪列）
+  POST  /rest/v1/{table}?on_conflict=col&columns=..                    upsert（Prefer: resolution=merge-duplicates）；
+                                                                       没有 columns 时与 PostgREST 一样拒绝键不一致的批量请求体（PGRST102）
+  PATCH /rest/v1/{table}?col=eq.x                                      更新（返回更新后的行）
+  POST  /rest/v1/rpc/merge_product_patches                             批量合并商品补丁
+  GET   /__stats                                                       请求数/收发字节数统计
+被测代码使用真实的 supabase-py 客户端（create_client），请求序列化、HTTP 往返和响应解析都计入测量。
+每个请求按 latency 模拟数据库往返耗时。
+
+独立进程运行（基准测试时避免与被测进程争用 GIL）:
+  python bench/fake_postgrest.py --latency 0.005
+启动后第一行输出服务地址。
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, List, Any, Tuple
+from urllib.parse import urlparse, parse_qsl
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_supabase import FakeSupabase
+
+REST_PREFIX = '/rest/v1/'
+# supabase-py 需要 JWT 格式的 key，替身不校验
+BENCH_SERVICE_KEY = 'eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.bench'
+RESERVED_PARAMS = ('select', 'offset', 'limit', 'order', 'on_conflict', 'columns')
+
+
+def _parse_in_list(value: str) -> List[str]:
+    """解析 in.(a,"b,c","d\\"e") 中括号内的值列表（双引号包裹的值内用反斜杠转义）"""
+    items, current, quoted, escaped = [], '', False, False
+    for char in value:
+        if escaped:
+            current, escaped = current + char, False
+        elif char == '\\' and quoted:
+            escaped = True
+        elif char == '"':
+            quoted = not quoted
+        elif char == ',' and not quoted:
+            items.append(current)
+            current = ''
+        else:
+            current += char
+    if value:
+        items.append(current)
+    return items
+
+
+def _project(row: Dict[str, Any], select: str) -> Dict[str, Any]:
+    columns = [c.strip() for c in select.split(',') if c.strip()]
+    if not columns or '*' in columns:
+        return row
+    return {c: row.get(c) for c in columns}
+
+
+class _Server(ThreadingHTTPServer):
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class FakePostgrestServer:
+    """在后台线程运行的 PostgREST 替身服务器"""
+
+    def __init__(self, store: FakeSupabase = None, latency: float = 0.0):
+        self.store = store or FakeSupabase()
+        self.latency = latency
+        self.stats = {'requests': 0, 'bytes_received': 0, 'bytes_sent': 0}
+        self._stats_lock = threading.Lock()
+        self._server = _Server(('127.0.0.1', 0), self._make_handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def start(self) -> 'FakePostgrestServer':
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _query(self, table: str, params: List[Tuple[str, str]]):
+        """把 URL 中的过滤条件应用到 FakeSupabase 查询上"""
+        query = self.store.table(table)
+        for column, condition in params:
+            if column in RESERVED_PARAMS:
+                continue
+            op, _, value = condition.partition('.')
+            if op == 'eq':
+                query.eq(column, value)
+            elif op == 'lt':
+                query.lt(column, value)
+            elif op == 'in':
+                query.in_(column, _parse_in_list(value.strip('()')))
+            else:
+                raise ValueError(f"不支持的过滤条件: {column}={condition}")
+        return query
+
+    def _route(self, method: str, path: str, params: List[Tuple[str, str]], body: Any) -> Tuple[int, Any]:
+        if path == '/__stats':
+            return 200, dict(self.stats, db_round_trips=self.store.round_trips)
+        if not path.startswith(REST_PREFIX):
+            return 404, {'message': 'not found'}
+        name = path[len(REST_PREFIX):]
+        args = dict(params)
+
+        if name.startswith('rpc/'):
+            return 200, self.store.rpc(name[len('rpc/'):], body).execute().data
+
+        if method == 'GET':
+            query = self._query(name, params).select()
+            if 'offset' in args or 'limit' in args:
+                offset = int(args.get('offset', 0))
+                query.range(offset, offset + int(args.get('limit', 10 ** 9)) - 1)
+            rows = query.execute().data
+            return 200, [_project(row, args.get('select', '*')) for row in rows]
+        if method == 'POST':
+            rows = body if isinstance(body, list) else [body]
+            if 'columns' in args:
+                # 与 PostgREST 相同：只写入 columns 中的列，缺少的键按 NULL 处理
+                columns = [c.strip().strip('"') for c in args['columns'].split(',')]
+                rows = [{c: row.get(c) for c in columns} for row in rows]
+            elif any(row.keys() != rows[0].keys() for row in rows):
+                return 400, {'code': 'PGRST102', 'message': 'All object keys must match', 'details': None, 'hint': None}
+            rows = self.store.table(name).upsert(rows, on_conflict=args.get('on_conflict', 'id')).execute().data
+            return 201, rows
+        if method == 'PATCH':
+            # supabase-py 默认 Prefer: return=representation，返回更新后的行（条件更新据此判断是否成功）
+            return 200, self._query(name, params).update(body).execute().data
+        return 405, {'message': f'不支持的请求方法: {method}'}
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _handle(self):
+                if server.latency:
+                    time.sleep(server.latency)
+                length = int(self.headers.get('Content-Length') or 0)
+                raw = self.rfile.read(length) if length else b''
+                parsed = urlparse(self.path)
+                try:
+                    status, payload = server._route(self.command, parsed.path, parse_qsl(parsed.query), json.loads(raw) if raw else None)
+                except Exception as e:
+                    status, payload = 400, {'message': str(e)}
+                out = json.dumps(payload).encode()
+                with server._stats_lock:
+                    server.stats['requests'] += 1
+                    server.stats['bytes_received'] += len(raw)
+                    server.stats['bytes_sent'] += len(out)
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(out)))
+                self.end_headers()
+                self.wfile.write(out)
+
+            do_GET = do_POST = do_PATCH = _handle
+
+        return Handler
+
+
+def spawn_fake_postgrest(latency: float = 0.0) -> Tuple[subprocess.Popen, str]:
+    """在独立进程中启动替身服务器，返回 (进程, 服务地址)"""
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--latency', str(latency)],
+        stdout=subprocess.PIPE, text=True,
+    )
+    return process, process.stdout.readline().strip()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='本地 PostgREST 替身')
+    parser.add_argument('--latency', type=float, default=0.0, help='每个请求的模拟数据库往返延迟（秒）')
+    args = parser.parse_args()
+
+    server = FakePostgrestServer(latency=args.latency).start()
+    print(server.url, flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
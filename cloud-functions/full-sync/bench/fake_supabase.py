@@ -0,0 +1,147 @@
+"""
+内存版 Supabase 客户端替身（仅用于基准测试）
+
+只实现 full-sync 用到的链式调用：table().select().in_()/eq()（含 col->>key）/lt()/order()/limit()/range().execute()、
+table().insert()/update()（返回更新后的行）、
+table().upsert(..., on_conflict=).execute() 和 rpc('merge_product_patches', ...)，
+并统计数据库往返次数。
+"""
+
+import copy
+import threading
+from types import SimpleNamespace
+from typing import Dict, List, Any, Optional
+
+
+class _Query:
+    def __init__(self, db: 'FakeSupabase', table: str):
+        self.db = db
+        self.table = table
+        self.filters = []
+        self.op = 'select'
+        self.rows: List[Dict[str, Any]] = []
+        self.on_conflict = 'id'
+        self.row_range: Optional[tuple] = None
+        self.order_by: Optional[tuple] = None
+        self.row_limit: Optional[int] = None
+        self.single_row = False
+
+    def select(self, columns: str = '*', **kwargs):
+        self.op = 'select'
+        return self
+
+    def eq(self, column: str, value: Any):
+        # 与 PostgREST 一样支持 JSON 路径过滤（col->>key 取出的值为文本）
+        if '->>' in column:
+            column, _, key = column.partition('->>')
+            self.filters.append(lambda row: (lambda v: None if v is None else str(v))((row.get(column) or {}).get(key)) == value)
+        else:
+            self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def in_(self, column: str, values: List[Any]):
+        values = set(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def lt(self, column: str, value: Any):
+        self.filters.append(lambda row: row.get(column) is not None and row.get(column) < value)
+        return self
+
+    def order(self, column: str, desc: bool = False):
+        self.order_by = (column, desc)
+        return self
+
+    def limit(self, count: int):
+        self.row_limit = count
+        return self
+
+    def range(self, start: int, end: int):
+        self.row_range = (start, end)
+        return self
+
+    def single(self):
+        self.single_row = True
+        return self
+
+    def upsert(self, rows, on_conflict: str = 'id', **kwargs):
+        self.op = 'upsert'
+        self.rows = rows if isinstance(rows, list) else [rows]
+        self.on_conflict = on_conflict
+        return self
+
+    def insert(self, rows, **kwargs):
+        self.op = 'insert'
+        self.rows = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def update(self, values: Dict[str, Any]):
+        self.op = 'update'
+        self.rows = [values]
+        return self
+
+    def execute(self):
+        with self.db.lock:
+            self.db.round_trips += 1
+            table = self.db.tables.setdefault(self.table, {})
+            if self.op == 'select':
+                rows = [copy.deepcopy(row) for row in table.values() if all(f(row) for f in self.filters)]
+                if self.order_by:
+                    rows.sort(key=lambda row: (row.get(self.order_by[0]) is None, row.get(self.order_by[0])), reverse=self.order_by[1])
+                if self.row_limit is not None:
+                    rows = rows[:self.row_limit]
+                if self.row_range:
+                    rows = rows[self.row_range[0]:self.row_range[1] + 1]
+                if self.single_row:
+                    return SimpleNamespace(data=rows[0] if rows else None)
+                return SimpleNamespace(data=rows)
+            if self.op == 'upsert':
+                for row in self.rows:
+                    table.setdefault(row[self.on_conflict], {}).update(copy.deepcopy(row))
+                return SimpleNamespace(data=self.rows)
+            if self.op == 'insert':
+                for row in self.rows:
+                    key = row.get('id', row.get('sku'))
+                    if key in table:
+                        raise ValueError(f"duplicate key: {key}")
+                    table[key] = copy.deepcopy(row)
+                return SimpleNamespace(data=self.rows)
+            if self.op == 'update':
+                # 与 PostgREST 的 Prefer: return=representation 相同，返回更新后的行
+                updated = []
+                for row in table.values():
+                    if all(f(row) for f in self.filters):
+                        row.update(copy.deepcopy(self.rows[0]))
+                        updated.append(copy.deepcopy(row))
+                return SimpleNamespace(data=updated)
+
+
+class FakeSupabase:
+    """线程安全的内存数据库"""
+
+    def __init__(self):
+        self.tables: Dict[str, Dict[Any, Dict[str, Any]]] = {}
+        self.lock = threading.Lock()
+        self.round_trips = 0
+
+    def table(self, name: str) -> _Query:
+        return _Query(self, name)
+
+    def rpc(self, name: str, params: Dict[str, Any]):
+        if name != 'merge_product_patches':
+            raise ValueError(f"Unknown rpc: {name}")
+        return SimpleNamespace(execute=lambda: SimpleNamespace(data=self._merge_product_patches(params['patches'])))
+
+    def _merge_product_patches(self, patches: List[Dict[str, Any]]) -> int:
+        """与 merge_product_patches SQL 函数相同的合并语义：各站点字段浅合并，共享字段存在才覆盖"""
+        with self.lock:
+            self.round_trips += 1
+            products = self.tables.setdefault('products', {})
+            for patch in patches:
+                row = products.setdefault(patch['sku'], {'sku': patch['sku']})
+                for key, value in copy.deepcopy(patch).items():
+                    if isinstance(value, dict):
+                        row[key] = {**(row.get(key) or {}), **value}
+                    elif value is not None:
+                        row[key] = value
+            return len(patches)
@@ -0,0 +1,313 @@
+"""
+本地 WooCommerce REST API 替身（仅用于基准测试）
+
+生成指定规模的商品目录，在本地端口上提供 full-sync 用到的接口：
+  GET /wp-json/wc/v3/products                       分页列表（X-WP-Total / X-WP-TotalPages）
+  GET /wp-json/wc/v3/products/{id}                  单个商品
+  GET /wp-json/wc/v3/products/{id}/variations       商品变体
+  GET /wp-json/wc/v3/products?type=variation&parent= 批量列出变体（需 --bulk-variations，否则与标准 WooCommerce 一样返回 400）
+  POST /wp-json/wc/v3/products/batch                批量更新商品（最多 100 项，未知 ID 的项逐项返回 error）
+  POST /wp-json/wc/v3/products/{id}/variations/batch 批量更新商品变体
+  GET /__stats                                      请求数/连接数/发送字节数/注入的 503 次数/批量更新项数统计
+请求带 Accept-Encoding: gzip 时响应体 gzip 压缩（发送字节数为压缩后的大小）。
+每个请求按 latency 模拟服务端耗时；error_rate 为随机返回 503（带 Retry-After: 1）的比例，
+page_size 为服务端允许的 per_page 上限（站点限制每页数量时分页变多）。
+
+独立进程运行（基准测试时避免与被测进程争用 GIL）:
+  python bench/fake_woo.py --products 2000 --variations 8 --latency 0.05
+启动后第一行输出服务地址。
+"""
+
+import argparse
+import gzip
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, List, Any, Tuple
+from urllib.parse import urlparse, parse_qs
+
+API_PREFIX = '/wp-json/wc/v3'
+BATCH_LIMIT = 100
+SIZES = ['S', 'M', 'L', 'XL', '2XL', '3XL', '4XL', 'XS']
+
+
+def make_catalog(products: int = 1000, variations: int = 8, start_id: int = 1000) -> Tuple[List[Dict[str, Any]], Dict[int, List[Dict[str, Any]]]]:
+    """生成商品目录：返回 (商品列表, {商品ID: 变体列表})"""
+    catalog = []
+    catalog_variations = {}
+    for i in range(products):
+        product_id = start_id + i
+        sku = f"BENCH-{i:06d}"
+        catalog.append({
+            'id': product_id,
+            'sku': sku,
+            'type': 'variable' if variations else 'simple',
+            'status': 'publish',
+            'name': f"Bench Team {i % 200} Home Jersey 24/25",
+            'description': '<p>' + 'Premium breathable fabric. ' * 40 + '</p>',
+            'short_description': '<p>Official fan version.</p>',
+            'price': '29.99',
+            'regular_price': '39.99',
+            'sale_price': '29.99',
+            'stock_quantity': None,
+            'manage_stock': False,
+            'stock_status': 'instock',
+            'date_modified_gmt': f"2024-01-{1 + i % 28:02d}T{i % 24:02d}:00:00",
+            'images': [{'id': product_id * 10 + n, 'src': f"https://example.com/{sku}-{n}.jpg"} for n in range(4)],
+            'categories': [{'id': 1, 'name': 'Club Jerseys'}, {'id': 2, 'name': f"League {i % 5}"}],
+            'attributes': [
+                {'name': 'Gender Age', 'options': ['Men']},
+                {'name': 'Season', 'options': ['2024/25']},
+                {'name': 'Jersey Type', 'options': ['Home']},
+                {'name': 'Style', 'options': ['Fan']},
+                {'name': 'Sleeve Length', 'options': ['Short Sleeve']},
+                {'name': 'Team', 'options': [f"Team {i % 200}"]},
+                {'name': 'Events', 'options': ['Premier League']},
+            ],
+        })
+        catalog_variations[product_id] = [
+            {
+                'id': product_id * 1000 + n,
+                'parent_id': product_id,
+                'sku': f"{sku}-{n}",
+                'attributes': [{'name': 'Size', 'option': SIZES[n % len(SIZES)]}],
+                'price': '29.99',
+                'regular_price': '39.99',
+                'sale_price': '29.99',
+                'stock_quantity': 20,
+                'stock_status': 'instock',
+            }
+            for n in range(variations)
+        ]
+    return catalog, catalog_variations
+
+
+class _Server(ThreadingHTTPServer):
+    # 默认监听队列只有 5，高并发建连时会被丢弃并等待 SYN 重传
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class FakeWooServer:
+    """在后台线程运行的 WooCommerce 替身服务器"""
+
+    def __init__(
+        self,
+        catalog: List[Dict[str, Any]],
+        variations: Dict[int, List[Dict[str, Any]]],
+        latency: float = 0.0,
+        bulk_variations: bool = False,
+        error_rate: float = 0.0,
+        page_size: int = 100,
+        seed: int = 0,
+    ):
+        self.catalog = catalog
+        self.variations = variations
+        self.by_id = {p['id']: p for p in catalog}
+        self.latency = latency
+        self.bulk_variations = bulk_variations
+        self.error_rate = error_rate
+        self.page_size = page_size
+        self.random = random.Random(seed)
+        self.stats = {'requests': 0, 'connections': 0, 'gzip_responses': 0, 'bytes_sent': 0, 'errors': 0, 'items_updated': 0}
+        self._stats_lock = threading.Lock()
+        self._server = _Server(('127.0.0.1', 0), self._make_handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def start(self) -> 'FakeWooServer':
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _route(self, path: str, query: Dict[str, str], body: Any = None) -> Tuple[int, Any, Dict[str, str]]:
+        """返回 (状态码, 响应体, 额外响应头)；body 不为空时为 POST 请求"""
+        if path == '/__stats':
+            return 200, dict(self.stats), {}
+        if not path.startswith(API_PREFIX):
+            return 404, {'code': 'rest_no_route'}, {}
+        path = path[len(API_PREFIX):]
+
+        if body is not None:
+            if path == '/products/batch':
+                return self._batch_update(self.by_id, body)
+            match = re.fullmatch(r'/products/(\d+)/variations/batch', path)
+            if match and int(match.group(1)) in self.by_id:
+                return self._batch_update({v['id']: v for v in self.variations.get(int(match.group(1)), [])}, body)
+            return 404, {'code': 'rest_no_route'}, {}
+
+        match = re.fullmatch(r'/products/(\d+)/variations', path)
+        if match:
+            return self._paginate(self.variations.get(int(match.group(1)), []), query)
+
+        match = re.fullmatch(r'/products/(\d+)', path)
+        if match:
+            product = self.by_id.get(int(match.group(1)))
+            if not product:
+                return 404, {'code': 'woocommerce_rest_product_invalid_id'}, {}
+            return 200, _project(product, query), {}
+
+        if path == '/products' and query.get('type') == 'variation':
+            if not self.bulk_variations:
+                return 400, {'code': 'rest_invalid_param', 'message': '无效参数：type'}, {}
+            parents = [int(x) for x in query.get('parent', '').split(',') if x]
+            return self._paginate([v for pid in parents for v in self.variations.get(pid, [])], query)
+        
+        if path == '/products':
+            items = self.catalog
+            if query.get('modified_after'):
+                items = [p for p in items if (p.get('date_modified_gmt') or '') > query['modified_after']]
+            if query.get('include'):
+                ids = {int(x) for x in query['include'].split(',') if x}
+                items = [p for p in items if p['id'] in ids]
+            return self._paginate(items, query)
+
+        return 404, {'code': 'rest_no_route'}, {}
+
+    def _batch_update(self, items: Dict[int, Dict[str, Any]], body: Dict[str, Any]) -> Tuple[int, Any, Dict[str, str]]:
+        """与 WooCommerce 批量接口相同：超过 BATCH_LIMIT 项整体拒绝，未知 ID 的项逐项返回 error，成功的项回显更新后的对象"""
+        updates = body.get('update') or []
+        if len(updates) > BATCH_LIMIT:
+            return 413, {'code': 'rest_request_entity_too_large', 'message': f'Unable to accept more than {BATCH_LIMIT} items for this request.'}, {}
+        results = []
+        with self._stats_lock:
+            for update in updates:
+                item = items.get(update.get('id'))
+                if item is None:
+                    results.append({'id': update.get('id'), 'error': {'code': 'woocommerce_rest_invalid_id', 'message': 'Invalid ID.', 'data': {'status': 400}}})
+                    continue
+                # 与 WooCommerce 一样：未开启库存管理的商品忽略 stock_quantity
+                ignored = ('id',) if item.get('manage_stock', True) or update.get('manage_stock') else ('id', 'stock_quantity')
+                item.update({k: v for k, v in update.items() if k not in ignored})
+                self.stats['items_updated'] += 1
+                results.append(item)
+        return 200, {'update': results}, {}
+
+    def _paginate(self, items: List[Dict[str, Any]], query: Dict[str, str]) -> Tuple[int, Any, Dict[str, str]]:
+        per_page = min(int(query.get('per_page', 10)), self.page_size)
+        page = int(query.get('page', 1))
+        total_pages = (len(items) + per_page - 1) // per_page
+        chunk = items[(page - 1) * per_page:page * per_page]
+        headers = {'X-WP-Total': str(len(items)), 'X-WP-TotalPages': str(total_pages)}
+        return 200, [_project(item, query) for item in chunk], headers
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # 响应头和响应体分两次写出，关闭 Nagle 避免长连接上的延迟确认等待
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                with server._stats_lock:
+                    server.stats['connections'] += 1
+
+            def _handle(self):
+                if server.latency:
+                    time.sleep(server.latency)
+                length = int(self.headers.get('Content-Length') or 0)
+                raw = self.rfile.read(length) if length else b''
+                parsed = urlparse(self.path)
+                query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+                overloaded = False
+                if server.error_rate and parsed.path.startswith(API_PREFIX):
+                    with server._stats_lock:
+                        overloaded = server.random.random() < server.error_rate
+                        if overloaded:
+                            server.stats['errors'] += 1
+                if overloaded:
+                    status, payload, headers = 503, {'code': 'service_unavailable'}, {'Retry-After': '1'}
+                else:
+                    status, payload, headers = server._route(parsed.path, query, json.loads(raw) if self.command == 'POST' else None)
+                body = json.dumps(payload).encode()
+                compressed = 'gzip' in (self.headers.get('Accept-Encoding') or '')
+                if compressed:
+                    body = gzip.compress(body, compresslevel=1)
+                with server._stats_lock:
+                    server.stats['requests'] += 1
+                    server.stats['gzip_responses'] += compressed
+                    server.stats['bytes_sent'] += len(body)
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                if compressed:
+                    self.send_header('Content-Encoding', 'gzip')
+                self.send_header('Content-Length', str(len(body)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = do_POST = _handle
+
+        return Handler
+
+
+def spawn_fake_woo(
+    products: int,
+    variations: int,
+    latency: float,
+    bulk_variations: bool = False,
+    error_rate: float = 0.0,
+    page_size: int = 100,
+) -> Tuple[subprocess.Popen, str]:
+    """在独立进程中启动替身服务器，返回 (进程, 服务地址)"""
+    command = [sys.executable, os.path.abspath(__file__),
+               '--products', str(products), '--variations', str(variations), '--latency', str(latency),
+               '--error-rate', str(error_rate), '--page-size', str(page_size)]
+    if bulk_variations:
+        command.append('--bulk-variations')
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    return process, process.stdout.readline().strip()
+
+
+def _project(item: Dict[str, Any], query: Dict[str, str]) -> Dict[str, Any]:
+    """按 _fields 参数裁剪字段"""
+    fields = query.get('_fields')
+    if not fields:
+        return item
+    wanted = set(fields.split(','))
+    return {k: v for k, v in item.items() if k in wanted}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='本地 WooCommerce REST API 替身')
+    parser.add_argument('--products', type=int, default=1000)
+    parser.add_argument('--variations', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.0, help='每个请求的模拟服务端延迟（秒）')
+    parser.add_argument('--bulk-variations', action='store_true', help='支持 /products?type=variation 批量列出变体')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='随机返回 503 的请求比例（0-1）')
+    parser.add_argument('--page-size', type=int, default=100, help='服务端允许的 per_page 上限')
+    parser.add_argument('--seed', type=int, default=0, help='503 注入的随机种子')
+    args = parser.parse_args()
+
+    catalog, catalog_variations = make_catalog(args.products, args.variations)
+    server = FakeWooServer(
+        catalog, catalog_variations,
+        latency=args.latency,
+        bulk_variations=args.bulk_variations,
+        error_rate=args.error_rate,
+        page_size=args.page_size,
+        seed=args.seed,
+    ).start()
+    print(server.url, flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+分片同步本地测试工具（不依赖 GCP）
+
+启动 WooCommerce 替身，由 coordinate_sharded_sync 规划分片，
+每个分片通过 subprocess_shard_dispatcher 在独立子进程中运行（各自使用内存数据库），
+最后检查所有分片写入的 SKU 互不重复且覆盖整个目录。
+
+用法:
+  python bench/shard_harness.py --products 2000 --shards 4
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+
+def use_fake_woo(woo_url: str):
+    import main
+    main.SITES['com'].update(url=woo_url, key='ck_bench', secret='cs_bench')
+    return main
+
+
+def run_shard(payload: dict, woo_url: str):
+    """子进程：运行一个分片，结果中附带写入的 SKU 供协调进程校验"""
+    from fake_supabase import FakeSupabase
+    main = use_fake_woo(woo_url)
+    supabase = FakeSupabase()
+    result = main.run_shard_payload(supabase, payload)
+    result['skus'] = sorted(supabase.tables.get('products', {}))
+    print(json.dumps(result))
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description='分片同步本地测试')
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--variations', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.01, help='每个请求的模拟服务端延迟（秒）')
+    parser.add_argument('--shards', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=10)
+    parser.add_argument('--woo-url', help=argparse.SUPPRESS)
+    parser.add_argument('--run-shard', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_shard:
+        run_shard(json.loads(args.run_shard), args.woo_url)
+        return
+
+    from fake_woo import spawn_fake_woo
+    from fake_supabase import FakeSupabase
+
+    woo_process, woo_url = spawn_fake_woo(args.products, args.variations, args.latency)
+    try:
+        main = use_fake_woo(woo_url)
+        logging.getLogger().setLevel(logging.WARNING)
+        main.SHARD_PROGRESS_INTERVAL = 1
+        dispatch = main.subprocess_shard_dispatcher([sys.executable, __file__, '--woo-url', woo_url, '--run-shard'])
+        result = main.coordinate_sharded_sync(FakeSupabase(), 'com', args.shards, dispatch, args.workers)
+    finally:
+        woo_process.terminate()
+
+    print(f"目录: {args.products} 个商品, {len(result['shards'])} 个分片, 总耗时 {result['duration']:.2f}s")
+    for shard in result['shards']:
+        print(f"  分片 {shard['shard']}: 第 {shard['start_page']}-{shard['end_page']} 页, "
+              f"{shard['success']}/{shard['total']} 成功, {shard.get('duration', 0):.2f}s {shard.get('error', '')}")
+
+    skus = [sku for shard in result['shards'] for sku in shard.get('skus', [])]
+    duplicates = len(skus) - len(set(skus))
+    ok = len(set(skus)) == args.products and not duplicates and not result.get('error')
+    print(f"汇总: {result['success']}/{result['total']} 成功, {result['failed']} 失败, "
+          f"写入 {len(set(skus))} 个 SKU, 重复 {duplicates} -> {'OK' if ok else 'MISMATCH'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main_cli()
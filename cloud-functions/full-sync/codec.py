@@ -0,0 +1,33 @@
+"""
+JSON 编解码
+安装了 orjson 时使用 orjson（商品列表页解码、整批商品/客户写入编码快数倍），否则退回标准库 json。
+dumps 返回 UTF-8 编码的 bytes，可直接作为 HTTP 请求体；loads 接受 bytes 或 str，
+直接解码响应的原始字节（response.content），省去 response.json() 先按字符集解码成文本的一步。
+
+scripts/codec.py 是本文件的符号链接，客户同步脚本与 full-sync 共用同一份实现
+"""
+
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = 'orjson' if orjson else 'json'
+
+
+if orjson:
+    def dumps(obj: Any) -> bytes:
+        # 与标准库的 default=str 行为一致：无法序列化的值转为字符串；允许非字符串的字典键
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS)
+
+    def loads(data: Union[bytes, str]) -> Any:
+        return orjson.loads(data)
+else:
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=str).encode()
+
+    def loads(data: Union[bytes, str]) -> Any:
+        return json.loads(data)
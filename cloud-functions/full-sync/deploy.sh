@@ -46,10 +46,17 @@ gcloud functions deploy $FUNCTION_NAME \
     --memory=1Gi \
     --timeout=3600s \
     --max-instances=10 \
-    --set-env-vars="SUPABASE_SERVICE_KEY=${SUPABASE_SERVICE_KEY},WOO_COM_KEY=${WOO_COM_KEY},WOO_COM_SECRET=${WOO_COM_SECRET},WOO_UK_KEY=${WOO_UK_KEY},WOO_UK_SECRET=${WOO_UK_SECRET},WOO_DE_KEY=${WOO_DE_KEY},WOO_DE_SECRET=${WOO_DE_SECRET},WOO_FR_KEY=${WOO_FR_KEY},WOO_FR_SECRET=${WOO_FR_SECRET}" \
+    --set-env-vars="SYNC_WRITE_MODE=${SYNC_WRITE_MODE:-upsert},SUPABASE_SERVICE_KEY=${SUPABASE_SERVICE_KEY},WOO_COM_KEY=${WOO_COM_KEY},WOO_COM_SECRET=${WOO_COM_SECRET},WOO_UK_KEY=${WOO_UK_KEY},WOO_UK_SECRET=${WOO_UK_SECRET},WOO_DE_KEY=${WOO_DE_KEY},WOO_DE_SECRET=${WOO_DE_SECRET},WOO_FR_KEY=${WOO_FR_KEY},WOO_FR_SECRET=${WOO_FR_SECRET}" \
     --source=. \
     --project=$PROJECT_ID
 
+# submit 提交的异步任务在请求返回后继续运行，需要 CPU 始终分配（gen2 函数即同名 Cloud Run 服务）
+echo "⚙️ 设置 CPU 始终分配..."
+gcloud run services update $FUNCTION_NAME \
+    --region=$REGION \
+    --no-cpu-throttling \
+    --project=$PROJECT_ID
+
 echo ""
 echo "✅ 部署完成!"
 echo ""
@@ -60,6 +67,10 @@ echo "🔗 函数 URL: $FUNCTION_URL"
 echo ""
 echo "测试命令:"
 echo "  curl -X POST $FUNCTION_URL -H 'Content-Type: application/json' -d '{\"action\": \"health\"}'"
+echo "  curl -X POST $FUNCTION_URL -H 'Content-Type: application/json' -d '{\"action\": \"submit\", \"job\": {\"action\": \"sync-site\", \"site\": \"com\"}}'"
+echo "  curl -X POST $FUNCTION_URL -H 'Content-Type: application/json' -d '{\"action\": \"status\", \"job_id\": \"<job_id>\"}'"
+echo "  curl -X POST $FUNCTION_URL -H 'Content-Type: application/json' -d '{\"action\": \"tiered-refresh\", \"dry_run\": true}'"
+echo "  curl -X POST $FUNCTION_URL -H 'Content-Type: application/json' -d '{\"action\": \"push\", \"site\": \"com\", \"dry_run\": true}'"
 
 
 
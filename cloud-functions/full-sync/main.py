@@ -5,19 +5,36 @@ JerseysFever 全量同步 Cloud Function
 支持所有 4 个站点：com, uk, de, fr
 """
 
+from __future__ import annotations
+
 import os
+import sys
 import json
 import base64
+import functools
+import hashlib
 import logging
-from typing import Optional, Dict, List, Any
-from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import time
+import uuid
+from typing import Optional, Dict, List, Any, Callable, Iterator, Tuple, TYPE_CHECKING
+from datetime import datetime, timedelta
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+import queue
+import subprocess
 import threading
 
 import functions_framework
-from flask import Request, jsonify
 import requests
-from supabase import create_client, Client
+import requests.adapters
+
+import codec
+
+# supabase 导入耗时约 0.3 秒，推迟到第一次创建客户端时（health 等不访问数据库的请求不需要）
+if TYPE_CHECKING:
+    from flask import Request
+    from supabase import Client
 
 # 线程锁，用于更新进度
 progress_lock = threading.Lock()
@@ -30,6 +47,20 @@ logger = logging.getLogger(__name__)
 SUPABASE_URL = os.environ.get('SUPABASE_URL', 'https://iwzohjbvuhwvfidyevpf.supabase.co')
 SUPABASE_KEY = os.environ.get('SUPABASE_SERVICE_KEY')
 
+# 商品写入方式: upsert = 读取-合并-整行写回；rpc = 调用 merge_product_patches 在数据库内原子合并
+SYNC_WRITE_MODE = os.environ.get('SYNC_WRITE_MODE', 'upsert')
+
+# 可恢复同步单次调用的时间预算（秒），留出余量在 Cloud Function 超时（3600s）前保存检查点
+SYNC_TIME_BUDGET = float(os.environ.get('SYNC_TIME_BUDGET', '3300'))
+
+# 分片同步：sync-shard 调用地址（默认使用当前请求的地址）、分片数、单个分片超时和进度汇总间隔（秒）
+SYNC_FUNCTION_URL = os.environ.get('SYNC_FUNCTION_URL')
+SHARD_DEFAULT_COUNT = 4
+# 部署的 max-instances 为 10，协调器本身占用一个实例
+SHARD_MAX_COUNT = 8
+SHARD_TIMEOUT = 3600
+SHARD_PROGRESS_INTERVAL = 5
+
 # WooCommerce 站点配置
 SITES = {
     'com': {
@@ -55,10 +86,421 @@ SITES = {
 }
 
 
+# 字段投影（_fields）：只请求 process_woo_product 实际读取的字段，减少传输量和服务端序列化开销
+PRODUCT_FIELDS = [
+    'id', 'sku', 'type', 'status', 'name', 'description', 'short_description',
+    'price', 'regular_price', 'sale_price', 'stock_quantity', 'stock_status',
+    'images', 'categories', 'attributes', 'date_modified_gmt',
+]
+VARIATION_FIELDS = [
+    'id', 'sku', 'attributes', 'regular_price', 'sale_price', 'stock_quantity', 'stock_status',
+]
+
+# 价格/库存快速同步只请求这些商品字段，并只写入 PRICE_STOCK_KEYS（变体仍请求 VARIATION_FIELDS）
+PRICE_STOCK_FIELDS = [
+    'id', 'sku', 'type', 'status', 'price', 'regular_price', 'sale_price', 'stock_quantity', 'stock_status',
+]
+PRICE_STOCK_KEYS = (
+    'sku', 'prices', 'regular_prices', 'stock_quantities', 'stock_statuses', 'statuses', 'last_synced_at',
+)
+# upsert 写入模式按站点浅合并的 JSONB 列（PRICE_STOCK_KEYS 中的站点列 + 内容、变体和指纹列）
+SITE_MERGE_KEYS = tuple(key for key in PRICE_STOCK_KEYS if key not in ('sku', 'last_synced_at')) + (
+    'content', 'sync_status', 'variations', 'variation_counts', 'variation_cache', 'content_hashes', 'change_stats', 'woo_ids',
+)
+
+# WooCommerce 属性名（小写、去空格后）→ products.attributes 的键；events 保留全部选项，其余只取第一个选项
+ATTRIBUTE_KEYS = {
+    'genderage': 'gender', 'gender': 'gender',
+    'season': 'season',
+    'jerseytype': 'type', 'type': 'type',
+    'style': 'version', 'version': 'version',
+    'sleevelength': 'sleeve', 'sleeve': 'sleeve',
+    'team': 'team',
+    'event': 'events', 'events': 'events',
+}
+MULTI_VALUE_ATTRIBUTES = ('events',)
+
+# 商品列表分页的预取并发数，以及每页商品数（WooCommerce per_page 上限为 100）
+PAGE_FETCH_WORKERS = 4
+PRODUCTS_PER_PAGE = 100
+
+# sync-skus 单次请求最多的 SKU 数
+SYNC_SKUS_MAX = 500
+
+# 批量获取变体时每个请求合并的父商品数（GET /products?type=variation&parent=...）
+VARIATION_BULK_PARENTS = 20
+
+# 进度心跳间隔（秒）：合并进度写入并轮询取消标志
+PROGRESS_INTERVAL = 2.0
+
+# 推送：WooCommerce 批量接口单个请求的最多项数，部分失败的项单独重试的轮数
+PUSH_BATCH_SIZE = 100
+PUSH_ITEM_RETRIES = 2
+# 推送：每个站点的起始/最大并发请求数（AIMD 自适应，批量写入对站点的压力远大于读取）
+PUSH_DEFAULT_CONCURRENCY = 4
+PUSH_MAX_CONCURRENCY = 8
+# 推送前读取的商品字段：只需要库存管理开关
+PUSH_STOCK_FIELDS = ['id', 'manage_stock']
+
+# 写后缓冲：并行写入线程数、每批商品数、单个批次的最大尝试次数
+WRITER_WORKERS = 2
+WRITE_BATCH_SIZE = 300
+WRITE_MAX_RETRIES = 3
+
+# 变体缓存有效期（秒）：父商品未修改时最长沿用已存储变体的时间。
+# 订单扣减变体库存不会更新父商品的 date_modified_gmt，过期后重新获取以纠正库存
+VARIATION_CACHE_TTL = 24 * 3600
+
+# 内容指纹：不参与指纹的字段（每次同步都会变化或由同步自身维护），以及不按站点区分的共享字段
+FINGERPRINT_IGNORED_KEYS = ('sku', 'last_synced_at', 'variation_cache', 'content_hashes', 'change_stats')
+SHARED_PRODUCT_KEYS = ('name', 'images', 'categories', 'attributes')
+
+# 分层刷新：变化分数（按时间衰减的内容变化次数）的半衰期（秒）
+REFRESH_HALF_LIFE = 7 * 24 * 3600
+# 分层刷新的层级：(名称, 最低变化分数, 刷新间隔秒数)，按分数从高到低匹配
+REFRESH_TIERS = (
+    ('hot', 2.0, 15 * 60),
+    ('warm', 0.25, 3 * 3600),
+    ('cold', 0.0, 24 * 3600),
+)
+# 分层刷新每批定向同步的 SKU 数
+REFRESH_BATCH_SIZE = 200
+
+# asyncio 引擎默认在途请求数
+ASYNC_DEFAULT_CONCURRENCY = 100
+
+# 需要退避重试的响应状态码（服务器过载 / 限流）
+RETRY_STATUS_CODES = (429, 503)
+# Retry-After 最长等待秒数，避免异常响应头让同步挂起过久
+RETRY_AFTER_MAX = 60
+
+# 自适应并发（AIMD）的上下限：健康时每个往返窗口加 1，过载时减半
+ADAPTIVE_MIN_CONCURRENCY = 2
+ADAPTIVE_MAX_CONCURRENCY = 50
+
+# 同步指标：请求延迟直方图的桶上限（秒），以及 Prometheus 文本格式的 Content-Type
+METRICS_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def retry_after_seconds(headers, default: Optional[float] = None) -> Optional[float]:
+    """解析 Retry-After 响应头（秒数或 HTTP 日期），没有或无法解析时返回 default"""
+    value = (headers or {}).get('Retry-After')
+    if not value:
+        return default
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            from email.utils import parsedate_to_datetime
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return default
+    return min(max(seconds, 0.0), RETRY_AFTER_MAX)
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD 自适应并发控制（线程安全）
+    每个 HTTP 请求前 acquire()，结束后 release() 报告结果：
+    - 成功且延迟未超过基线的 LATENCY_TOLERANCE 倍：加性增加，约每个窗口并发数 +1
+    - 503/429/超时：乘性减少（减半），同一往返时间（至少 1 秒）内的多次过载只减一次
+    Retry-After 只推迟收到它的那个请求的重试（见 WooCommerceClient._request_with_retry），不暂停其他请求，
+    否则零星的 503 会在减半之外再让整个站点停顿
+    """
+    
+    LATENCY_TOLERANCE = 2.0
+    DECREASE_FACTOR = 0.5
+    
+    def __init__(self, initial: int = 10, minimum: int = ADAPTIVE_MIN_CONCURRENCY, maximum: int = ADAPTIVE_MAX_CONCURRENCY):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.in_flight = 0
+        self.peak = int(self.limit)
+        self.lowest = int(self.limit)
+        self.backoffs = 0
+        self._base_latency: Optional[float] = None
+        self._avg_latency: Optional[float] = None
+        self._last_decrease = float('-inf')
+        self._cond = threading.Condition()
+    
+    def acquire(self):
+        """等待直到在途请求数低于当前并发上限"""
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+    
+    def release(self, latency: Optional[float] = None, overloaded: bool = False):
+        """
+        释放一个在途名额并调整并发上限
+        latency: 成功请求的耗时（秒）；overloaded: 503/429/超时
+        """
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if overloaded:
+                # 过载信号往往成批到达，同一往返时间内只减半一次
+                if now - self._last_decrease >= max(self._avg_latency or 0.0, 1.0):
+                    self.limit = max(self.minimum, self.limit * self.DECREASE_FACTOR)
+                    self.lowest = min(self.lowest, int(self.limit))
+                    self.backoffs += 1
+                    self._last_decrease = now
+                    logger.warning(f"⚠️ 检测到过载，并发降为 {int(self.limit)}")
+            elif latency is not None:
+                self._avg_latency = latency if self._avg_latency is None else self._avg_latency * 0.9 + latency * 0.1
+                # 基线取观察到的最低平均延迟，并缓慢上调以适应服务端正常波动
+                if self._base_latency is None or self._avg_latency < self._base_latency:
+                    self._base_latency = self._avg_latency
+                else:
+                    self._base_latency *= 1.001
+                if self._avg_latency <= self._base_latency * self.LATENCY_TOLERANCE and self.limit < self.maximum:
+                    self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+                    self.peak = max(self.peak, int(self.limit))
+            self._cond.notify_all()
+    
+    def stats(self) -> Dict[str, Any]:
+        """返回并发统计，settled 为同步结束时稳定的并发数"""
+        with self._cond:
+            return {
+                'settled': int(self.limit),
+                'peak': self.peak,
+                'lowest': self.lowest,
+                'backoffs': self.backoffs,
+                'avg_latency_ms': round(self._avg_latency * 1000, 1) if self._avg_latency is not None else None,
+            }
+
+
+class AdaptiveThreadPool:
+    """
+    线程数跟随 AdaptiveConcurrency 当前并发上限的线程池（submit / map / with 用法与 ThreadPoolExecutor 相同）
+    有排队任务且线程数低于当前上限时才新建线程（提交任务和任务完成时检查，上限增长后随之扩容）；
+    上限下降后多出的线程做完手上的任务就退出，队列为空时线程也退出
+    """
+    
+    def __init__(self, limiter: AdaptiveConcurrency):
+        self.limiter = limiter
+        self.peak_threads = 0
+        self._tasks: deque = deque()
+        self._threads = 0
+        self._cond = threading.Condition()
+    
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        future = Future()
+        with self._cond:
+            self._tasks.append((future, fn, args, kwargs))
+            self._spawn()
+        return future
+    
+    def map(self, fn: Callable, *iterables) -> Iterator[Any]:
+        futures = [self.submit(fn, *args) for args in zip(*iterables)]
+        
+        def results():
+            try:
+                for future in futures:
+                    yield future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+        return results()
+    
+    def _spawn(self):
+        # 调用方持有 self._cond
+        while self._tasks and self._threads < max(1, int(self.limiter.limit)):
+            self._threads += 1
+            self.peak_threads = max(self.peak_threads, self._threads)
+            threading.Thread(target=self._run, daemon=True).start()
+    
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._tasks or self._threads > max(1, int(self.limiter.limit)):
+                    self._threads -= 1
+                    self._cond.notify_all()
+                    return
+                future, fn, args, kwargs = self._tasks.popleft()
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+            with self._cond:
+                self._spawn()
+    
+    def shutdown(self, wait: bool = True):
+        """等待已提交的任务全部完成（与 ThreadPoolExecutor.shutdown(wait=True) 相同）"""
+        if wait:
+            with self._cond:
+                while self._tasks or self._threads:
+                    self._cond.wait()
+    
+    def __enter__(self) -> 'AdaptiveThreadPool':
+        return self
+    
+    def __exit__(self, *exc):
+        self.shutdown()
+        return False
+
+
+def site_executor(workers: int, limiter: Optional[AdaptiveConcurrency] = None):
+    """同步路径的线程池：自适应并发时线程数跟随当前并发上限（AdaptiveThreadPool），否则为固定 workers 个线程"""
+    return AdaptiveThreadPool(limiter) if limiter else ThreadPoolExecutor(max_workers=workers)
+
+
+def _bucket_label(bound: float) -> str:
+    return f"{bound:g}"
+
+
+class SyncMetrics:
+    """
+    单个站点一次同步运行的结构化指标（线程安全）
+    - phase(name): 累计各阶段耗时（list_pages / fetch_variations / transform / read_existing / upsert），
+      多个线程并行执行同一阶段时按线程累加，可能超过运行总耗时
+    - record_request(): 按接口记录请求延迟直方图，并统计响应状态码和接收字节数
+    - record_retry(): 统计重试次数
+    to_dict() 的结构只含可相加的计数，merge() 据此合并多个分片的指标
+    """
+    
+    PHASES = ('list_pages', 'fetch_variations', 'transform', 'read_existing', 'upsert')
+    
+    def __init__(self, site: str):
+        self.site = site
+        self._phases = {name: 0.0 for name in self.PHASES}
+        self._requests: Dict[str, Dict[str, Any]] = {}
+        self._statuses: Dict[str, int] = {}
+        self._retries = 0
+        self._bytes_received = 0
+        self._lock = threading.Lock()
+    
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self._phases[name] = self._phases.get(name, 0.0) + elapsed
+    
+    def record_request(self, endpoint: str, latency: float, status: Optional[int] = None, size: int = 0):
+        """记录一次 HTTP 请求；status 为空表示请求没有得到响应（超时/连接失败）"""
+        label = next((_bucket_label(b) for b in METRICS_LATENCY_BUCKETS if latency <= b), '+Inf')
+        with self._lock:
+            entry = self._requests.get(endpoint)
+            if entry is None:
+                entry = self._requests[endpoint] = {
+                    'count': 0,
+                    'seconds': 0.0,
+                    'buckets': {label: 0 for label in [*map(_bucket_label, METRICS_LATENCY_BUCKETS), '+Inf']},
+                }
+            entry['count'] += 1
+            entry['seconds'] += latency
+            entry['buckets'][label] += 1
+            key = str(status) if status is not None else 'error'
+            self._statuses[key] = self._statuses.get(key, 0) + 1
+            self._bytes_received += size
+    
+    def record_retry(self):
+        with self._lock:
+            self._retries += 1
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """返回指标快照；buckets 为各桶（上限秒数）内的请求数，不累积"""
+        with self._lock:
+            return {
+                'phases': {name: round(seconds, 3) for name, seconds in self._phases.items()},
+                'requests': {
+                    endpoint: {'count': entry['count'], 'seconds': round(entry['seconds'], 3), 'buckets': dict(entry['buckets'])}
+                    for endpoint, entry in self._requests.items()
+                },
+                'statuses': dict(self._statuses),
+                'retries': self._retries,
+                'bytes_received': self._bytes_received,
+            }
+    
+    @staticmethod
+    def merge(snapshots: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """逐项相加多个 to_dict() 快照（例如同一站点的多个分片）"""
+        def add(target: Dict[str, Any], source: Dict[str, Any]):
+            for key, value in source.items():
+                if isinstance(value, dict):
+                    add(target.setdefault(key, {}), value)
+                else:
+                    target[key] = round(target.get(key, 0) + value, 3)
+        
+        merged: Dict[str, Any] = {}
+        for snapshot in snapshots:
+            if snapshot:
+                add(merged, snapshot)
+        return merged
+
+
+def metrics_phase(metrics: Optional[SyncMetrics], name: str):
+    """记录阶段耗时（没有 metrics 时不计时）"""
+    return metrics.phase(name) if metrics else nullcontext()
+
+
+def format_prometheus(site_results: List[Dict[str, Any]]) -> str:
+    """把各站点结果（含 metrics）格式化为 Prometheus 文本格式"""
+    lines = []
+    
+    def family(name: str, kind: str, help_text: str, samples: List[Tuple[str, Dict[str, Any], Any]]):
+        if not samples:
+            return
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for suffix, labels, value in samples:
+            label_text = ','.join(f'{k}="{v}"' for k, v in labels.items())
+            lines.append(f"{name}{suffix}{{{label_text}}} {value}")
+    
+    runs = [r for r in site_results if r.get('metrics')]
+    family('full_sync_run_duration_seconds', 'gauge', 'Duration of the last sync run.', [
+        ('', {'site': r['site']}, r.get('duration') or 0) for r in runs
+    ])
+    family('full_sync_products', 'gauge', 'Products processed in the last sync run.', [
+        ('', {'site': r['site'], 'result': outcome}, r.get(outcome) or 0) for r in runs for outcome in ('success', 'failed')
+    ])
+    family('full_sync_phase_seconds', 'gauge', 'Time spent per sync phase, summed across threads.', [
+        ('', {'site': r['site'], 'phase': phase}, seconds)
+        for r in runs for phase, seconds in r['metrics'].get('phases', {}).items()
+    ])
+    histogram = []
+    for r in runs:
+        for endpoint, entry in r['metrics'].get('requests', {}).items():
+            cumulative = 0
+            for label, count in entry['buckets'].items():
+                cumulative += count
+                histogram.append(('_bucket', {'site': r['site'], 'endpoint': endpoint, 'le': label}, cumulative))
+            histogram.append(('_sum', {'site': r['site'], 'endpoint': endpoint}, entry['seconds']))
+            histogram.append(('_count', {'site': r['site'], 'endpoint': endpoint}, entry['count']))
+    family('full_sync_request_duration_seconds', 'histogram', 'WooCommerce request latency by endpoint.', histogram)
+    family('full_sync_responses', 'gauge', 'WooCommerce responses by status code in the last sync run.', [
+        ('', {'site': r['site'], 'status': status}, count)
+        for r in runs for status, count in r['metrics'].get('statuses', {}).items()
+    ])
+    family('full_sync_retries', 'gauge', 'WooCommerce request retries in the last sync run.', [
+        ('', {'site': r['site']}, r['metrics'].get('retries', 0)) for r in runs
+    ])
+    family('full_sync_bytes_received', 'gauge', 'Bytes received from WooCommerce in the last sync run.', [
+        ('', {'site': r['site']}, r['metrics'].get('bytes_received', 0)) for r in runs
+    ])
+    return '\n'.join(lines) + '\n'
+
+
 class WooCommerceClient:
     """WooCommerce REST API 客户端"""
     
-    def __init__(self, site: str):
+    def __init__(
+        self,
+        site: str,
+        pool_size: int = 10,
+        product_fields: Optional[List[str]] = None,
+        variation_fields: Optional[List[str]] = None,
+        limiter: Optional[AdaptiveConcurrency] = None,
+        metrics: Optional[SyncMetrics] = None,
+        per_page: int = PRODUCTS_PER_PAGE,
+    ):
         self.site = site
         config = SITES.get(site)
         if not config:
@@ -66,23 +508,97 @@ class WooCommerceClient:
         
         self.base_url = f"{config['url']}/wp-json/wc/v3"
         self.auth = (config['key'], config['secret'])
+        self.product_fields = ','.join(product_fields or PRODUCT_FIELDS)
+        self.variation_fields = ','.join(variation_fields or VARIATION_FIELDS)
+        self.limiter = limiter
+        self.metrics = metrics
+        # 商品列表每页商品数（分片按同一页大小规划页码范围）
+        self.per_page = per_page
+        # 站点是否支持批量列出变体：None 为未探测，第一次批量请求后确定
+        self.bulk_variations: Optional[bool] = None
+        
+        # 长连接会话：连接池大小与并发线程数一致，所有线程复用 TCP/TLS 连接
+        self.session = requests.Session()
+        self.session.auth = self.auth
+        self.session.headers['Accept-Encoding'] = 'gzip'
+        self.pool_size = 0
+        self.ensure_pool_size(pool_size)
+    
+    def ensure_pool_size(self, pool_size: int):
+        """连接池小于 pool_size 时换成更大的连接池（只增不减；旧连接池上进行中的请求不受影响）"""
+        if pool_size <= self.pool_size:
+            return
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.pool_size = pool_size
     
-    def _request_with_retry(self, url: str, max_retries: int = 3) -> requests.Response:
-        """带重试的请求"""
-        import time
+    def _send(self, url: str, params: Optional[Dict[str, Any]] = None, endpoint: str = 'other', payload: Optional[Dict[str, Any]] = None) -> requests.Response:
+        """
+        发送一次 GET 请求（带 payload 时为 POST，请求体由 codec 编码）；使用自适应并发时占用一个在途名额，并把延迟/过载情况反馈给控制器。
+        有 metrics 时按 endpoint 记录延迟、状态码和接收字节数
+        """
+        if self.limiter:
+            self.limiter.acquire()
+        started = time.monotonic()
+        try:
+            if payload is not None:
+                response = self.session.post(url, params=params, data=codec.dumps(payload), headers={'Content-Type': 'application/json'}, timeout=60)
+            else:
+                response = self.session.get(url, params=params, timeout=30)
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+            self._observe(endpoint, started, overloaded=True)
+            raise
+        except Exception:
+            self._observe(endpoint, started)
+            raise
+        self._observe(endpoint, started, response)
+        return response
+    
+    def _observe(self, endpoint: str, started: float, response: Optional[requests.Response] = None, overloaded: bool = False):
+        latency = time.monotonic() - started
+        if self.metrics:
+            # 接收字节数优先取 Content-Length（gzip 压缩后的传输大小），分块传输时取解压后的长度
+            size = 0
+            if response is not None:
+                length = response.headers.get('Content-Length', '')
+                size = int(length) if length.isdigit() else len(response.content)
+            self.metrics.record_request(endpoint, latency, response.status_code if response is not None else None, size)
+        if not self.limiter:
+            return
+        if response is None:
+            self.limiter.release(overloaded=overloaded)
+        elif response.status_code in RETRY_STATUS_CODES:
+            self.limiter.release(overloaded=True)
+        elif response.status_code >= 500:
+            self.limiter.release()
+        else:
+            self.limiter.release(latency=latency)
+    
+    def _request_with_retry(self, url: str, max_retries: int = 3, params: Optional[Dict[str, Any]] = None, endpoint: str = 'other', payload: Optional[Dict[str, Any]] = None) -> requests.Response:
+        """带重试的请求（503/429 优先按 Retry-After 等待）；批量更新按值覆盖，重试 POST 也是安全的"""
         for attempt in range(max_retries):
             try:
-                response = requests.get(url, auth=self.auth, timeout=30)
-                if response.status_code == 503:
+                response = self._send(url, params, endpoint, payload)
+                if response.status_code in RETRY_STATUS_CODES:
                     if attempt < max_retries - 1:
-                        wait_time = (attempt + 1) * 2  # 2, 4, 6 秒
-                        logger.warning(f"503 错误，{wait_time}秒后重试 ({attempt + 1}/{max_retries})")
+                        if self.metrics:
+                            self.metrics.record_retry()
+                        # 只有这个请求按 Retry-After 等待（等待时不占用在途名额），默认 2, 4, 6 秒
+                        wait_time = retry_after_seconds(response.headers, (attempt + 1) * 2)
+                        logger.warning(f"{response.status_code} 错误，{wait_time:.0f}秒后重试 ({attempt + 1}/{max_retries})")
                         time.sleep(wait_time)
                         continue
                 response.raise_for_status()
                 return response
             except requests.exceptions.RequestException as e:
+                # 4xx（429 除外）是请求本身的问题，重试没有意义
+                status = e.response.status_code if e.response is not None else None
+                if status and 400 <= status < 500 and status not in RETRY_STATUS_CODES:
+                    raise
                 if attempt < max_retries - 1:
+                    if self.metrics:
+                        self.metrics.record_retry()
                     wait_time = (attempt + 1) * 2
                     logger.warning(f"请求失败: {e}，{wait_time}秒后重试")
                     time.sleep(wait_time)
@@ -93,43 +609,220 @@ class WooCommerceClient:
     def get_product(self, product_id: int) -> Dict[str, Any]:
         """获取单个商品"""
         url = f"{self.base_url}/products/{product_id}"
-        response = self._request_with_retry(url)
-        return response.json()
+        response = self._request_with_retry(url, params={'_fields': self.product_fields}, endpoint='product')
+        return codec.loads(response.content)
     
-    def get_products_page(self, page: int = 1, per_page: int = 100) -> List[Dict[str, Any]]:
-        """批量获取商品（分页）"""
+    def _get_products_response(self, page: int, per_page: int, modified_after: Optional[str] = None, orderby: Optional[str] = None) -> requests.Response:
+        """请求一页商品，返回原始响应（包含 X-WP-Total / X-WP-TotalPages 响应头）"""
         url = f"{self.base_url}/products?page={page}&per_page={per_page}"
-        response = self._request_with_retry(url)
-        return response.json()
+        if modified_after:
+            url += f"&modified_after={modified_after}&dates_are_gmt=true"
+        if orderby:
+            url += f"&orderby={orderby}&order=asc"
+        with metrics_phase(self.metrics, 'list_pages'):
+            return self._request_with_retry(url, params={'_fields': self.product_fields}, endpoint='products')
+    
+    def get_products_page(self, page: int = 1, per_page: int = 100, modified_after: Optional[str] = None, orderby: Optional[str] = None) -> List[Dict[str, Any]]:
+        """批量获取商品（分页），modified_after 为 GMT 时间，只返回此后修改过的商品；orderby 指定升序排序字段"""
+        return codec.loads(self._get_products_response(page, per_page, modified_after, orderby).content)
     
-    def get_all_products(self) -> List[Dict[str, Any]]:
-        """获取所有商品"""
+    def get_products_by_ids(self, product_ids: List[int]) -> List[Dict[str, Any]]:
+        """按商品 ID 批量获取（include=，每个请求最多 100 个 ID）"""
+        products = []
+        for i in range(0, len(product_ids), 100):
+            chunk = product_ids[i:i + 100]
+            url = f"{self.base_url}/products?include={','.join(str(pid) for pid in chunk)}&per_page={len(chunk)}"
+            with metrics_phase(self.metrics, 'list_pages'):
+                products.extend(codec.loads(self._request_with_retry(url, params={'_fields': self.product_fields}, endpoint='products_by_ids').content))
+        return products
+    
+    def update_products_batch(self, updates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """批量更新商品（POST /products/batch，每个请求最多 PUSH_BATCH_SIZE 项），返回逐项结果，失败项带 error"""
+        url = f"{self.base_url}/products/batch"
+        return codec.loads(self._request_with_retry(url, payload={'update': updates}, endpoint='products_batch').content).get('update', [])
+    
+    def update_variations_batch(self, product_id: int, updates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """批量更新单个商品的变体（POST /products/{id}/variations/batch），返回逐项结果"""
+        url = f"{self.base_url}/products/{product_id}/variations/batch"
+        return codec.loads(self._request_with_retry(url, payload={'update': updates}, endpoint='variations_batch').content).get('update', [])
+    
+    def get_all_products(self, modified_after: Optional[str] = None, max_workers: int = PAGE_FETCH_WORKERS) -> List[Dict[str, Any]]:
+        """
+        获取所有商品（可选只获取 modified_after 之后修改过的商品）
+        根据 X-WP-TotalPages 响应头并行获取页面，结果按页码顺序合并
+        """
         all_products = []
-        page = 1
-        while True:
-            logger.info(f"📦 获取第 {page} 页商品...")
-            products = self.get_products_page(page=page, per_page=100)
-            if not products:
-                break
+        for page, products, _ in self.iter_product_pages(modified_after, max_workers):
             all_products.extend(products)
-            logger.info(f"   获取到 {len(products)} 个，累计 {len(all_products)} 个")
-            if len(products) < 100:
-                break
-            page += 1
+            logger.info(f"   第 {page} 页获取到 {len(products)} 个，累计 {len(all_products)} 个")
         return all_products
     
+    def iter_product_pages(
+        self,
+        modified_after: Optional[str] = None,
+        max_workers: int = PAGE_FETCH_WORKERS,
+        start_page: int = 1,
+        orderby: Optional[str] = None,
+        end_page: Optional[int] = None,
+    ) -> Iterator[Tuple[int, List[Dict[str, Any]], int]]:
+        """
+        按页码顺序逐页产出 (页码, 商品列表, 商品总数)
+        先请求 start_page 页，根据 X-WP-TotalPages 响应头并行预取后续页面（最多 max_workers 页在途），
+        每一页单独重试；没有分页响应头时退回逐页获取，商品总数为 0 表示未知。
+        end_page 为最后一页（包含），为空时取到最后
+        """
+        logger.info(f"📦 获取第 {start_page} 页商品...")
+        per_page = self.per_page
+        response = self._get_products_response(start_page, per_page, modified_after, orderby)
+        first_page = codec.loads(response.content)
+        if not first_page:
+            return
+        
+        total = response.headers.get('X-WP-Total', '')
+        total = int(total) if total.isdigit() else 0
+        total_pages = response.headers.get('X-WP-TotalPages', '')
+        yield start_page, first_page, total
+        
+        if not total_pages.isdigit():
+            # 没有分页响应头时逐页获取，直到某一页不满 per_page 个
+            products, page = first_page, start_page
+            while len(products) >= per_page and (end_page is None or page < end_page):
+                page += 1
+                products = self.get_products_page(page=page, per_page=per_page, modified_after=modified_after, orderby=orderby)
+                if not products:
+                    break
+                yield page, products, total
+            return
+        
+        total_pages = int(total_pages)
+        logger.info(f"   共 {total} 个商品，{total_pages} 页")
+        if end_page:
+            total_pages = min(total_pages, end_page)
+        if total_pages <= start_page:
+            return
+        
+        fetch_page = lambda page: self.get_products_page(page=page, per_page=per_page, modified_after=modified_after, orderby=orderby)
+        executor = ThreadPoolExecutor(max_workers=min(max_workers, total_pages - start_page))
+        pending = deque()
+        next_page = start_page + 1
+        try:
+            # 滑动窗口：最多 max_workers 页在途，按提交顺序产出保证页码有序
+            while next_page <= total_pages and len(pending) < max_workers:
+                pending.append((next_page, executor.submit(fetch_page, next_page)))
+                next_page += 1
+            while pending:
+                page, future = pending.popleft()
+                products = future.result()
+                if next_page <= total_pages:
+                    pending.append((next_page, executor.submit(fetch_page, next_page)))
+                    next_page += 1
+                yield page, products, total
+        finally:
+            for _, future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+    
+    def count_products(self, modified_after: Optional[str] = None) -> int:
+        """只读取 X-WP-Total 响应头获取商品总数（per_page=1，不传输商品列表）"""
+        url = f"{self.base_url}/products?per_page=1"
+        if modified_after:
+            url += f"&modified_after={modified_after}&dates_are_gmt=true"
+        response = self._request_with_retry(url, params={'_fields': 'id'}, endpoint='count')
+        total = response.headers.get('X-WP-Total', '')
+        if not total.isdigit():
+            raise ValueError("响应缺少 X-WP-Total，无法规划分片")
+        return int(total)
+    
+    def _iter_pages(self, url: str, params: Dict[str, Any], endpoint: str = 'other') -> Iterator[List[Dict[str, Any]]]:
+        """按 X-WP-TotalPages 逐页产出列表接口的结果（没有分页响应头时取到某一页不满 100 个为止）"""
+        response = self._request_with_retry(url, params={**params, 'per_page': 100, 'page': 1}, endpoint=endpoint)
+        items = codec.loads(response.content)
+        total_pages = response.headers.get('X-WP-TotalPages', '')
+        total_pages = int(total_pages) if total_pages.isdigit() else None
+        page = 1
+        yield items
+        while items and (page < total_pages if total_pages is not None else len(items) >= 100):
+            page += 1
+            items = codec.loads(self._request_with_retry(url, params={**params, 'per_page': 100, 'page': page}, endpoint=endpoint).content)
+            yield items
+    
     def get_product_variations(self, product_id: int) -> List[Dict[str, Any]]:
-        """获取商品变体"""
-        url = f"{self.base_url}/products/{product_id}/variations?per_page=100"
-        response = self._request_with_retry(url)
-        return response.json()
+        """获取商品的全部变体（超过 100 个时分页获取）"""
+        url = f"{self.base_url}/products/{product_id}/variations"
+        with metrics_phase(self.metrics, 'fetch_variations'):
+            return [v for page in self._iter_pages(url, {'_fields': self.variation_fields}, 'variations') for v in page]
+    
+    def get_variations_bulk(self, parent_ids: List[int]) -> Optional[Dict[int, List[Dict[str, Any]]]]:
+        """
+        一次列出多个父商品的变体（GET /products?type=variation&parent=...），按父商品 ID 分组返回
+        标准 WooCommerce 的 type 参数不接受 variation（400），此时记为不支持并返回 None，调用方改为逐个获取
+        """
+        if self.bulk_variations is False or not parent_ids:
+            return None
+        wanted = set(parent_ids)
+        params = {
+            'type': 'variation',
+            'parent': ','.join(str(pid) for pid in parent_ids),
+            '_fields': f"{self.variation_fields},parent_id",
+        }
+        grouped = {pid: [] for pid in parent_ids}
+        try:
+            with metrics_phase(self.metrics, 'fetch_variations'):
+                for page in self._iter_pages(f"{self.base_url}/products", params, 'variations_bulk'):
+                    # 站点忽略 type 参数时会返回普通商品（parent_id 为 0），同样视为不支持
+                    if any(item.get('parent_id') not in wanted for item in page):
+                        grouped = None
+                        break
+                    for item in page:
+                        grouped[item['parent_id']].append(item)
+        except requests.exceptions.HTTPError as e:
+            if e.response is None or e.response.status_code != 400:
+                raise
+            grouped = None
+        if grouped is None:
+            if self.bulk_variations is None:
+                logger.info(f"[{self.site}] 站点不支持批量列出变体，逐个商品获取")
+            self.bulk_variations = False
+            return None
+        self.bulk_variations = True
+        return grouped
+
+
+# 实例级客户端缓存：同一个热实例的后续请求复用 Supabase 客户端和 WooCommerce 长连接会话
+client_lock = threading.Lock()
+_supabase_client: Optional[Client] = None
+_woo_clients: Dict[str, WooCommerceClient] = {}
 
 
 def get_supabase_client() -> Client:
-    """获取 Supabase 客户端"""
-    if not SUPABASE_KEY:
-        raise ValueError("SUPABASE_SERVICE_KEY not set")
-    return create_client(SUPABASE_URL, SUPABASE_KEY)
+    """获取 Supabase 客户端（第一次调用时创建，之后在热实例内复用）"""
+    global _supabase_client
+    if _supabase_client is None:
+        if not SUPABASE_KEY:
+            raise ValueError("SUPABASE_SERVICE_KEY not set")
+        with client_lock:
+            if _supabase_client is None:
+                from supabase import create_client
+                _supabase_client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    return _supabase_client
+
+
+def get_woo_client(site: str, pool_size: int = 10) -> WooCommerceClient:
+    """
+    获取站点的共享 WooCommerce 客户端（默认字段投影，不带自适应并发和指标），在热实例内复用长连接；
+    每个站点只缓存一个客户端，请求更大的 pool_size 时扩大连接池，站点配置变化时重新创建。
+    同步运行仍通过 create_site_client 创建独立客户端，以便按运行记录指标
+    """
+    config = SITES.get(site)
+    if not config:
+        raise ValueError(f"Unknown site: {site}")
+    with client_lock:
+        client = _woo_clients.get(site)
+        if client is None or client.base_url != f"{config['url']}/wp-json/wc/v3" or client.auth != (config['key'], config['secret']):
+            client = _woo_clients[site] = WooCommerceClient(site, pool_size=pool_size)
+        else:
+            client.ensure_pool_size(pool_size)
+        return client
 
 
 def fetch_product_from_woo(
@@ -139,75 +832,17 @@ def fetch_product_from_woo(
 ) -> Dict[str, Any]:
     """从 WooCommerce 获取商品数据（不写入数据库）"""
     try:
-        client = WooCommerceClient(site)
+        client = get_woo_client(site)
         woo_product = client.get_product(woo_id)
         
-        # 提取数据
-        update_data = {
-            'sku': sku,  # 用于批量更新时的匹配
-            'prices': {site: float(woo_product.get('sale_price') or woo_product.get('price') or 0)},
-            'regular_prices': {site: float(woo_product.get('regular_price') or woo_product.get('price') or 0)},
-            'stock_quantities': {site: woo_product.get('stock_quantity') or 100},
-            'stock_statuses': {site: woo_product.get('stock_status', 'instock')},
-            'statuses': {site: woo_product.get('status', 'publish')},
-            'content': {
-                site: {
-                    'name': woo_product.get('name', ''),
-                    'description': woo_product.get('description', ''),
-                    'short_description': woo_product.get('short_description', ''),
-                }
-            },
-            'sync_status': {site: 'synced'},
-            'last_synced_at': datetime.utcnow().isoformat(),
-        }
-        
-        # 如果是主站点 (com)，更新共享数据
-        if site == 'com':
-            update_data['name'] = woo_product.get('name', '')
-            update_data['images'] = [img['src'] for img in woo_product.get('images', [])]
-            update_data['categories'] = [c['name'] for c in woo_product.get('categories', [])]
-            
-            # 提取属性
-            attributes = {}
-            for attr in woo_product.get('attributes', []):
-                attr_name = (attr.get('name', '') or '').lower().replace(' ', '')
-                value = (attr.get('options') or [''])[0] if attr.get('options') else ''
-                
-                if attr_name in ('genderage', 'gender'):
-                    attributes['gender'] = value
-                elif attr_name == 'season':
-                    attributes['season'] = value
-                elif attr_name in ('jerseytype', 'type'):
-                    attributes['type'] = value
-                elif attr_name in ('style', 'version'):
-                    attributes['version'] = value
-                elif attr_name in ('sleevelength', 'sleeve'):
-                    attributes['sleeve'] = value
-                elif attr_name == 'team':
-                    attributes['team'] = value
-                elif attr_name in ('event', 'events'):
-                    attributes['events'] = attr.get('options', [])
-            
-            if attributes:
-                update_data['attributes'] = attributes
+        update_data = build_product_update(woo_product, site)
+        update_data['sku'] = sku  # 用于批量更新时的匹配（以数据库中的 SKU 为准）
         
         # 获取变体信息
         site_variations = []
         if woo_product.get('type') == 'variable':
             try:
-                variations = client.get_product_variations(woo_id)
-                site_variations = [
-                    {
-                        'id': v['id'],
-                        'sku': v.get('sku', ''),
-                        'attributes': v.get('attributes', []),
-                        'regular_price': v.get('regular_price', ''),
-                        'sale_price': v.get('sale_price', ''),
-                        'stock_quantity': v.get('stock_quantity'),
-                        'stock_status': v.get('stock_status', 'instock'),
-                    }
-                    for v in variations
-                ]
+                site_variations = build_site_variations(client.get_product_variations(woo_id))
             except Exception as e:
                 logger.warning(f"[{sku}] 获取变体失败: {e}")
         
@@ -221,18 +856,150 @@ def fetch_product_from_woo(
         return {'sku': sku, 'success': False, 'error': str(e)}
 
 
-def batch_update_products(supabase: Client, updates: List[Dict], site: str):
-    """批量更新商品到数据库"""
+class SkuLocks:
+    """
+    按 SKU 集合加锁：upsert 模式的「读取-合并-写入」只需要与包含相同 SKU 的批次互斥（多站点并发写入同一商品时），
+    SKU 不相交的批次（同一站点的不同批次）可以并行写入。
+    整批 SKU 全部空闲时才一次性占用，不会死锁；只在本实例内有效，分片等多实例写入应使用 rpc 模式
+    """
+    
+    def __init__(self):
+        self._held = set()
+        self._cond = threading.Condition()
+    
+    @contextmanager
+    def hold(self, skus):
+        skus = set(skus)
+        with self._cond:
+            while not self._held.isdisjoint(skus):
+                self._cond.wait()
+            self._held |= skus
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._held -= skus
+                self._cond.notify_all()
+
+
+# 数据库写入锁：串行化包含相同 SKU 的「读取-合并-写入」，避免各站点互相覆盖 JSONB 字段
+write_locks = SkuLocks()
+
+
+def batch_update_products(supabase: Client, updates: List[Dict], site: str, metrics: Optional[SyncMetrics] = None):
+    """批量更新商品到数据库（有 metrics 时记录 read_existing / upsert 阶段耗时）"""
     if not updates:
         return
     
-    logger.info(f"📝 批量写入 {len(updates)} 个商品...")
+    logger.info(f"📝 [{site}] 批量写入 {len(updates)} 个商品...")
+    
+    if SYNC_WRITE_MODE == 'rpc':
+        with metrics_phase(metrics, 'upsert'):
+            batch_merge_products(supabase, updates)
+    else:
+        patches = merge_patches(updates)
+        with write_locks.hold(patch['sku'] for patch in patches):
+            _merge_and_upsert(supabase, patches, metrics)
+    logger.info(f"✅ [{site}] 批量写入完成")
+
+
+def merge_patches(updates: List[Dict]) -> List[Dict]:
+    """同一批次内重复的 SKU（例如多个站点的同一商品）先在本地合并，避免一条语句多次更新同一行"""
+    patches: Dict[str, Dict] = {}
+    for update in updates:
+        patch = patches.setdefault(update['sku'], {})
+        for key, value in update.items():
+            if isinstance(value, dict) and isinstance(patch.get(key), dict):
+                patch[key] = {**patch[key], **value}
+            else:
+                patch[key] = value
+    return list(patches.values())
+
+
+def postgrest_session(supabase: Client):
+    """
+    supabase 客户端的 PostgREST 会话（httpx.Client，base_url 为 /rest/v1/，已带认证头）。
+    这是 supabase-py 的私有属性：取不到或不是可用的 httpx 会话时（内存替身、supabase-py 版本变化）返回 None
+    """
+    try:
+        session = supabase.postgrest.session
+    except AttributeError:
+        return None
+    return session if callable(getattr(session, 'post', None)) else None
+
+
+def postgrest_columns(rows: List[Dict[str, Any]]) -> str:
+    """
+    批量写入的 columns 查询参数：所有行的键的并集（与 postgrest-py 的 _unique_columns 相同）。
+    PostgREST 要求批量请求体中各对象的键完全一致（PGRST102），带上 columns 后缺少的键按 NULL 处理
+    """
+    return ','.join(f'"{key}"' for key in sorted({key for row in rows for key in row}))
+
+
+class PostgrestWriter:
+    """
+    PostgREST 写入适配器
+    有 PostgREST 会话时用 codec 编码请求体直接 POST（supabase-py 用标准库 json 编码），upsert 不回传写入的行；
+    没有会话时回退到 supabase.table(...).upsert / supabase.rpc，写入语义相同。
+    失败时与 supabase-py 一样抛出 APIError
+    """
+    
+    def __init__(self, supabase: Client):
+        self.supabase = supabase
+        self.session = postgrest_session(supabase)
+    
+    def upsert(self, table: str, rows: List[Dict[str, Any]], on_conflict: str):
+        if self.session is None:
+            self.supabase.table(table).upsert(rows, on_conflict=on_conflict).execute()
+            return
+        self._post(
+            table, rows,
+            prefer='resolution=merge-duplicates,return=minimal',
+            params={'on_conflict': on_conflict, 'columns': postgrest_columns(rows)},
+        )
+    
+    def rpc(self, name: str, params: Dict[str, Any]) -> Any:
+        if self.session is None:
+            return self.supabase.rpc(name, params).execute().data
+        return self._post(f'rpc/{name}', params)
+    
+    def _post(self, path: str, payload: Any, prefer: Optional[str] = None, params: Optional[Dict[str, str]] = None) -> Any:
+        """POST 到 /rest/v1/ 下的 path，返回解码后的响应体"""
+        headers = {'Content-Type': 'application/json'}
+        if prefer:
+            headers['Prefer'] = prefer
+        response = self.session.post(path, params=params, content=codec.dumps(payload), headers=headers)
+        body = codec.loads(response.content) if response.content else None
+        if not response.is_success:
+            from postgrest.exceptions import APIError
+            raise APIError(body if isinstance(body, dict) else {'message': response.text, 'code': str(response.status_code)})
+        return body
+
+
+def batch_merge_products(supabase: Client, updates: List[Dict]) -> int:
+    """
+    通过 merge_product_patches RPC 批量写入
+    各站点字段在数据库内用 jsonb || 原子合并，一次往返，不回传现有的 content/variations，
+    多个站点并发写入同一 SKU 也不会互相覆盖
+    """
+    return PostgrestWriter(supabase).rpc('merge_product_patches', {'patches': merge_patches(updates)}) or 0
+
+
+def _merge_and_upsert(supabase: Client, updates: List[Dict], metrics: Optional[SyncMetrics] = None):
+    """
+    读取现有数据，合并各站点字段后 upsert
+    只读取和改写批次中出现的 SITE_MERGE_KEYS 列：价格/库存同步的批次只涉及 PRICE_STOCK_KEYS 和变体列，
+    不回传也不改写 content 等整列数据
+    """
+    present = {key for update in updates for key in update}
+    merge_keys = [key for key in SITE_MERGE_KEYS if key in present]
+    # 批量写入的各行列必须一致：只写变体缓存标记的行没有共享字段，沿用现有值
+    shared_keys = [key for key in SHARED_PRODUCT_KEYS if key in present]
     
     # 获取所有 SKU 的现有数据
     skus = [u['sku'] for u in updates]
-    existing_result = supabase.table('products').select(
-        'sku, prices, regular_prices, stock_quantities, stock_statuses, statuses, content, sync_status, variations, variation_counts'
-    ).in_('sku', skus).execute()
+    with metrics_phase(metrics, 'read_existing'):
+        existing_result = supabase.table('products').select(', '.join(['sku', *merge_keys, *shared_keys])).in_('sku', skus).execute()
     
     existing_map = {p['sku']: p for p in (existing_result.data or [])}
     
@@ -245,35 +1012,120 @@ def batch_update_products(supabase: Client, updates: List[Dict], site: str):
         sku = update['sku']
         existing = existing_map.get(sku, {})
         
-        merged = {
-            'sku': sku,
-            'prices': {**safe_dict(existing.get('prices')), **update.get('prices', {})},
-            'regular_prices': {**safe_dict(existing.get('regular_prices')), **update.get('regular_prices', {})},
-            'stock_quantities': {**safe_dict(existing.get('stock_quantities')), **update.get('stock_quantities', {})},
-            'stock_statuses': {**safe_dict(existing.get('stock_statuses')), **update.get('stock_statuses', {})},
-            'statuses': {**safe_dict(existing.get('statuses')), **update.get('statuses', {})},
-            'content': {**safe_dict(existing.get('content')), **update.get('content', {})},
-            'sync_status': {**safe_dict(existing.get('sync_status')), **update.get('sync_status', {})},
-            'variations': {**safe_dict(existing.get('variations')), **update.get('variations', {})},
-            'variation_counts': {**safe_dict(existing.get('variation_counts')), **update.get('variation_counts', {})},
-            'last_synced_at': update.get('last_synced_at'),
-        }
+        merged = {'sku': sku}
+        for key in merge_keys:
+            merged[key] = {**safe_dict(existing.get(key)), **update.get(key, {})}
+        merged['last_synced_at'] = update.get('last_synced_at')
         
         # 如果有共享字段（name, images, categories, attributes），也加上
-        if 'name' in update:
-            merged['name'] = update['name']
-        if 'images' in update:
-            merged['images'] = update['images']
-        if 'categories' in update:
-            merged['categories'] = update['categories']
-        if 'attributes' in update:
-            merged['attributes'] = update['attributes']
+        for key in shared_keys:
+            merged[key] = update[key] if key in update else existing.get(key)
         
         final_updates.append(merged)
     
-    # 批量 upsert
-    supabase.table('products').upsert(final_updates, on_conflict='sku').execute()
-    logger.info(f"✅ 批量写入完成")
+    # 批量 upsert（不回传写入的行）
+    with metrics_phase(metrics, 'upsert'):
+        PostgrestWriter(supabase).upsert('products', final_updates, on_conflict='sku')
+
+
+class BatchWriter:
+    """
+    写后缓冲（write-behind）
+    add() 把结果攒成 batch_size 个一批放入有界队列，由 workers 个写入线程并行调用 batch_update_products；
+    队列满时 add()/put_batch() 阻塞，对上游的获取线程形成背压。
+    失败的批次按 1, 2, 4 秒退避重试，仍失败则记入 dead_letter，不中断同步。
+    传入 fingerprints（ContentFingerprints）时只写入内容有变化的商品，传入 metrics（SyncMetrics）时记录写入阶段耗时。
+    upsert 写入模式下只有包含相同 SKU 的批次互斥（见 SkuLocks），同一站点的批次并行写入。
+    drain() 等待已放入的批次全部写完，可恢复同步据此保证检查点不会超前于已写入的数据
+    """
+    
+    def __init__(self, supabase: Client, site: str, workers: int = WRITER_WORKERS, batch_size: int = WRITE_BATCH_SIZE, max_retries: int = WRITE_MAX_RETRIES, fingerprints: Optional['ContentFingerprints'] = None, metrics: Optional[SyncMetrics] = None):
+        self.supabase = supabase
+        self.site = site
+        self.fingerprints = fingerprints
+        self.metrics = metrics
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.dead_letter: List[Dict[str, Any]] = []
+        self.stats = {'written': 0, 'batches': 0, 'retries': 0}
+        self._batch: List[Dict] = []
+        self._queue = queue.Queue(maxsize=workers * 2)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._threads = [threading.Thread(target=self._run, daemon=True) for _ in range(workers)]
+        for thread in self._threads:
+            thread.start()
+    
+    def add(self, update: Dict):
+        """加入一条待写入的商品数据，攒满一批后放入写入队列（只能由单个线程调用）"""
+        if self.fingerprints and not self.fingerprints.changed(update):
+            return
+        self._batch.append(update)
+        if len(self._batch) >= self.batch_size:
+            batch, self._batch = self._batch, []
+            self._enqueue(batch)
+    
+    def put_batch(self, batch: List[Dict]):
+        """直接放入一个完整批次（队列满时阻塞）"""
+        if self.fingerprints:
+            batch = self.fingerprints.filter(batch)
+        self._enqueue(batch)
+    
+    def _enqueue(self, batch: List[Dict]):
+        if batch:
+            self._queue.put(batch)
+    
+    def _run(self):
+        while True:
+            batch = self._queue.get()
+            try:
+                if batch is None:
+                    return
+                self._write(batch)
+            finally:
+                self._queue.task_done()
+    
+    def drain(self):
+        """写入当前未满的批次，并等待队列中所有批次写入完成（成功或进入死信列表）"""
+        batch, self._batch = self._batch, []
+        self._enqueue(batch)
+        self._queue.join()
+    
+    def _write(self, batch: List[Dict]):
+        for attempt in range(self.max_retries):
+            try:
+                batch_update_products(self.supabase, batch, self.site, self.metrics)
+                with self._lock:
+                    self.stats['written'] += len(batch)
+                    self.stats['batches'] += 1
+                return
+            except Exception as e:
+                if attempt < self.max_retries - 1:
+                    wait_time = 2 ** attempt
+                    logger.warning(f"[{self.site}] 批量写入失败: {e}，{wait_time}秒后重试 ({attempt + 1}/{self.max_retries})")
+                    with self._lock:
+                        self.stats['retries'] += 1
+                    time.sleep(wait_time)
+                else:
+                    logger.error(f"❌ [{self.site}] 批量写入 {len(batch)} 个商品失败，放入死信列表: {e}")
+                    with self._lock:
+                        self.dead_letter.append({'skus': [u['sku'] for u in batch], 'error': str(e)})
+    
+    def close(self, discard_pending: bool = False) -> Dict[str, Any]:
+        """写入最后一个未满的批次（取消时丢弃），等待写入线程清空队列，返回写入统计"""
+        if not self._closed:
+            self._closed = True
+            if not discard_pending:
+                self._enqueue(self._batch)
+            self._batch = []
+            for _ in self._threads:
+                self._queue.put(None)
+            for thread in self._threads:
+                thread.join()
+        return {**self.stats, 'dead_letter': self.dead_letter}
+    
+    def dead_letter_count(self) -> int:
+        return sum(len(entry['skus']) for entry in self.dead_letter)
 
 
 # 保留旧函数用于单个商品同步
@@ -290,11 +1142,11 @@ def pull_product_from_site(
     return result
 
 
-def update_progress(supabase: Client, site: str, current: int, total: int, success: int, failed: int, status: str = 'running', message: str = ''):
-    """更新同步进度到数据库"""
+def update_progress(supabase: Client, site: str, current: int, total: int, success: int, failed: int, status: str = 'running', message: str = '', progress_id: str = 'current'):
+    """更新同步进度到数据库（并发模式下每个站点使用独立的 progress_id）"""
     try:
         supabase.table('sync_progress').upsert({
-            'id': 'current',
+            'id': progress_id,
             'status': status,
             'site': site,
             'current': current,
@@ -308,23 +1160,190 @@ def update_progress(supabase: Client, site: str, current: int, total: int, succe
         logger.warning(f"更新进度失败: {e}")
 
 
-def check_if_cancelled(supabase: Client) -> bool:
-    """检查是否被用户取消"""
+def aggregate_progress(supabase: Client, site: str, progress_ids: List[str], message: str, total: Optional[int] = None):
+    """
+    把多个进度行（各站点或各分片）的计数汇总写入 'current' 行，前端只订阅 'current' 行；
+    total 为空时取各行 total 之和。用户已取消时不再覆盖 'current' 行，各进度行会各自检测到取消
+    """
+    if check_if_cancelled(supabase):
+        return
+    try:
+        rows = supabase.table('sync_progress').select('current,total,success,failed').in_('id', progress_ids).execute().data or []
+        update_progress(
+            supabase, site,
+            sum(r.get('current') or 0 for r in rows),
+            sum(r.get('total') or 0 for r in rows) if total is None else total,
+            sum(r.get('success') or 0 for r in rows), sum(r.get('failed') or 0 for r in rows),
+            'running', message,
+        )
+    except Exception as e:
+        logger.warning(f"[{site}] 汇总进度失败: {e}")
+
+
+def check_if_cancelled(supabase: Client, progress_id: str = 'current') -> bool:
+    """检查是否被用户取消（站点进度行或总进度行 'current' 任一被取消即视为取消）"""
     try:
-        result = supabase.table('sync_progress').select('status').eq('id', 'current').single().execute()
-        return result.data and result.data.get('status') == 'cancelled'
+        ids = list({'current', progress_id})
+        result = supabase.table('sync_progress').select('status').in_('id', ids).execute()
+        return any(row.get('status') == 'cancelled' for row in (result.data or []))
     except:
         return False
 
 
-def get_all_products(supabase: Client) -> List[Dict]:
+class ProgressReporter:
+    """
+    后台进度心跳
+    - report() 只在内存中记录最新进度，后台线程每 interval 秒最多写入一次（合并中间进度）
+    - 同时轮询取消标志，写入共享的 cancelled 事件，工作线程检查事件不产生数据库请求
+    - close() 停止心跳并写入最终状态
+    """
+    
+    def __init__(self, supabase: Client, site: str, progress_id: str = 'current', interval: Optional[float] = None):
+        self.supabase = supabase
+        self.site = site
+        self.progress_id = progress_id
+        self.interval = PROGRESS_INTERVAL if interval is None else interval
+        self.cancelled = threading.Event()
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._pending: Optional[Tuple[int, int, int, int, str]] = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+    
+    def start(self) -> 'ProgressReporter':
+        self._thread.start()
+        return self
+    
+    def report(self, current: int, total: int, success: int, failed: int, message: str = ''):
+        """记录最新进度（不访问数据库）"""
+        with self._lock:
+            self._pending = (current, total, success, failed, message)
+    
+    def is_cancelled(self) -> bool:
+        return self.cancelled.is_set()
+    
+    def _beat(self):
+        if not self.cancelled.is_set() and check_if_cancelled(self.supabase, self.progress_id):
+            self.cancelled.set()
+            logger.warning(f"[{self.site}] 检测到取消请求，停止同步")
+        with self._lock:
+            pending, self._pending = self._pending, None
+        # 已取消时不再写入 running，避免覆盖用户写入的 cancelled 状态
+        if pending and not self.cancelled.is_set():
+            current, total, success, failed, message = pending
+            update_progress(self.supabase, self.site, current, total, success, failed, 'running', message, progress_id=self.progress_id)
+    
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self._beat()
+    
+    def close(self, status: str, current: int, total: int, success: int, failed: int, message: str = ''):
+        """停止心跳并写入最终状态"""
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        update_progress(self.supabase, self.site, current, total, success, failed, status, message, progress_id=self.progress_id)
+
+
+def get_sync_watermark(supabase: Client, site: str) -> Optional[str]:
+    """获取站点增量同步水位线（上次同步到的最大 date_modified_gmt）"""
+    try:
+        result = supabase.table('sync_watermarks').select('modified_after').eq('site', site).execute()
+        if result.data:
+            return result.data[0].get('modified_after')
+    except Exception as e:
+        logger.warning(f"[{site}] 读取水位线失败: {e}")
+    return None
+
+
+def save_sync_watermark(supabase: Client, site: str, modified_after: str):
+    """保存站点增量同步水位线"""
+    supabase.table('sync_watermarks').upsert({
+        'site': site,
+        'modified_after': modified_after,
+        'updated_at': datetime.utcnow().isoformat(),
+    }, on_conflict='site').execute()
+
+
+# 可以继续的检查点状态（running 表示上次调用被强制终止）
+RESUMABLE_STATUSES = ('running', 'paused', 'error')
+
+
+def get_sync_checkpoint(supabase: Client, site: str) -> Optional[Dict[str, Any]]:
+    """获取站点最近一次可恢复同步的检查点"""
+    try:
+        result = supabase.table('sync_checkpoints').select('*').eq('site', site).execute()
+        if result.data:
+            return result.data[0]
+    except Exception as e:
+        logger.warning(f"[{site}] 读取检查点失败: {e}")
+    return None
+
+
+def save_sync_checkpoint(supabase: Client, checkpoint: Dict[str, Any]):
+    """保存检查点（失败只记录日志，最多导致恢复时重做一个批次）"""
+    try:
+        supabase.table('sync_checkpoints').upsert({
+            **checkpoint,
+            'updated_at': datetime.utcnow().isoformat(),
+        }, on_conflict='site').execute()
+    except Exception as e:
+        logger.warning(f"[{checkpoint['site']}] 保存检查点失败: {e}")
+
+
+def run_status(result: Dict[str, Any]) -> str:
+    """站点同步结果的最终状态"""
+    if result.get('error'):
+        return 'error'
+    if result.get('cancelled'):
+        return 'cancelled'
+    if result.get('paused'):
+        return 'paused'
+    return result.get('status') or 'completed'
+
+
+def record_sync_runs(supabase: Client, action: str, site_results: List[Dict[str, Any]]):
+    """把带 metrics 的站点同步结果写入 sync_runs 运行历史（失败只记录日志）"""
+    rows = [
+        {
+            'site': r['site'],
+            'action': action,
+            'status': run_status(r),
+            'total': r.get('total') or 0,
+            'success': r.get('success') or 0,
+            'failed': r.get('failed') or 0,
+            'duration': r.get('duration'),
+            'metrics': r['metrics'],
+        }
+        for r in site_results if r.get('metrics')
+    ]
+    if not rows:
+        return
+    try:
+        supabase.table('sync_runs').insert(rows).execute()
+    except Exception as e:
+        logger.warning(f"记录同步运行历史失败: {e}")
+
+
+def get_latest_sync_runs(supabase: Client, sites: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """读取各站点最近一次同步运行（用于 Prometheus 抓取）"""
+    runs = []
+    for site in sites or list(SITES.keys()):
+        try:
+            result = supabase.table('sync_runs').select('*').eq('site', site).order('created_at', desc=True).limit(1).execute()
+            runs.extend(result.data or [])
+        except Exception as e:
+            logger.warning(f"[{site}] 读取同步运行历史失败: {e}")
+    return runs
+
+
+def get_all_products(supabase: Client, columns: str = 'sku, woo_ids') -> List[Dict]:
     """获取所有商品（突破 1000 行限制）"""
     all_products = []
     page_size = 1000
     offset = 0
     
     while True:
-        result = supabase.table('products').select('sku, woo_ids').range(offset, offset + page_size - 1).execute()
+        result = supabase.table('products').select(columns).range(offset, offset + page_size - 1).execute()
         if not result.data:
             break
         all_products.extend(result.data)
@@ -335,217 +1354,1402 @@ def get_all_products(supabase: Client) -> List[Dict]:
     return all_products
 
 
-def full_sync_site(supabase: Client, site: str, max_workers: int = 10) -> Dict[str, Any]:
+class VariationCache:
     """
-    全量同步单个站点（两步优化）
-    步骤1: 批量获取主商品 (GET /products?per_page=100)
-    步骤2: 10线程并行获取变体
+    变体缓存
+    products.variation_cache[site] 记录上次获取变体时父商品的 date_modified_gmt 和获取时间；
+    父商品未修改且未超过 ttl 时跳过变体请求，写入数据中不带 variations，数据库保留已存储的 variations[site]
     """
-    logger.info(f"🚀 开始全量同步站点: {site} (并发: {max_workers})")
-    start_time = datetime.utcnow()
     
-    client = WooCommerceClient(site)
+    def __init__(self, site: str, entries: Dict[str, Dict[str, Any]], ttl: float = VARIATION_CACHE_TTL):
+        self.site = site
+        self.entries = entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
     
-    # ==================== 步骤1: 批量获取主商品 ====================
-    update_progress(supabase, site, 0, 0, 0, 0, 'running', f'步骤1: 从 {site} 批量获取商品...')
+    @classmethod
+    def load(cls, supabase: Client, site: str, ttl: float = VARIATION_CACHE_TTL) -> 'VariationCache':
+        """读取站点所有商品的缓存标记（只读 sku 和 variation_cache，不读变体本身）"""
+        entries = {}
+        try:
+            for row in get_all_products(supabase, 'sku, variation_cache'):
+                entry = (row.get('variation_cache') or {}).get(site)
+                if entry:
+                    entries[row['sku']] = entry
+        except Exception as e:
+            logger.warning(f"[{site}] 读取变体缓存失败，本次获取全部变体: {e}")
+        logger.info(f"🗃️ [{site}] 变体缓存: {len(entries)} 个商品")
+        return cls(site, entries, ttl)
     
-    try:
-        woo_products = client.get_all_products()
+    def is_cached(self, sku: str, modified: Optional[str]) -> bool:
+        """父商品修改时间与缓存一致且未过期时返回 True（不计入命中统计）"""
+        entry = self.entries.get(sku)
+        if not entry or not modified or entry.get('modified') != modified:
+            return False
+        try:
+            age = (datetime.utcnow() - datetime.fromisoformat(entry['fetched_at'])).total_seconds()
+        except (KeyError, TypeError, ValueError):
+            return False
+        return age < self.ttl
+    
+    def is_fresh(self, sku: str, modified: Optional[str]) -> bool:
+        """同 is_cached，并计入命中/未命中统计"""
+        fresh = self.is_cached(sku, modified)
+        with self._lock:
+            if fresh:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return fresh
+    
+    @staticmethod
+    def entry(modified: Optional[str]) -> Dict[str, Any]:
+        """本次获取变体后写入的缓存标记"""
+        return {'modified': modified, 'fetched_at': datetime.utcnow().isoformat()}
+    
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+def load_variation_cache(supabase: Client, site: str, price_stock_only: bool = False, refresh_variations: bool = False, metrics: Optional[SyncMetrics] = None) -> Optional[VariationCache]:
+    """价格/库存同步和强制刷新时不使用变体缓存（变体库存正是要同步的内容）；读取耗时计入 read_existing 阶段"""
+    if price_stock_only or refresh_variations:
+        return None
+    with metrics_phase(metrics, 'read_existing'):
+        return VariationCache.load(supabase, site)
+
+
+def change_score(stats: Optional[Dict[str, Any]], now: datetime) -> float:
+    """change_stats 中单个站点的变化分数按 REFRESH_HALF_LIFE 衰减到 now 的值"""
+    if not stats or not stats.get('changed_at'):
+        return 0.0
+    age = max((now - datetime.fromisoformat(stats['changed_at'])).total_seconds(), 0)
+    return float(stats.get('score') or 0) * 0.5 ** (age / REFRESH_HALF_LIFE)
+
+
+class ContentFingerprints:
+    """
+    内容指纹
+    products.content_hashes[site] 按字段记录上次写入值的哈希：{字段: 哈希}；
+    本次提取的字段哈希与已存储的一致时跳过写入（不改写 content/variations，也不更新 last_synced_at）。
+    按字段比较，价格/库存同步和变体缓存命中（不带 variations）时只比较本次带上的字段。
+    已记录过的字段哈希发生变化时，同时更新 products.change_stats[site] 的变化分数（分层刷新据此分层）
+    """
+    
+    def __init__(self, site: str, hashes: Dict[str, Dict[str, str]], change_stats: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.site = site
+        self.hashes = hashes
+        self.change_stats = change_stats or {}
+        self.changed_count = 0
+        self.unchanged_count = 0
+        self.marker_only_count = 0
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def from_rows(cls, site: str, rows: List[Dict[str, Any]]) -> 'ContentFingerprints':
+        """从带 content_hashes / change_stats 列的商品行中取出站点的指纹和变化分数"""
+        hashes, change_stats = {}, {}
+        for row in rows:
+            site_hashes = (row.get('content_hashes') or {}).get(site)
+            if site_hashes:
+                hashes[row['sku']] = site_hashes
+            site_stats = (row.get('change_stats') or {}).get(site)
+            if site_stats:
+                change_stats[row['sku']] = site_stats
+        return cls(site, hashes, change_stats)
+    
+    @classmethod
+    def load(cls, supabase: Client, site: str) -> 'ContentFingerprints':
+        """读取站点所有商品已存储的字段哈希和变化分数"""
+        try:
+            fingerprints = cls.from_rows(site, get_all_products(supabase, 'sku, content_hashes, change_stats'))
+        except Exception as e:
+            logger.warning(f"[{site}] 读取内容指纹失败，本次写入全部商品: {e}")
+            fingerprints = cls(site, {})
+        logger.info(f"🔏 [{site}] 内容指纹: {len(fingerprints.hashes)} 个商品")
+        return fingerprints
+    
+    def field_hashes(self, update: Dict[str, Any]) -> Dict[str, str]:
+        """计算写入数据中各字段（站点字段只取本站点的值）的哈希"""
+        hashes = {}
+        for key, value in update.items():
+            if key in FINGERPRINT_IGNORED_KEYS:
+                continue
+            if key not in SHARED_PRODUCT_KEYS and isinstance(value, dict):
+                value = value.get(self.site)
+            encoded = json.dumps(value, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+            hashes[key] = hashlib.blake2b(encoded.encode(), digest_size=8).hexdigest()
+        return hashes
+    
+    def changed(self, update: Dict[str, Any]) -> bool:
+        """
+        判断是否需要写入；需要写入时在 update 中带上新的 content_hashes。
+        内容未变化但带新变体缓存标记（缓存过期后重新获取了变体）的商品也要写入，否则过期的标记无法刷新：
+        这时把 update 裁剪为 {sku, variation_cache, last_synced_at}，只写标记，单独计入 marker_only
+        """
+        hashes = self.field_hashes(update)
+        stored = self.hashes.get(update['sku']) or {}
+        changed = any(stored.get(key) != value for key, value in hashes.items())
+        if not changed and 'variation_cache' in update:
+            marker = {key: update[key] for key in ('sku', 'variation_cache', 'last_synced_at') if key in update}
+            update.clear()
+            update.update(marker)
+            with self._lock:
+                self.marker_only_count += 1
+            return True
+        if changed:
+            # content_hashes 按站点整体覆盖，保留本次未带上的字段的哈希
+            update['content_hashes'] = {self.site: {**stored, **hashes}}
+        if any(key in stored and stored[key] != value for key, value in hashes.items()):
+            # 内容确实变化（首次记录的字段不算）：衰减后的分数加 1
+            now = datetime.utcnow()
+            score = change_score(self.change_stats.get(update['sku']), now) + 1
+            update['change_stats'] = {self.site: {'score': round(score, 4), 'changed_at': now.isoformat()}}
+        with self._lock:
+            if changed:
+                self.changed_count += 1
+            else:
+                self.unchanged_count += 1
+        return changed
+    
+    def filter(self, updates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """只保留需要写入的商品"""
+        return [update for update in updates if self.changed(update)]
+    
+    def stats(self) -> Dict[str, int]:
+        return {'changed': self.changed_count, 'unchanged': self.unchanged_count, 'marker_only': self.marker_only_count}
+
+
+def load_content_fingerprints(supabase: Client, site: str, force_write: bool = False, metrics: Optional[SyncMetrics] = None) -> ContentFingerprints:
+    """
+    force_write 时不读取已存储的指纹，写入全部商品并重新记录指纹
+    （商品被其他途径直接修改、数据库与指纹不一致时用于纠正）；读取耗时计入 read_existing 阶段
+    """
+    if force_write:
+        return ContentFingerprints(site, {})
+    with metrics_phase(metrics, 'read_existing'):
+        return ContentFingerprints.load(supabase, site)
+
+
+@functools.lru_cache(maxsize=1024)
+def attribute_key(name: str) -> Optional[str]:
+    """归一化 WooCommerce 属性名并查找对应的 attributes 键（不认识的属性返回 None）；全站属性名只有几十种，结果记忆化"""
+    return ATTRIBUTE_KEYS.get(name.lower().replace(' ', ''))
+
+
+class ProductTransformer:
+    """
+    WooCommerce 商品 → products 写入数据（不含变体）的转换，各同步路径和 fetch_product_from_woo 共用
+    transform_page 一次遍历整页商品：整页共用一个 last_synced_at 时间戳，transform 阶段整页计时一次；
+    属性名经 attribute_key 的记忆化查找表归一化，不再逐个属性走 if/elif 判断
+    price_stock_only: 只生成价格/库存/状态（PRICE_STOCK_KEYS），不触碰内容和共享字段
+    """
+    
+    def __init__(self, site: str, price_stock_only: bool = False, metrics: Optional[SyncMetrics] = None):
+        self.site = site
+        self.price_stock_only = price_stock_only
+        self.metrics = metrics
+        # 主站点 (com) 同时更新共享数据
+        self.shared = site == 'com' and not price_stock_only
+    
+    def transform(self, woo_product: Dict[str, Any], synced_at: Optional[str] = None) -> Dict[str, Any]:
+        """转换单个商品"""
+        site = self.site
+        get = woo_product.get
+        price = get('price')
+        update_data = {
+            'sku': get('sku', ''),
+            'prices': {site: float(get('sale_price') or price or 0)},
+            'regular_prices': {site: float(get('regular_price') or price or 0)},
+            'stock_quantities': {site: get('stock_quantity') or 100},
+            'stock_statuses': {site: get('stock_status', 'instock')},
+            'statuses': {site: get('status', 'publish')},
+            'last_synced_at': synced_at or datetime.utcnow().isoformat(),
+        }
+        if self.price_stock_only:
+            return update_data
+        
+        update_data['content'] = {
+            site: {
+                'name': get('name', ''),
+                'description': get('description', ''),
+                'short_description': get('short_description', ''),
+            }
+        }
+        update_data['sync_status'] = {site: 'synced'}
+        update_data['woo_ids'] = {site: get('id')}
+        
+        if self.shared:
+            update_data['name'] = get('name', '')
+            update_data['images'] = [img['src'] for img in get('images', [])]
+            update_data['categories'] = [c['name'] for c in get('categories', [])]
+            
+            attributes = {}
+            for attr in get('attributes', []):
+                key = attribute_key(attr.get('name', '') or '')
+                if key is None:
+                    continue
+                if key in MULTI_VALUE_ATTRIBUTES:
+                    attributes[key] = attr.get('options', [])
+                else:
+                    options = attr.get('options')
+                    attributes[key] = options[0] if options else ''
+            if attributes:
+                update_data['attributes'] = attributes
+        
+        return update_data
+    
+    def transform_page(self, products: List[Dict[str, Any]]) -> List[Any]:
+        """
+        转换一页商品，返回与 products 一一对应的写入数据
+        没有 SKU 的商品对应 None（由 process_woo_product 跳过）；
+        转换失败的商品记录日志并对应异常对象，由 process_woo_product 计为失败
+        """
+        synced_at = datetime.utcnow().isoformat()
+        updates = []
+        with metrics_phase(self.metrics, 'transform'):
+            for woo_product in products:
+                update_data = None
+                sku = woo_product.get('sku')
+                if sku:
+                    try:
+                        update_data = self.transform(woo_product, synced_at)
+                    except Exception as e:
+                        logger.error(f"❌ [{sku}] 处理失败: {e}")
+                        update_data = e
+                updates.append(update_data)
+        return updates
+
+
+def build_product_update(woo_product: Dict[str, Any], site: str, price_stock_only: bool = False) -> Dict[str, Any]:
+    """
+    从 WooCommerce 商品提取写入数据（不含变体），整页商品请用 ProductTransformer.transform_page
+    price_stock_only: 只保留价格/库存/状态（PRICE_STOCK_KEYS），不触碰内容和共享字段
+    """
+    return ProductTransformer(site, price_stock_only).transform(woo_product)
+
+
+def build_site_variations(variations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """提取单个站点的变体数据"""
+    return [
+        {
+            'id': v['id'],
+            'sku': v.get('sku', ''),
+            'attributes': v.get('attributes', []),
+            'regular_price': v.get('regular_price', ''),
+            'sale_price': v.get('sale_price', ''),
+            'stock_quantity': v.get('stock_quantity'),
+            'stock_status': v.get('stock_status', 'instock'),
+        }
+        for v in variations
+    ]
+
+
+class VariationHarvester:
+    """
+    批量获取一组商品的变体
+    需要获取变体的可变商品（变体缓存命中的除外）每 VARIATION_BULK_PARENTS 个分成一组，
+    组内第一个调用 get() 的线程用一个请求取回整组的变体（见 get_variations_bulk），组内其他线程等待并复用结果；
+    站点不支持批量列出变体或该组请求失败时 get() 返回 None，由调用方逐个获取
+    """
+    
+    def __init__(self, client: WooCommerceClient, products: List[Dict[str, Any]], variation_cache: Optional[VariationCache] = None):
+        self.client = client
+        parent_ids = [
+            p['id'] for p in products
+            if p.get('type') == 'variable' and p.get('sku')
+            and not (variation_cache and variation_cache.is_cached(p['sku'], p.get('date_modified_gmt')))
+        ]
+        self._chunks = [parent_ids[i:i + VARIATION_BULK_PARENTS] for i in range(0, len(parent_ids), VARIATION_BULK_PARENTS)]
+        self._chunk_of = {pid: index for index, chunk in enumerate(self._chunks) for pid in chunk}
+        self._locks = [threading.Lock() for _ in self._chunks]
+        self._results: Dict[int, Optional[Dict[int, List[Dict[str, Any]]]]] = {}
+    
+    def get(self, product_id: int) -> Optional[List[Dict[str, Any]]]:
+        """返回商品的变体；没有批量结果时返回 None"""
+        index = self._chunk_of.get(product_id)
+        if index is None or self.client.bulk_variations is False:
+            return None
+        with self._locks[index]:
+            if index not in self._results:
+                try:
+                    self._results[index] = self.client.get_variations_bulk(self._chunks[index])
+                except Exception as e:
+                    logger.warning(f"[{self.client.site}] 批量获取 {len(self._chunks[index])} 个商品的变体失败，改为逐个获取: {e}")
+                    self._results[index] = None
+            grouped = self._results[index]
+            # 取出后即释放，避免整站变体都留在内存中
+            return grouped.pop(product_id, None) if grouped is not None else None
+
+
+def process_woo_product(client: WooCommerceClient, woo_product: Dict[str, Any], site: str, price_stock_only: bool = False, variation_cache: Optional[VariationCache] = None, harvester: Optional[VariationHarvester] = None, update_data: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """
+    处理单个 WooCommerce 商品（提取数据并获取变体），没有 SKU 时返回 None
+    variation_cache 命中时不请求变体，写入数据不带 variations/variation_counts，保留数据库中已存储的变体；
+    harvester 批量取回了该商品的变体时直接使用，否则单独请求；
+    update_data 为 ProductTransformer.transform_page 整页转换好的写入数据，为空时单独转换，为异常时计为失败
+    """
+    sku = woo_product.get('sku', '')
+    woo_id = woo_product.get('id')
+    
+    if not sku:
+        logger.warning(f"商品 {woo_id} 没有 SKU，跳过")
+        return None
+    if isinstance(update_data, Exception):
+        # transform_page 已记录日志
+        return {'sku': sku, 'success': False, 'error': str(update_data)}
+    
+    try:
+        if update_data is None:
+            with metrics_phase(client.metrics, 'transform'):
+                update_data = build_product_update(woo_product, site, price_stock_only)
+        
+        # 获取变体（如果是可变商品）
+        site_variations = []
+        if woo_product.get('type') == 'variable':
+            modified = woo_product.get('date_modified_gmt')
+            if variation_cache and variation_cache.is_fresh(sku, modified):
+                return {'sku': sku, 'success': True, 'data': update_data}
+            try:
+                variations = harvester.get(woo_id) if harvester else None
+                if variations is None:
+                    variations = client.get_product_variations(woo_id)
+                with metrics_phase(client.metrics, 'transform'):
+                    site_variations = build_site_variations(variations)
+                if variation_cache:
+                    update_data['variation_cache'] = {site: VariationCache.entry(modified)}
+            except Exception as e:
+                logger.warning(f"[{sku}] 获取变体失败: {e}")
+        
+        update_data['variations'] = {site: site_variations}
+        update_data['variation_counts'] = {site: len(site_variations)}
+        
+        return {'sku': sku, 'success': True, 'data': update_data}
+        
+    except Exception as e:
+        logger.error(f"❌ [{sku}] 处理失败: {e}")
+        return {'sku': sku, 'success': False, 'error': str(e)}
+
+
+def create_site_client(site: str, max_workers: int, price_stock_only: bool = False, adaptive: bool = False) -> Tuple[WooCommerceClient, Optional[AdaptiveConcurrency], int]:
+    """
+    创建同步用的 WooCommerce 客户端（带本次运行的 SyncMetrics），返回 (客户端, 自适应并发控制器, 线程数)
+    自适应模式下从 max_workers 起步，返回的线程数为并发上限的最大值（连接池和在途任务的上界），
+    实际线程数由 site_executor 按控制器的当前上限分配
+    """
+    limiter = None
+    workers = max_workers
+    if adaptive:
+        limiter = AdaptiveConcurrency(initial=max_workers, maximum=max(max_workers, ADAPTIVE_MAX_CONCURRENCY))
+        workers = limiter.maximum
+    client = WooCommerceClient(
+        site,
+        pool_size=workers + PAGE_FETCH_WORKERS,
+        product_fields=PRICE_STOCK_FIELDS if price_stock_only else None,
+        limiter=limiter,
+        metrics=SyncMetrics(site),
+    )
+    return client, limiter, workers
+
+
+def full_sync_site(supabase: Client, site: str, max_workers: int = 10, progress_id: str = 'current', modified_after: Optional[str] = None, stream: bool = False, price_stock_only: bool = False, engine: str = 'thread', adaptive: bool = False, resumable: bool = False, time_budget: Optional[float] = None, refresh_variations: bool = False, force_write: bool = False) -> Dict[str, Any]:
+    """
+    全量同步单个站点（两步优化）
+    步骤1: 批量获取主商品 (GET /products?per_page=100)
+    步骤2: 10线程并行获取变体
+
+    progress_id: 进度行 ID，多站点并发同步时每个站点写入自己的进度行
+    modified_after: 增量同步时只处理此 GMT 时间之后修改过的商品
+    stream: 使用流式流水线（见 stream_sync_site），不先加载整个商品目录
+    price_stock_only: 价格/库存快速同步，只请求和写入价格、库存、状态及变体
+    engine: 'thread' 为线程池引擎；'async' 使用 async_engine（asyncio/httpx），max_workers 表示在途请求数
+    adaptive: 自适应并发（仅线程引擎），max_workers 作为起始并发，结果中的 concurrency 为最终稳定的并发数
+    resumable: 可恢复的分段同步（见 resumable_sync_site），time_budget 为本次调用的时间预算（秒）
+    refresh_variations: 忽略变体缓存（见 VariationCache），重新获取所有可变商品的变体
+    force_write: 忽略内容指纹（见 ContentFingerprints），写入所有商品
+    """
+    if resumable:
+        return resumable_sync_site(supabase, site, max_workers, progress_id, modified_after, price_stock_only, adaptive, time_budget, refresh_variations=refresh_variations, force_write=force_write)
+    
+    if engine == 'async':
+        from async_engine import async_sync_site
+        if adaptive:
+            logger.warning(f"[{site}] asyncio 引擎不支持自适应并发，使用固定在途请求数 {max_workers}")
+        return async_sync_site(supabase, site, max_workers, progress_id, modified_after, price_stock_only, refresh_variations, force_write)
+    
+    if stream:
+        return stream_sync_site(supabase, site, max_workers, progress_id, modified_after, price_stock_only, adaptive, refresh_variations, force_write)
+    
+    logger.info(f"🚀 开始全量同步站点: {site} (并发: {max_workers}{', 自适应' if adaptive else ''})")
+    start_time = datetime.utcnow()
+    
+    client, limiter, workers = create_site_client(site, max_workers, price_stock_only, adaptive)
+    
+    # ==================== 步骤1: 批量获取主商品 ====================
+    update_progress(supabase, site, 0, 0, 0, 0, 'running', f'步骤1: 从 {site} 批量获取商品...', progress_id=progress_id)
+    
+    try:
+        woo_products = client.get_all_products(modified_after=modified_after)
     except Exception as e:
         logger.error(f"❌ [{site}] 获取商品列表失败: {e}")
-        update_progress(supabase, site, 0, 0, 0, 0, 'error', f'获取商品列表失败: {e}')
-        return {'site': site, 'total': 0, 'success': 0, 'failed': 0, 'skipped': 0, 'error': str(e)}
+        update_progress(supabase, site, 0, 0, 0, 0, 'error', f'获取商品列表失败: {e}', progress_id=progress_id)
+        return {'site': site, 'total': 0, 'success': 0, 'failed': 0, 'skipped': 0, 'error': str(e), 'metrics': client.metrics.to_dict()}
     
     if not woo_products:
-        logger.warning(f"[{site}] 没有找到商品")
+        if modified_after:
+            logger.info(f"[{site}] {modified_after} 之后没有商品变更")
+            update_progress(supabase, site, 0, 0, 0, 0, 'completed', '没有商品变更', progress_id=progress_id)
+        else:
+            logger.warning(f"[{site}] 没有找到商品")
+            update_progress(supabase, site, 0, 0, 0, 0, 'completed', '没有找到商品', progress_id=progress_id)
+        return {'site': site, 'total': 0, 'success': 0, 'failed': 0, 'skipped': 0, 'watermark': modified_after}
+    
+    total = len(woo_products)
+    # 本次看到的最大修改时间，作为下次增量同步的水位线
+    watermark = max((p.get('date_modified_gmt') or '' for p in woo_products), default='') or modified_after
+    logger.info(f"📦 [{site}] 获取到 {total} 个商品")
+    
+    # 检查取消
+    if check_if_cancelled(supabase, progress_id):
+        update_progress(supabase, site, 0, total, 0, 0, 'cancelled', '用户取消', progress_id=progress_id)
+        return {'site': site, 'total': total, 'success': 0, 'failed': 0, 'skipped': 0, 'cancelled': True}
+    
+    # ==================== 步骤2: 处理商品数据并获取变体 ====================
+    update_progress(supabase, site, 0, total, 0, 0, 'running', f'步骤2: 处理 {total} 个商品，{max_workers}线程获取变体...', progress_id=progress_id)
+    variation_cache = load_variation_cache(supabase, site, price_stock_only, refresh_variations, client.metrics)
+    
+    progress = {'completed': 0, 'success': 0, 'failed': 0, 'cancelled': False}
+    failed_skus = []
+    
+    # 进度写入和取消检查由后台心跳完成，处理循环只更新内存中的计数
+    reporter = ProgressReporter(supabase, site, progress_id).start()
+    # 数据库写入由写后缓冲的写入线程完成，处理循环不等待 upsert
+    fingerprints = load_content_fingerprints(supabase, site, force_write, client.metrics)
+    writer = BatchWriter(supabase, site, fingerprints=fingerprints, metrics=client.metrics)
+    harvester = VariationHarvester(client, woo_products, variation_cache)
+    transformed = ProductTransformer(site, price_stock_only, client.metrics).transform_page(woo_products)
+    final_status = 'error'
+    try:
+        # 多线程并行处理
+        with site_executor(workers, limiter) as executor:
+            futures = {
+                executor.submit(lambda p, u: None if reporter.is_cancelled() else process_woo_product(client, p, site, price_stock_only, variation_cache, harvester, u), p, u): p
+                for p, u in zip(woo_products, transformed)
+            }
+            
+            for future in as_completed(futures):
+                if reporter.is_cancelled():
+                    break
+                    
+                try:
+                    result = future.result()
+                    if result is None:
+                        continue
+                        
+                    with progress_lock:
+                        progress['completed'] += 1
+                        
+                        if result.get('success'):
+                            progress['success'] += 1
+                        else:
+                            progress['failed'] += 1
+                            failed_skus.append(result.get('sku'))
+                    
+                    # 在锁外放入写后缓冲（写入队列满时在这里阻塞，暂停消费结果形成背压）
+                    if result.get('success') and result.get('data'):
+                        writer.add(result['data'])
+                    
+                    # 更新进度（只记录最新值，心跳线程按间隔合并写入）
+                    reporter.report(progress['completed'], total, progress['success'], progress['failed'], f"进度: {progress['completed']}/{total}")
+                    if progress['completed'] % 50 == 0 or progress['completed'] == total:
+                        logger.info(f"[{site}] 进度: {progress['completed']}/{total} (成功: {progress['success']}, 失败: {progress['failed']})")
+                            
+                except Exception as e:
+                    logger.error(f"任务异常: {e}")
+        
+        progress['cancelled'] = reporter.is_cancelled()
+        final_status = 'cancelled' if progress['cancelled'] else 'completed'
+    finally:
+        # 写入剩余数据并等待写入线程完成（取消或异常时丢弃未满的批次）
+        writes = writer.close(discard_pending=final_status != 'completed')
+        # 写入失败的商品计为失败，增量同步不会推进水位线
+        progress['success'] -= writer.dead_letter_count()
+        progress['failed'] += writer.dead_letter_count()
+        duration = (datetime.utcnow() - start_time).total_seconds()
+        message = '同步异常中断' if final_status == 'error' else f'同步完成 ({duration:.1f}s)'
+        reporter.close(final_status, progress['completed'], total, progress['success'], progress['failed'], message)
+    logger.info(f"✅ [{site}] 同步完成: {progress['success']}/{total} 成功, {progress['failed']} 失败 ({duration:.1f}s)")
+    
+    result = {
+        'site': site,
+        'total': total,
+        'success': progress['success'],
+        'failed': progress['failed'],
+        'duration': duration,
+        'cancelled': progress['cancelled'],
+        'watermark': watermark,
+        'writes': {k: v for k, v in writes.items() if k != 'dead_letter'},
+        'dead_letter': writes['dead_letter'],
+    }
+    if variation_cache:
+        result['variation_cache'] = variation_cache.stats()
+    result['changes'] = fingerprints.stats()
+    result['metrics'] = client.metrics.to_dict()
+    if limiter:
+        result['concurrency'] = limiter.stats()
+        logger.info(f"📈 [{site}] 自适应并发: {result['concurrency']}")
+    return result
+
+
+def stream_sync_site(supabase: Client, site: str, max_workers: int = 10, progress_id: str = 'current', modified_after: Optional[str] = None, price_stock_only: bool = False, adaptive: bool = False, refresh_variations: bool = False, force_write: bool = False) -> Dict[str, Any]:
+    """
+    流式同步单个站点（生产者/消费者流水线）
+    商品页 -> 有界页面队列 -> 变体线程池 -> 有界结果队列 -> 汇总线程 -> 写后缓冲（并行写入线程）
+    各阶段重叠执行，内存中只保留少量页面、在途商品和少量写入批次
+    """
+    logger.info(f"🚀 开始流式同步站点: {site} (并发: {max_workers}{', 自适应' if adaptive else ''})")
+    start_time = datetime.utcnow()
+    
+    client, limiter, workers = create_site_client(site, max_workers, price_stock_only, adaptive)
+    variation_cache = load_variation_cache(supabase, site, price_stock_only, refresh_variations, client.metrics)
+    update_progress(supabase, site, 0, 0, 0, 0, 'running', f'流式同步: 从 {site} 获取商品并处理...', progress_id=progress_id)
+    
+    if check_if_cancelled(supabase, progress_id):
+        update_progress(supabase, site, 0, 0, 0, 0, 'cancelled', '用户取消', progress_id=progress_id)
+        return {'site': site, 'total': 0, 'success': 0, 'failed': 0, 'skipped': 0, 'cancelled': True}
+    
+    BATCH_SIZE = 300
+    PAGE_QUEUE_SIZE = 2
+    DONE = object()
+    
+    page_queue = queue.Queue(maxsize=PAGE_QUEUE_SIZE)
+    result_queue = queue.Queue(maxsize=BATCH_SIZE)
+    in_flight = threading.BoundedSemaphore(workers * 2)
+    progress = {'total': 0, 'dispatched': 0, 'completed': 0, 'success': 0, 'failed': 0, 'cancelled': False, 'error': None}
+    reporter = ProgressReporter(supabase, site, progress_id).start()
+    fingerprints = load_content_fingerprints(supabase, site, force_write, client.metrics)
+    batch_writer = BatchWriter(supabase, site, batch_size=BATCH_SIZE, fingerprints=fingerprints, metrics=client.metrics)
+    transformer = ProductTransformer(site, price_stock_only, client.metrics)
+    
+    def produce_pages():
+        """阶段1: 逐页获取商品放入页面队列（队列满时阻塞，形成背压）"""
+        try:
+            for page, products, total in client.iter_product_pages(modified_after):
+                if reporter.is_cancelled():
+                    break
+                page_queue.put((page, products, total))
+        except Exception as e:
+            logger.error(f"❌ [{site}] 获取商品列表失败: {e}")
+            progress['error'] = str(e)
+        finally:
+            page_queue.put(DONE)
+    
+    def process_and_forward(woo_product, harvester, update_data):
+        """阶段2: 获取变体（商品数据已按页转换），结果放入结果队列"""
+        try:
+            result = None if reporter.is_cancelled() else process_woo_product(client, woo_product, site, price_stock_only, variation_cache, harvester, update_data)
+            if result is not None:
+                result_queue.put(result)
+        finally:
+            in_flight.release()
+    
+    def write_results():
+        """阶段3: 汇总结果，放入写后缓冲（每满 BATCH_SIZE 个由写入线程批量写入数据库）"""
+        while True:
+            result = result_queue.get()
+            if result is DONE:
+                break
+            
+            progress['completed'] += 1
+            if result.get('success'):
+                progress['success'] += 1
+                if result.get('data') and not reporter.is_cancelled():
+                    batch_writer.add(result['data'])
+            else:
+                progress['failed'] += 1
+            
+            total = progress['total'] or progress['dispatched']
+            reporter.report(progress['completed'], total, progress['success'], progress['failed'], f"进度: {progress['completed']}/{total}")
+            if progress['completed'] % 50 == 0:
+                logger.info(f"[{site}] 进度: {progress['completed']}/{progress['total'] or '?'} (成功: {progress['success']}, 失败: {progress['failed']})")
+    
+    producer = threading.Thread(target=produce_pages, daemon=True)
+    writer = threading.Thread(target=write_results, daemon=True)
+    producer.start()
+    writer.start()
+    
+    # 主线程负责分发：从页面队列取商品提交到线程池，在途商品数受信号量限制
+    watermark = modified_after
+    with site_executor(workers, limiter) as executor:
+        while True:
+            item = page_queue.get()
+            if item is DONE:
+                break
+            page, products, total = item
+            progress['total'] = total
+            harvester = VariationHarvester(client, products, variation_cache)
+            for woo_product, update_data in zip(products, transformer.transform_page(products)):
+                if reporter.is_cancelled():
+                    break
+                modified = woo_product.get('date_modified_gmt') or ''
+                if modified > (watermark or ''):
+                    watermark = modified
+                in_flight.acquire()
+                progress['dispatched'] += 1
+                executor.submit(process_and_forward, woo_product, harvester, update_data)
+    
+    result_queue.put(DONE)
+    writer.join()
+    producer.join()
+    progress['cancelled'] = reporter.is_cancelled()
+    writes = batch_writer.close(discard_pending=progress['cancelled'])
+    progress['success'] -= batch_writer.dead_letter_count()
+    progress['failed'] += batch_writer.dead_letter_count()
+    
+    total = progress['total'] or progress['dispatched']
+    duration = (datetime.utcnow() - start_time).total_seconds()
+    if progress['error']:
+        final_status, message = 'error', f"获取商品列表失败: {progress['error']}"
+    elif progress['cancelled']:
+        final_status, message = 'cancelled', f'用户取消 ({duration:.1f}s)'
+    else:
+        final_status, message = 'completed', f'同步完成 ({duration:.1f}s)'
+    reporter.close(final_status, progress['completed'], total, progress['success'], progress['failed'], message)
+    logger.info(f"✅ [{site}] 流式同步结束: {progress['success']}/{total} 成功, {progress['failed']} 失败 ({duration:.1f}s)")
+    
+    result = {
+        'site': site,
+        'total': total,
+        'success': progress['success'],
+        'failed': progress['failed'],
+        'duration': duration,
+        'cancelled': progress['cancelled'],
+        'watermark': watermark,
+        'writes': {k: v for k, v in writes.items() if k != 'dead_letter'},
+        'dead_letter': writes['dead_letter'],
+    }
+    if variation_cache:
+        result['variation_cache'] = variation_cache.stats()
+    result['changes'] = fingerprints.stats()
+    result['metrics'] = client.metrics.to_dict()
+    if progress['error']:
+        result['error'] = progress['error']
+    if limiter:
+        result['concurrency'] = limiter.stats()
+        logger.info(f"📈 [{site}] 自适应并发: {result['concurrency']}")
+    return result
+
+
+def resumable_sync_site(
+    supabase: Client,
+    site: str,
+    max_workers: int = 10,
+    progress_id: str = 'current',
+    modified_after: Optional[str] = None,
+    price_stock_only: bool = False,
+    adaptive: bool = False,
+    time_budget: Optional[float] = None,
+    checkpoint: Optional[Dict[str, Any]] = None,
+    refresh_variations: bool = False,
+    force_write: bool = False,
+) -> Dict[str, Any]:
+    """
+    可恢复的分段同步
+    按商品 ID 升序逐页处理，每写入一批就保存检查点（已写入的页码、最大商品 ID、累计计数）；
+    运行超过 time_budget 秒时写完当前批次后暂停，之后通过 resume 动作从检查点继续。
+    函数被强制终止时，恢复后最多重做最近一个未写入的批次
+
+    checkpoint: 要继续的检查点（get_sync_checkpoint 返回值），为空时开始新的运行
+    """
+    resumed = checkpoint is not None
+    if resumed:
+        modified_after = checkpoint.get('modified_after')
+        price_stock_only = bool(checkpoint.get('price_stock_only'))
+    else:
+        checkpoint = {
+            'site': site,
+            'run_id': uuid.uuid4().hex,
+            'last_page': 0,
+            'last_product_id': 0,
+            'total': 0,
+            'success': 0,
+            'failed': 0,
+            'modified_after': modified_after,
+            'watermark': modified_after,
+            'price_stock_only': price_stock_only,
+            'started_at': datetime.utcnow().isoformat(),
+        }
+    checkpoint.update({'status': 'running', 'error': None})
+    time_budget = SYNC_TIME_BUDGET if time_budget is None else time_budget
+    
+    # 从最后写入的一页重新读取并跳过已处理的商品 ID：两次调用之间有商品被删除、分页前移时不会漏掉商品
+    start_page = max(checkpoint['last_page'], 1)
+    last_product_id = checkpoint['last_product_id'] or 0
+    action = '恢复' if resumed else '开始'
+    logger.info(f"🚀 {action}可恢复同步: {site} (运行 {checkpoint['run_id']}, 从第 {start_page} 页, 时间预算 {time_budget:.0f}s)")
+    started = time.monotonic()
+    
+    client, limiter, workers = create_site_client(site, max_workers, price_stock_only, adaptive)
+    variation_cache = load_variation_cache(supabase, site, price_stock_only, refresh_variations, client.metrics)
+    fingerprints = load_content_fingerprints(supabase, site, force_write, client.metrics)
+    save_sync_checkpoint(supabase, checkpoint)
+    update_progress(
+        supabase, site,
+        checkpoint['success'] + checkpoint['failed'], checkpoint['total'],
+        checkpoint['success'], checkpoint['failed'],
+        'running', f'{action}同步: 从第 {start_page} 页继续', progress_id=progress_id,
+    )
+    
+    BATCH_SIZE = 300
+    writer = BatchWriter(supabase, site, batch_size=BATCH_SIZE, fingerprints=fingerprints, metrics=client.metrics)
+    counts = {'success': checkpoint['success'], 'failed': checkpoint['failed'], 'watermark': checkpoint['watermark']}
+    state = {'page': checkpoint['last_page'], 'cancelled': False, 'paused': False, 'error': None, 'dead_letter': 0, 'unflushed': 0}
+    
+    def flush():
+        """等待已放入的批次全部写完（失败的商品计入失败数），然后把检查点推进到已处理的最后一页"""
+        writer.drain()
+        dead_letter = writer.dead_letter_count()
+        counts['success'] -= dead_letter - state['dead_letter']
+        counts['failed'] += dead_letter - state['dead_letter']
+        state.update(dead_letter=dead_letter, unflushed=0)
+        checkpoint.update(counts, last_page=state['page'], last_product_id=last_product_id)
+        save_sync_checkpoint(supabase, checkpoint)
+    
+    reporter = ProgressReporter(supabase, site, progress_id).start()
+    transformer = ProductTransformer(site, price_stock_only, client.metrics)
+    process = lambda p, harvester, update_data: process_woo_product(client, p, site, price_stock_only, variation_cache, harvester, update_data)
+    pages = client.iter_product_pages(modified_after, start_page=start_page, orderby='id')
+    try:
+        with site_executor(workers, limiter) as executor:
+            for page, products, total in pages:
+                checkpoint['total'] = total or checkpoint['total']
+                products = [p for p in products if (p.get('id') or 0) > last_product_id]
+                harvester = VariationHarvester(client, products, variation_cache)
+                for result in executor.map(process, products, [harvester] * len(products), transformer.transform_page(products)):
+                    if result is None:
+                        continue
+                    if result.get('success'):
+                        counts['success'] += 1
+                        state['unflushed'] += 1
+                        writer.add(result['data'])
+                    else:
+                        counts['failed'] += 1
+                for p in products:
+                    last_product_id = max(last_product_id, p.get('id') or 0)
+                    modified = p.get('date_modified_gmt') or ''
+                    if modified > (counts['watermark'] or ''):
+                        counts['watermark'] = modified
+                state['page'] = page
+                
+                out_of_time = time.monotonic() - started >= time_budget
+                if state['unflushed'] >= BATCH_SIZE or out_of_time:
+                    flush()
+                
+                processed = counts['success'] + counts['failed']
+                if reporter.is_cancelled():
+                    state['cancelled'] = True
+                    break
+                if out_of_time:
+                    state['paused'] = True
+                    logger.warning(f"⏸️ [{site}] 达到时间预算 {time_budget:.0f}s，在第 {page} 页后暂停")
+                    break
+                reporter.report(processed, checkpoint['total'], counts['success'], counts['failed'], f"进度: {processed}/{checkpoint['total']} (第 {page} 页)")
+                logger.info(f"[{site}] 第 {page} 页完成: {processed}/{checkpoint['total']} (成功: {counts['success']}, 失败: {counts['failed']})")
+    except Exception as e:
+        logger.error(f"❌ [{site}] 同步中断: {e}")
+        state['error'] = str(e)
+    finally:
+        pages.close()
+    
+    # 取消时丢弃未写入的批次，检查点停留在上次写入的位置
+    if state['cancelled']:
+        status = 'cancelled'
+    else:
+        flush()
+        status = 'error' if state['error'] else 'paused' if state['paused'] else 'completed'
+    writes = writer.close(discard_pending=state['cancelled'])
+    checkpoint.update(status=status, error=state['error'])
+    save_sync_checkpoint(supabase, checkpoint)
+    
+    duration = time.monotonic() - started
+    processed = checkpoint['success'] + checkpoint['failed']
+    message = {
+        'completed': f'同步完成 ({duration:.1f}s)',
+        'paused': f"已暂停，下次从第 {checkpoint['last_page']} 页继续 ({duration:.1f}s)",
+        'cancelled': f'用户取消 ({duration:.1f}s)',
+        'error': f"同步中断，可恢复: {state['error']}",
+    }[status]
+    reporter.close(status, processed, checkpoint['total'], checkpoint['success'], checkpoint['failed'], message)
+    logger.info(f"✅ [{site}] 可恢复同步结束 ({status}): {checkpoint['success']}/{checkpoint['total']} 成功, {checkpoint['failed']} 失败 ({duration:.1f}s)")
+    
+    result = {
+        'site': site,
+        'total': checkpoint['total'],
+        'success': checkpoint['success'],
+        'failed': checkpoint['failed'],
+        'duration': duration,
+        'cancelled': state['cancelled'],
+        'paused': state['paused'],
+        'watermark': checkpoint['watermark'],
+        'run_id': checkpoint['run_id'],
+        'status': status,
+        'last_page': checkpoint['last_page'],
+        'resumed': resumed,
+        'writes': {k: v for k, v in writes.items() if k != 'dead_letter'},
+        'dead_letter': writes['dead_letter'],
+    }
+    if state['error']:
+        result['error'] = state['error']
+    if limiter:
+        result['concurrency'] = limiter.stats()
+    if variation_cache:
+        result['variation_cache'] = variation_cache.stats()
+    result['changes'] = fingerprints.stats()
+    result['metrics'] = client.metrics.to_dict()
+    return result
+
+
+def resume_sync(supabase: Client, sites: Optional[List[str]] = None, max_workers: int = 10, **options) -> Dict[str, Any]:
+    """
+    从检查点继续各站点未完成的可恢复同步（没有可恢复检查点的站点跳过）
+    运行完成且没有失败的商品时，把水位线推进到这次运行的开始时间：
+    运行跨多次调用按商品 ID 分页，开始之后修改的商品可能落在已处理的页面中，不能用已处理商品的最大修改时间。
+    价格/库存同步没有写入内容，不推进水位线（与 price-stock-sync 动作一致）
+    """
+    results = {}
+    for site in sites or list(SITES.keys()):
+        if site not in SITES:
+            logger.warning(f"跳过未知站点: {site}")
+            continue
+        checkpoint = get_sync_checkpoint(supabase, site)
+        if not checkpoint or checkpoint.get('status') not in RESUMABLE_STATUSES:
+            results[site] = {'site': site, 'resumed': False, 'status': (checkpoint or {}).get('status'), 'message': '没有可恢复的同步'}
+            continue
+        results[site] = result = resumable_sync_site(supabase, site, max_workers, checkpoint=checkpoint, **options)
+        if result['status'] == 'completed' and not result['failed'] and checkpoint.get('started_at') and not checkpoint.get('price_stock_only'):
+            # 精确到秒（向下取整），与 date_modified_gmt 的格式一致
+            watermark = checkpoint['started_at'][:19]
+            try:
+                current = get_sync_watermark(supabase, site)
+                if not current or current < watermark:
+                    save_sync_watermark(supabase, site, watermark)
+                    result['watermark'] = watermark
+                    logger.info(f"💾 [{site}] 水位线更新为 {watermark}（可恢复同步开始时间）")
+            except Exception as e:
+                logger.warning(f"[{site}] 保存水位线失败: {e}")
+    
+    return {
+        'success': True,
+        'results': results,
+        # 仍有站点暂停或中断时，调用方应再次调用 resume
+        'pending': [site for site, r in results.items() if r.get('status') in RESUMABLE_STATUSES],
+    }
+
+
+def sync_shard(
+    supabase: Client,
+    site: str,
+    start_page: int,
+    end_page: int,
+    max_workers: int = 10,
+    progress_id: str = 'current',
+    modified_after: Optional[str] = None,
+    price_stock_only: bool = False,
+    adaptive: bool = False,
+    per_page: int = PRODUCTS_PER_PAGE,
+) -> Dict[str, Any]:
+    """
+    同步一个分片：按商品 ID 升序分页，只处理 start_page..end_page（包含）
+    由 coordinate_sharded_sync 分发，每个分片在独立的函数调用中运行，进度写入自己的进度行；
+    per_page 必须与协调器规划分片时的页大小一致，否则分片之间会重叠或遗漏商品
+    """
+    logger.info(f"🧩 [{site}] 分片同步第 {start_page}-{end_page} 页 (并发: {max_workers})")
+    start_time = datetime.utcnow()
+    
+    client, limiter, workers = create_site_client(site, max_workers, price_stock_only, adaptive)
+    client.per_page = per_page
+    variation_cache = load_variation_cache(supabase, site, price_stock_only, metrics=client.metrics)
+    fingerprints = load_content_fingerprints(supabase, site, metrics=client.metrics)
+    shard_total = 0
+    progress = {'completed': 0, 'success': 0, 'failed': 0, 'cancelled': False, 'error': None}
+    watermark = modified_after
+    BATCH_SIZE = 300
+    writer = BatchWriter(supabase, site, batch_size=BATCH_SIZE, fingerprints=fingerprints, metrics=client.metrics)
+    update_progress(supabase, site, 0, 0, 0, 0, 'running', f'分片: 第 {start_page}-{end_page} 页', progress_id=progress_id)
+    reporter = ProgressReporter(supabase, site, progress_id).start()
+    
+    transformer = ProductTransformer(site, price_stock_only, client.metrics)
+    process = lambda p, harvester, update_data: process_woo_product(client, p, site, price_stock_only, variation_cache, harvester, update_data)
+    pages = client.iter_product_pages(modified_after, start_page=start_page, end_page=end_page, orderby='id')
+    try:
+        with site_executor(workers, limiter) as executor:
+            for page, products, total in pages:
+                shard_total += len(products)
+                harvester = VariationHarvester(client, products, variation_cache)
+                for result in executor.map(process, products, [harvester] * len(products), transformer.transform_page(products)):
+                    if result is None:
+                        continue
+                    progress['completed'] += 1
+                    if result.get('success'):
+                        progress['success'] += 1
+                        writer.add(result['data'])
+                    else:
+                        progress['failed'] += 1
+                for p in products:
+                    modified = p.get('date_modified_gmt') or ''
+                    if modified > (watermark or ''):
+                        watermark = modified
+                
+                if reporter.is_cancelled():
+                    progress['cancelled'] = True
+                    break
+                # 分片商品数按页码范围和站点总数估算，取完所有页面前以估算值显示
+                expected = max(0, min((end_page - start_page + 1) * per_page, total - (start_page - 1) * per_page)) if total else 0
+                reporter.report(progress['completed'], max(expected, shard_total), progress['success'], progress['failed'], f"分片第 {page}/{end_page} 页")
+    except Exception as e:
+        logger.error(f"❌ [{site}] 分片同步中断: {e}")
+        progress['error'] = str(e)
+    finally:
+        pages.close()
+    
+    writes = writer.close(discard_pending=progress['cancelled'])
+    progress['success'] -= writer.dead_letter_count()
+    progress['failed'] += writer.dead_letter_count()
+    
+    duration = (datetime.utcnow() - start_time).total_seconds()
+    if progress['error']:
+        final_status, message = 'error', f"分片同步失败: {progress['error']}"
+    elif progress['cancelled']:
+        final_status, message = 'cancelled', f'用户取消 ({duration:.1f}s)'
+    else:
+        final_status, message = 'completed', f'分片完成 ({duration:.1f}s)'
+    reporter.close(final_status, progress['completed'], shard_total, progress['success'], progress['failed'], message)
+    logger.info(f"✅ [{site}] 分片第 {start_page}-{end_page} 页结束: {progress['success']}/{shard_total} 成功, {progress['failed']} 失败 ({duration:.1f}s)")
+    
+    result = {
+        'site': site,
+        'start_page': start_page,
+        'end_page': end_page,
+        'total': shard_total,
+        'success': progress['success'],
+        'failed': progress['failed'],
+        'duration': duration,
+        'cancelled': progress['cancelled'],
+        'watermark': watermark,
+        'writes': {k: v for k, v in writes.items() if k != 'dead_letter'},
+        'dead_letter': writes['dead_letter'],
+    }
+    if progress['error']:
+        result['error'] = progress['error']
+    if limiter:
+        result['concurrency'] = limiter.stats()
+    if variation_cache:
+        result['variation_cache'] = variation_cache.stats()
+    result['changes'] = fingerprints.stats()
+    result['metrics'] = client.metrics.to_dict()
+    return result
+
+
+def plan_shards(total: int, shards: int, per_page: int = PRODUCTS_PER_PAGE) -> List[Tuple[int, int]]:
+    """把 total 个商品的页码范围尽量均匀地切成最多 shards 段，返回 [(起始页, 结束页), ...]"""
+    total_pages = -(-total // per_page)
+    shards = max(1, min(shards, total_pages))
+    size, extra = divmod(total_pages, shards)
+    ranges, start = [], 1
+    for i in range(shards):
+        end = start + size - 1 + (1 if i < extra else 0)
+        ranges.append((start, end))
+        start = end + 1
+    return ranges if total_pages else []
+
+
+def http_shard_dispatcher(function_url: str) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    """通过 HTTP 调用 Cloud Function 的 sync-shard 动作（每个分片是一次独立调用，可分配到不同实例）"""
+    def dispatch(payload: Dict[str, Any]) -> Dict[str, Any]:
+        response = requests.post(function_url, json={'action': 'sync-shard', **payload}, timeout=SHARD_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+    return dispatch
+
+
+def subprocess_shard_dispatcher(command: Optional[List[str]] = None) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    """
+    在本地子进程中运行分片（不依赖 GCP）：执行 command + [分片参数 JSON]，读取 stdout 最后一行的结果 JSON
+    默认 command 为 python main.py --shard
+    """
+    command = command or [sys.executable, os.path.abspath(__file__), '--shard']
+    
+    def dispatch(payload: Dict[str, Any]) -> Dict[str, Any]:
+        completed = subprocess.run(command + [json.dumps(payload)], capture_output=True, text=True, timeout=SHARD_TIMEOUT)
+        if completed.returncode != 0:
+            raise RuntimeError(f"分片进程退出码 {completed.returncode}: {completed.stderr.strip()[-500:]}")
+        return json.loads(completed.stdout.strip().splitlines()[-1])
+    return dispatch
+
+
+def coordinate_sharded_sync(
+    supabase: Client,
+    site: str,
+    shards: int,
+    dispatch: Callable[[Dict[str, Any]], Dict[str, Any]],
+    max_workers: int = 10,
+    modified_after: Optional[str] = None,
+    price_stock_only: bool = False,
+    adaptive: bool = False,
+) -> Dict[str, Any]:
+    """
+    分片协调器：按商品总数把站点切成页码范围，并发分发 sync-shard 调用，
+    等待期间汇总各分片进度行到 'current' 行，最后合并分片结果。
+    失败的分片保留页码范围，可以单独重新调用 sync-shard
+    """
+    logger.info(f"🧭 [{site}] 分片协调: 最多 {shards} 个分片")
+    start_time = datetime.utcnow()
+    
+    client = get_woo_client(site)
+    try:
+        total = client.count_products(modified_after)
+    except Exception as e:
+        logger.error(f"❌ [{site}] 获取商品总数失败: {e}")
+        update_progress(supabase, site, 0, 0, 0, 0, 'error', f'获取商品总数失败: {e}')
+        return {'site': site, 'total': 0, 'success': 0, 'failed': 0, 'error': str(e), 'shards': []}
+    
+    ranges = plan_shards(total, shards, client.per_page)
+    if not ranges:
         update_progress(supabase, site, 0, 0, 0, 0, 'completed', '没有找到商品')
-        return {'site': site, 'total': 0, 'success': 0, 'failed': 0, 'skipped': 0}
+        return {'site': site, 'total': 0, 'success': 0, 'failed': 0, 'shards': [], 'watermark': modified_after}
+    
+    shard_ids = [f"{site}-shard-{index}" for index in range(len(ranges))]
+    update_progress(supabase, site, 0, total, 0, 0, 'running', f'分发 {len(ranges)} 个分片...')
+    
+    def run_shard(index: int) -> Dict[str, Any]:
+        start_page, end_page = ranges[index]
+        return dispatch({
+            'site': site,
+            'start_page': start_page,
+            'end_page': end_page,
+            'progress_id': shard_ids[index],
+            'max_workers': max_workers,
+            'modified_after': modified_after,
+            'price_stock_only': price_stock_only,
+            'adaptive': adaptive,
+            'per_page': client.per_page,
+        })
+    
+    results: Dict[int, Dict[str, Any]] = {}
+    with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+        futures = {executor.submit(run_shard, index): index for index in range(len(ranges))}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=SHARD_PROGRESS_INTERVAL, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = futures[future]
+                try:
+                    results[index] = future.result()
+                except Exception as e:
+                    logger.error(f"❌ [{site}] 分片 {index} ({ranges[index][0]}-{ranges[index][1]} 页) 失败: {e}")
+                    results[index] = {'site': site, 'total': 0, 'success': 0, 'failed': 0, 'error': str(e)}
+                results[index].update(shard=index, start_page=ranges[index][0], end_page=ranges[index][1])
+            if not pending:
+                break
+            
+            aggregate_progress(supabase, site, shard_ids, f'{len(ranges) - len(pending)}/{len(ranges)} 个分片完成', total)
+    
+    shard_results = [results[index] for index in range(len(ranges))]
+    success = sum(r.get('success', 0) for r in shard_results)
+    failed = sum(r.get('failed', 0) for r in shard_results)
+    cancelled = any(r.get('cancelled') for r in shard_results)
+    failed_shards = [r['shard'] for r in shard_results if r.get('error')]
+    watermarks = [r['watermark'] for r in shard_results if r.get('watermark')]
+    duration = (datetime.utcnow() - start_time).total_seconds()
+    
+    if cancelled:
+        final_status, message = 'cancelled', f'用户取消 ({duration:.1f}s)'
+    elif failed_shards:
+        final_status, message = 'error', f'{len(failed_shards)} 个分片失败: {failed_shards}'
+    else:
+        final_status, message = 'completed', f'{len(ranges)} 个分片同步完成 ({duration:.1f}s)'
+    update_progress(supabase, site, success + failed, total, success, failed, final_status, message)
+    logger.info(f"🏁 [{site}] 分片同步结束: {success}/{total} 成功, {failed} 失败, {len(failed_shards)} 个分片失败 ({duration:.1f}s)")
+    
+    result = {
+        'site': site,
+        'total': total,
+        'success': success,
+        'failed': failed,
+        'duration': duration,
+        'cancelled': cancelled,
+        'watermark': max(watermarks) if watermarks else modified_after,
+        'shards': shard_results,
+    }
+    shard_metrics = [r['metrics'] for r in shard_results if r.get('metrics')]
+    if shard_metrics:
+        result['metrics'] = SyncMetrics.merge(shard_metrics)
+    if failed_shards:
+        result['error'] = f'{len(failed_shards)} 个分片失败'
+        result['failed_shards'] = failed_shards
+    return result
+
+
+def run_shard_payload(supabase: Client, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """执行 sync-shard 请求体（HTTP 动作和本地子进程共用）"""
+    return sync_shard(
+        supabase,
+        payload['site'],
+        int(payload['start_page']),
+        int(payload['end_page']),
+        int(payload.get('max_workers') or 10),
+        payload.get('progress_id') or 'current',
+        payload.get('modified_after'),
+        bool(payload.get('price_stock_only')),
+        bool(payload.get('adaptive')),
+        int(payload.get('per_page') or PRODUCTS_PER_PAGE),
+    )
+
+
+def fetch_site_products_by_ids(site: str, woo_ids: Dict[int, str], max_workers: int = 10, fingerprints: Optional[ContentFingerprints] = None) -> Dict[str, Any]:
+    """
+    从单个站点按 woo_id 批量获取商品（include= 列表请求）并并发获取变体，返回写入数据和未找到/失败的 SKU
+    woo_ids: {woo_id: 数据库中的 SKU}；传入 fingerprints 时只返回内容有变化的商品
+    """
+    client = get_woo_client(site, pool_size=max_workers)
+    updates, failed = [], []
+    try:
+        products = client.get_products_by_ids(list(woo_ids))
+    except Exception as e:
+        logger.error(f"❌ [{site}] 批量获取商品失败: {e}")
+        return {'site': site, 'updates': [], 'not_found': [], 'failed': list(woo_ids.values()), 'error': str(e)}
+    
+    found = {p.get('id') for p in products}
+    not_found = [sku for woo_id, sku in woo_ids.items() if woo_id not in found]
+    # 以数据库中的 SKU 为准写入：站点上的 SKU 可能已修改或为空
+    products = [{**p, 'sku': woo_ids.get(p.get('id')) or p.get('sku', '')} for p in products]
+    harvester = VariationHarvester(client, products)
+    transformed = ProductTransformer(site, metrics=client.metrics).transform_page(products)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for product, result in zip(products, executor.map(lambda p, u: process_woo_product(client, p, site, harvester=harvester, update_data=u), products, transformed)):
+            if result is None:
+                not_found.append(woo_ids.get(product.get('id')))
+            elif result.get('success'):
+                updates.append(result['data'])
+            else:
+                failed.append(result['sku'])
+    if fingerprints is None:
+        # 定向同步总是写入，同时重新记录内容指纹
+        ContentFingerprints(site, {}).filter(updates)
+    else:
+        updates = fingerprints.filter(updates)
+    return {'site': site, 'updates': updates, 'not_found': not_found, 'failed': failed}
+
+
+def sync_skus(supabase: Client, skus: List[str], sites: Optional[List[str]] = None, max_workers: int = 10) -> Dict[str, Any]:
+    """
+    按 SKU 定向同步一批商品
+    一次查询取出所有 SKU 的 woo_ids，各站点并行用 include= 批量获取商品、并发获取变体，
+    最后所有站点的结果合并交给 BatchWriter 写入（失败的批次重试后记入死信列表）
+    """
+    sites = [site for site in (sites or SITES.keys()) if site in SITES]
+    skus = list(dict.fromkeys(skus))
+    logger.info(f"🎯 定向同步 {len(skus)} 个 SKU: {', '.join(sites)}")
+    start_time = datetime.utcnow()
+    
+    rows = supabase.table('products').select('sku, woo_ids').in_('sku', skus).execute().data or []
+    known = {row['sku'] for row in rows}
+    site_ids = {site: {} for site in sites}
+    for row in rows:
+        for site in sites:
+            woo_id = (row.get('woo_ids') or {}).get(site)
+            if woo_id:
+                site_ids[site][int(woo_id)] = row['sku']
+    
+    results = {}
+    with ThreadPoolExecutor(max_workers=len(sites) or 1) as executor:
+        futures = {
+            executor.submit(fetch_site_products_by_ids, site, ids, max_workers): site
+            for site, ids in site_ids.items() if ids
+        }
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+    
+    updates = [update for result in results.values() for update in result.pop('updates')]
+    writer = BatchWriter(supabase, 'sync-skus')
+    for update in updates:
+        writer.add(update)
+    writes = writer.close()
+    dead_skus = {sku for entry in writes['dead_letter'] for sku in entry['skus']}
+    
+    duration = (datetime.utcnow() - start_time).total_seconds()
+    logger.info(f"✅ 定向同步完成: {len(updates)} 条站点数据 ({duration:.1f}s)")
+    result = {
+        'requested': len(skus),
+        'missing': [sku for sku in skus if sku not in known],
+        'written': len({update['sku'] for update in updates} - dead_skus),
+        'sites': {
+            site: {
+                'requested': len(site_ids[site]),
+                'not_found': results.get(site, {}).get('not_found', []),
+                'failed': results.get(site, {}).get('failed', []),
+                **({'error': results[site]['error']} if results.get(site, {}).get('error') else {}),
+            }
+            for site in sites
+        },
+        'duration': duration,
+    }
+    if writes['dead_letter']:
+        result['error'] = f'{len(dead_skus)} 个 SKU 写入失败'
+        result['dead_letter'] = writes['dead_letter']
+    return result
+
+
+def refresh_tier(change_stats: Optional[Dict[str, Dict[str, Any]]], now: datetime) -> str:
+    """按各站点中最高的衰减变化分数确定商品的刷新层级"""
+    score = max((change_score(stats, now) for stats in (change_stats or {}).values()), default=0.0)
+    for name, min_score, _ in REFRESH_TIERS:
+        if score >= min_score:
+            return name
+    return REFRESH_TIERS[-1][0]
+
+
+def get_refresh_schedule(supabase: Client) -> Dict[str, str]:
+    """读取各刷新层级上次运行的时间 {层级: last_run_at}"""
+    try:
+        result = supabase.table('sync_refresh_tiers').select('tier, last_run_at').execute()
+        return {row['tier']: row['last_run_at'] for row in (result.data or []) if row.get('last_run_at')}
+    except Exception as e:
+        logger.warning(f"读取分层刷新记录失败: {e}")
+        return {}
+
+
+def save_refresh_tier(supabase: Client, tier: str, skus: int, result: Dict[str, Any], run_at: datetime):
+    supabase.table('sync_refresh_tiers').upsert({
+        'tier': tier,
+        'last_run_at': run_at.isoformat(),
+        'skus': skus,
+        'result': result,
+        'updated_at': datetime.utcnow().isoformat(),
+    }, on_conflict='tier').execute()
+
+
+def refresh_due(last_run_at: Optional[str], interval: float, now: datetime) -> bool:
+    if not last_run_at:
+        return True
+    last_run = datetime.fromisoformat(last_run_at.replace('Z', '+00:00')).replace(tzinfo=None)
+    return (now - last_run).total_seconds() >= interval
+
+
+def refresh_skus(supabase: Client, tier: str, rows: List[Dict[str, Any]], sites: List[str], max_workers: int = 10) -> Dict[str, Any]:
+    """
+    定向刷新一个层级的商品
+    按 REFRESH_BATCH_SIZE 分批，各站点并行用 include= 批量获取并经内容指纹过滤，
+    有变化的商品交给 BatchWriter 写入（变化的商品同时更新变化分数）
+    """
+    fingerprints = {site: ContentFingerprints.from_rows(site, rows) for site in sites}
+    writer = BatchWriter(supabase, f'refresh-{tier}')
+    stats = {'not_found': 0, 'failed': 0, 'errors': []}
     
-    total = len(woo_products)
-    logger.info(f"📦 [{site}] 获取到 {total} 个商品")
+    with ThreadPoolExecutor(max_workers=len(sites) or 1) as executor:
+        for i in range(0, len(rows), REFRESH_BATCH_SIZE):
+            batch = rows[i:i + REFRESH_BATCH_SIZE]
+            futures = []
+            for site in sites:
+                ids = {int(row['woo_ids'][site]): row['sku'] for row in batch if (row.get('woo_ids') or {}).get(site)}
+                if ids:
+                    futures.append(executor.submit(fetch_site_products_by_ids, site, ids, max_workers, fingerprints[site]))
+            updates = []
+            for future in as_completed(futures):
+                result = future.result()
+                updates.extend(result['updates'])
+                stats['not_found'] += len(result['not_found'])
+                stats['failed'] += len(result['failed'])
+                if result.get('error'):
+                    stats['errors'].append(f"{result['site']}: {result['error']}")
+            writer.put_batch(updates)
     
-    # 检查取消
-    if check_if_cancelled(supabase):
-        update_progress(supabase, site, 0, total, 0, 0, 'cancelled', '用户取消')
-        return {'site': site, 'total': total, 'success': 0, 'failed': 0, 'skipped': 0, 'cancelled': True}
+    written = writer.close()
+    return {
+        'changed': sum(fp.changed_count for fp in fingerprints.values()),
+        'unchanged': sum(fp.unchanged_count for fp in fingerprints.values()),
+        'marker_only': sum(fp.marker_only_count for fp in fingerprints.values()),
+        'not_found': stats['not_found'],
+        'failed': stats['failed'] + writer.dead_letter_count(),
+        'written': written['written'],
+        **({'errors': stats['errors']} if stats['errors'] else {}),
+    }
+
+
+def tiered_refresh(supabase: Client, tiers: Optional[List[str]] = None, sites: Optional[List[str]] = None, max_workers: int = 10, dry_run: bool = False) -> Dict[str, Any]:
+    """
+    分层刷新
+    内容指纹记录的变化分数（products.change_stats，按 REFRESH_HALF_LIFE 衰减）把商品分到 REFRESH_TIERS 各层，
+    只刷新已到刷新间隔的层级（或 tiers 指定的层级）：变化频繁的热门商品每 15 分钟刷新，长尾商品每天一次。
+    由 Cloud Scheduler 按最短的刷新间隔调用；dry_run 时只返回分层结果
+    """
+    sites = [site for site in (sites or SITES.keys()) if site in SITES]
+    now = datetime.utcnow()
+    rows = get_all_products(supabase, 'sku, woo_ids, content_hashes, change_stats')
+    groups = {name: [] for name, _, _ in REFRESH_TIERS}
+    for row in rows:
+        groups[refresh_tier(row.get('change_stats'), now)].append(row)
     
-    # ==================== 步骤2: 处理商品数据并获取变体 ====================
-    update_progress(supabase, site, 0, total, 0, 0, 'running', f'步骤2: 处理 {total} 个商品，10线程获取变体...')
+    schedule = get_refresh_schedule(supabase)
+    due = [
+        name for name, _, interval in REFRESH_TIERS
+        if (name in tiers if tiers else refresh_due(schedule.get(name), interval, now))
+    ]
+    logger.info(f"🗂️ 分层刷新: {', '.join(f'{name} {len(groups[name])}' for name in groups)}，本次刷新: {', '.join(due) or '-'}")
     
-    progress = {'completed': 0, 'success': 0, 'failed': 0, 'cancelled': False}
-    pending_updates = []
-    failed_skus = []
-    BATCH_SIZE = 300
+    results = {name: {'skus': len(groups[name]), 'due': name in due, 'last_run_at': schedule.get(name)} for name in groups}
+    if dry_run:
+        return {'tiers': results, 'sites': sites}
     
-    def process_woo_product(woo_product):
-        """处理单个 WooCommerce 商品"""
-        if progress['cancelled']:
-            return None
-        
-        sku = woo_product.get('sku', '')
-        woo_id = woo_product.get('id')
-        
-        if not sku:
-            logger.warning(f"商品 {woo_id} 没有 SKU，跳过")
-            return None
-        
+    for name in due:
+        start_time = datetime.utcnow()
+        result = refresh_skus(supabase, name, groups[name], sites, max_workers)
+        result['duration'] = (datetime.utcnow() - start_time).total_seconds()
+        logger.info(f"✅ [{name}] 分层刷新完成: {result['changed']} 个变化, {result['unchanged']} 个未变 ({result['duration']:.1f}s)")
+        results[name].update(result)
+        if result.get('errors'):
+            # 获取失败的层级不记录运行时间，下次调用时重新刷新
+            continue
         try:
-            # 提取主商品数据
-            update_data = {
-                'sku': sku,
-                'prices': {site: float(woo_product.get('sale_price') or woo_product.get('price') or 0)},
-                'regular_prices': {site: float(woo_product.get('regular_price') or woo_product.get('price') or 0)},
-                'stock_quantities': {site: woo_product.get('stock_quantity') or 100},
-                'stock_statuses': {site: woo_product.get('stock_status', 'instock')},
-                'statuses': {site: woo_product.get('status', 'publish')},
-                'content': {
-                    site: {
-                        'name': woo_product.get('name', ''),
-                        'description': woo_product.get('description', ''),
-                        'short_description': woo_product.get('short_description', ''),
-                    }
-                },
-                'sync_status': {site: 'synced'},
-                'last_synced_at': datetime.utcnow().isoformat(),
-                'woo_ids': {site: woo_id},
-            }
-            
-            # 如果是主站点 (com)，更新共享数据
-            if site == 'com':
-                update_data['name'] = woo_product.get('name', '')
-                update_data['images'] = [img['src'] for img in woo_product.get('images', [])]
-                update_data['categories'] = [c['name'] for c in woo_product.get('categories', [])]
-                
-                # 提取属性
-                attributes = {}
-                for attr in woo_product.get('attributes', []):
-                    attr_name = (attr.get('name', '') or '').lower().replace(' ', '')
-                    value = (attr.get('options') or [''])[0] if attr.get('options') else ''
-                    
-                    if attr_name in ('genderage', 'gender'):
-                        attributes['gender'] = value
-                    elif attr_name == 'season':
-                        attributes['season'] = value
-                    elif attr_name in ('jerseytype', 'type'):
-                        attributes['type'] = value
-                    elif attr_name in ('style', 'version'):
-                        attributes['version'] = value
-                    elif attr_name in ('sleevelength', 'sleeve'):
-                        attributes['sleeve'] = value
-                    elif attr_name == 'team':
-                        attributes['team'] = value
-                    elif attr_name in ('event', 'events'):
-                        attributes['events'] = attr.get('options', [])
-                
-                if attributes:
-                    update_data['attributes'] = attributes
-            
-            # 获取变体（如果是可变商品）
-            site_variations = []
-            if woo_product.get('type') == 'variable':
-                try:
-                    variations = client.get_product_variations(woo_id)
-                    site_variations = [
-                        {
-                            'id': v['id'],
-                            'sku': v.get('sku', ''),
-                            'attributes': v.get('attributes', []),
-                            'regular_price': v.get('regular_price', ''),
-                            'sale_price': v.get('sale_price', ''),
-                            'stock_quantity': v.get('stock_quantity'),
-                            'stock_status': v.get('stock_status', 'instock'),
-                        }
-                        for v in variations
-                    ]
-                except Exception as e:
-                    logger.warning(f"[{sku}] 获取变体失败: {e}")
-            
-            update_data['variations'] = {site: site_variations}
-            update_data['variation_counts'] = {site: len(site_variations)}
-            
-            return {'sku': sku, 'success': True, 'data': update_data}
-            
+            save_refresh_tier(supabase, name, len(groups[name]), result, start_time)
+            results[name]['last_run_at'] = start_time.isoformat()
         except Exception as e:
-            logger.error(f"❌ [{sku}] 处理失败: {e}")
-            return {'sku': sku, 'success': False, 'error': str(e)}
+            logger.warning(f"[{name}] 保存分层刷新记录失败: {e}")
     
-    # 多线程并行处理
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = {executor.submit(process_woo_product, p): p for p in woo_products}
-        
-        for future in as_completed(futures):
-            if progress['cancelled']:
-                break
-                
-            try:
-                result = future.result()
-                if result is None:
-                    continue
-                    
-                with progress_lock:
-                    progress['completed'] += 1
-                    
-                    if result.get('success'):
-                        progress['success'] += 1
-                        if result.get('data'):
-                            pending_updates.append(result['data'])
-                    else:
-                        progress['failed'] += 1
-                        failed_skus.append(result.get('sku'))
-                    
-                    # 批量写入（在锁内复制列表）
-                    batch_to_write = None
-                    if len(pending_updates) >= BATCH_SIZE:
-                        batch_to_write = pending_updates.copy()
-                        pending_updates.clear()
-                
-                # 在锁外执行数据库写入（避免长时间持有锁）
-                if batch_to_write:
-                    batch_update_products(supabase, batch_to_write, site)
-                
-                # 更新进度
-                if progress['completed'] % 50 == 0 or progress['completed'] == total:
-                    # 先检查取消状态
-                    if check_if_cancelled(supabase):
-                        progress['cancelled'] = True
-                        logger.warning(f"[{site}] 检测到取消请求，停止同步")
-                    
-                    # 只有未取消时才更新状态为 running
-                    if not progress['cancelled']:
-                        update_progress(
-                            supabase, site,
-                            progress['completed'], total,
-                            progress['success'], progress['failed'],
-                            'running',
-                            f"进度: {progress['completed']}/{total}"
-                        )
-                    logger.info(f"[{site}] 进度: {progress['completed']}/{total} (成功: {progress['success']}, 失败: {progress['failed']})")
-                        
-            except Exception as e:
-                logger.error(f"任务异常: {e}")
+    return {'tiers': results, 'sites': sites}
+
+
+def delta_sync_site(supabase: Client, site: str, max_workers: int = 10, progress_id: str = 'current', full: bool = False, **options) -> Dict[str, Any]:
+    """
+    增量同步单个站点
+    只拉取水位线之后修改过的商品（及其变体）；没有水位线或 full=True 时回退为全量同步。
+    只有在未取消、未暂停、无失败的情况下才推进水位线，失败的商品会在下次增量同步中重新拉取
+    """
+    modified_after = None if full else get_sync_watermark(supabase, site)
+    mode = 'delta' if modified_after else 'full'
+    logger.info(f"🔄 [{site}] 增量同步 (模式: {mode}, 水位线: {modified_after or '-'})")
     
-    # 写入剩余数据
-    if pending_updates and not progress['cancelled']:
-        batch_update_products(supabase, pending_updates, site)
-        pending_updates.clear()
+    result = full_sync_site(supabase, site, max_workers, progress_id, modified_after=modified_after, **options)
+    result['mode'] = mode
     
-    duration = (datetime.utcnow() - start_time).total_seconds()
-    final_status = 'cancelled' if progress['cancelled'] else 'completed'
-    update_progress(supabase, site, progress['completed'], total, progress['success'], progress['failed'], final_status, f'同步完成 ({duration:.1f}s)')
-    logger.info(f"✅ [{site}] 同步完成: {progress['success']}/{total} 成功, {progress['failed']} 失败 ({duration:.1f}s)")
+    watermark = result.get('watermark')
+    if (
+        watermark and watermark != modified_after
+        and not result.get('error') and not result.get('cancelled') and not result.get('paused') and not result.get('failed')
+    ):
+        try:
+            save_sync_watermark(supabase, site, watermark)
+            logger.info(f"💾 [{site}] 水位线更新为 {watermark}")
+        except Exception as e:
+            logger.warning(f"[{site}] 保存水位线失败: {e}")
     
-    return {
-        'site': site,
-        'total': total,
-        'success': progress['success'],
-        'failed': progress['failed'],
-        'duration': duration,
-        'cancelled': progress['cancelled'],
-    }
+    return result
 
 
-def full_sync_all(supabase: Client, sites: Optional[List[str]] = None) -> Dict[str, Any]:
-    """全量同步所有站点（或指定站点）"""
+def full_sync_all(supabase: Client, sites: Optional[List[str]] = None, max_workers: int = 10, **options) -> Dict[str, Any]:
+    """全量同步所有站点（或指定站点），options 透传给 full_sync_site"""
     if sites is None:
         sites = ['com', 'uk', 'de', 'fr']
     
@@ -557,7 +2761,7 @@ def full_sync_all(supabase: Client, sites: Optional[List[str]] = None) -> Dict[s
         if site not in SITES:
             logger.warning(f"跳过未知站点: {site}")
             continue
-        results[site] = full_sync_site(supabase, site)
+        results[site] = full_sync_site(supabase, site, max_workers, **options)
     
     total_duration = (datetime.utcnow() - start_time).total_seconds()
     total_success = sum(r['success'] for r in results.values())
@@ -572,6 +2776,605 @@ def full_sync_all(supabase: Client, sites: Optional[List[str]] = None) -> Dict[s
     }
 
 
+def full_sync_all_concurrent(supabase: Client, sites: Optional[List[str]] = None, max_workers: int = 10, **options) -> Dict[str, Any]:
+    """
+    多站点并发全量同步
+    每个站点独立的 WooCommerce 主机，各自使用 max_workers 个线程，
+    进度写入以站点为 ID 的 sync_progress 行，运行期间每 PROGRESS_INTERVAL 秒汇总到 'current' 行（前端订阅的进度行）；
+    取消 'current' 行会停止所有站点
+    """
+    if sites is None:
+        sites = ['com', 'uk', 'de', 'fr']
+    
+    valid_sites = [s for s in sites if s in SITES]
+    for site in sites:
+        if site not in SITES:
+            logger.warning(f"跳过未知站点: {site}")
+    
+    logger.info(f"🚀 开始并发全量同步，站点: {valid_sites} (每站点并发: {max_workers})")
+    start_time = datetime.utcnow()
+    
+    site_label = ','.join(valid_sites)
+    update_progress(supabase, site_label, 0, 0, 0, 0, 'running', f'并发同步 {len(valid_sites)} 个站点...')
+    
+    results = {}
+    if valid_sites:
+        with ThreadPoolExecutor(max_workers=len(valid_sites)) as executor:
+            futures = {
+                executor.submit(full_sync_site, supabase, site, max_workers, site, **options): site
+                for site in valid_sites
+            }
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, timeout=PROGRESS_INTERVAL, return_when=FIRST_COMPLETED)
+                for future in done:
+                    site = futures[future]
+                    try:
+                        results[site] = future.result()
+                    except Exception as e:
+                        logger.error(f"❌ [{site}] 同步异常: {e}")
+                        results[site] = {'site': site, 'total': 0, 'success': 0, 'failed': 0, 'error': str(e)}
+                if pending:
+                    aggregate_progress(supabase, site_label, valid_sites, f'并发同步: {len(results)}/{len(valid_sites)} 个站点完成')
+    
+    total_duration = (datetime.utcnow() - start_time).total_seconds()
+    total = sum(r.get('total', 0) for r in results.values())
+    total_success = sum(r['success'] for r in results.values())
+    total_failed = sum(r['failed'] for r in results.values())
+    cancelled = any(r.get('cancelled') for r in results.values())
+    
+    update_progress(
+        supabase, site_label,
+        total_success + total_failed, total,
+        total_success, total_failed,
+        'cancelled' if cancelled else 'completed',
+        f'并发同步完成 ({total_duration:.1f}s)',
+    )
+    logger.info(f"🏁 并发全量同步完成: {total_success} 成功, {total_failed} 失败 ({total_duration:.1f}s)")
+    
+    return {
+        'success': True,
+        'results': results,
+        'total_duration': total_duration,
+    }
+
+
+def get_pending_pushes(supabase: Client, site: str) -> List[Dict]:
+    """读取站点 sync_status 为 pending 的商品（价格/库存/状态和变体）"""
+    rows = []
+    page_size = 1000
+    offset = 0
+    while True:
+        result = supabase.table('products').select(
+            'sku, woo_ids, prices, regular_prices, stock_quantities, stock_statuses, statuses, variations, variation_counts'
+        ).eq(f'sync_status->>{site}', 'pending').range(offset, offset + page_size - 1).execute()
+        if not result.data:
+            break
+        rows.extend(result.data)
+        if len(result.data) < page_size:
+            break
+        offset += page_size
+    return rows
+
+
+def format_woo_price(value: Any) -> str:
+    return f"{float(value):.2f}"
+
+
+def woo_price_fields(price: Any, regular_price: Any) -> Dict[str, str]:
+    """
+    按 woo-sync 的规则生成 WooCommerce 价格字段：划线价高于售价时 regular_price=划线价、sale_price=售价，
+    否则 regular_price=售价并清空促销价
+    """
+    if regular_price and float(regular_price) > float(price):
+        return {'regular_price': format_woo_price(regular_price), 'sale_price': format_woo_price(price)}
+    return {'regular_price': format_woo_price(price), 'sale_price': ''}
+
+
+def build_push_items(row: Dict[str, Any], site: str, manage_stock: bool = False) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """
+    从 products 行提取站点的推送数据，返回 (商品更新项, 变体更新项列表)，只带有值的字段。
+    价格取商品级的 prices / regular_prices（PIM 编辑的值）：简单商品写在商品上，
+    可变商品写到 variations[site] 中的每个变体上（variations[site] 只用来取变体 ID，其中的价格是上次拉取的旧值）。
+    manage_stock 为站点上该商品实际的库存管理开关：开启时推送 stock_quantity（WooCommerce 据此计算 stock_status），
+    未开启时简单商品只推送 stock_status（可变商品的库存状态由变体汇总）。拉取时未管理库存的商品 stock_quantities 记的是默认值 100，不能推送；
+    变体不管理库存（manage_stock: false，继承主商品），不推送库存
+    """
+    woo_id = int(row['woo_ids'][site])
+    item: Dict[str, Any] = {'id': woo_id}
+    status = (row.get('statuses') or {}).get(site)
+    if status:
+        item['status'] = status
+    variations = (row.get('variations') or {}).get(site) or []
+    variable = bool(variations or (row.get('variation_counts') or {}).get(site))
+    stock_quantity = (row.get('stock_quantities') or {}).get(site)
+    if manage_stock:
+        if stock_quantity is not None:
+            item['stock_quantity'] = int(stock_quantity)
+    elif not variable:
+        stock_status = (row.get('stock_statuses') or {}).get(site)
+        if stock_status:
+            item['stock_status'] = stock_status
+    
+    price = (row.get('prices') or {}).get(site)
+    prices = woo_price_fields(price, (row.get('regular_prices') or {}).get(site)) if price is not None else {}
+    if not variable:
+        item.update(prices)
+    
+    variation_items = [{'id': v['id'], **prices} for v in variations] if prices else []
+    return item, variation_items
+
+
+def push_mismatches(item: Dict[str, Any], result: Dict[str, Any]) -> List[str]:
+    """
+    比较批量接口回显的值与发送的值，返回不一致的字段（WooCommerce 接受请求但未应用时，回显的仍是旧值）。
+    价格按数值比较（"49.9" 与 "49.90" 一致），空字符串只与空值一致
+    """
+    mismatched = []
+    for key, sent in item.items():
+        if key == 'id':
+            continue
+        echoed = result.get(key)
+        if key in ('regular_price', 'sale_price'):
+            same = float(sent) == float(echoed) if sent and echoed else not sent and not echoed
+        elif key == 'stock_quantity':
+            same = echoed is not None and int(echoed) == int(sent)
+        else:
+            same = echoed == sent
+        if not same:
+            mismatched.append(key)
+    return mismatched
+
+
+def send_push_batches(client: WooCommerceClient, executor: AdaptiveThreadPool, groups: Dict[Optional[int], List[Dict[str, Any]]]) -> Dict[Tuple[Optional[int], int], Tuple[Dict[str, Any], str, bool]]:
+    """
+    并发发送批量更新：groups 的键为 None 时是 /products/batch，否则是该商品的 /variations/batch，
+    每 PUSH_BATCH_SIZE 项一个请求。返回失败项 {(键, 项 ID): (更新项, 错误信息, 是否值得重试)}：
+    批量接口逐项返回结果，带 error 的项、回显值与发送值不一致的项（见 push_mismatches）和整个请求失败时的所有项都算失败；
+    4xx（无效 ID、商品不存在等）和回显不一致的项重试也不会成功
+    """
+    futures = {}
+    for key, items in groups.items():
+        for i in range(0, len(items), PUSH_BATCH_SIZE):
+            chunk = items[i:i + PUSH_BATCH_SIZE]
+            if key is None:
+                future = executor.submit(client.update_products_batch, chunk)
+            else:
+                future = executor.submit(client.update_variations_batch, key, chunk)
+            futures[future] = (key, chunk)
+    
+    failures = {}
+    for future in as_completed(futures):
+        key, chunk = futures[future]
+        try:
+            results = {r.get('id'): r for r in future.result()}
+        except Exception as e:
+            status = e.response.status_code if isinstance(e, requests.exceptions.RequestException) and e.response is not None else None
+            for item in chunk:
+                failures[(key, item['id'])] = (item, str(e), not (status and 400 <= status < 500))
+            continue
+        for item in chunk:
+            result = results.get(item['id'])
+            if result is None:
+                failures[(key, item['id'])] = (item, 'missing from batch response', True)
+            elif result.get('error'):
+                status = (result['error'].get('data') or {}).get('status')
+                failures[(key, item['id'])] = (item, result['error'].get('message') or str(result['error']), not (status and 400 <= status < 500))
+            else:
+                mismatched = push_mismatches(item, result)
+                if mismatched:
+                    detail = ', '.join(f"{k}: sent {item[k]!r}, got {result.get(k)!r}" for k in mismatched)
+                    failures[(key, item['id'])] = (item, f'not applied ({detail})', False)
+    return failures
+
+
+def get_manage_stock(client: WooCommerceClient, woo_ids: List[int]) -> Dict[int, bool]:
+    """按 include= 批量读取商品在站点上的库存管理开关（客户端的字段投影为 PUSH_STOCK_FIELDS）；读取失败时返回空，按未管理库存处理"""
+    try:
+        return {p['id']: bool(p.get('manage_stock')) for p in client.get_products_by_ids(woo_ids)}
+    except Exception as e:
+        logger.warning(f"[{client.site}] 读取库存管理开关失败，本次不推送库存数量: {e}")
+        return {}
+
+
+def push_site(supabase: Client, site: str, max_workers: int = PUSH_DEFAULT_CONCURRENCY, skus: Optional[List[str]] = None, dry_run: bool = False) -> Dict[str, Any]:
+    """
+    把站点待推送（sync_status 为 pending）的价格、库存、状态和变体推送到 WooCommerce
+    先批量读取各商品的库存管理开关（见 build_push_items），商品和变体分别合并为批量更新请求并发发送，并发数由 AIMD 自适应控制；
+    部分失败时只把失败的项重新分组重试（最多 PUSH_ITEM_RETRIES 轮），
+    最后所有项的回显值都与发送值一致的商品 sync_status 改为 synced，其余改为 error
+    """
+    start_time = datetime.utcnow()
+    limiter = AdaptiveConcurrency(initial=max_workers, maximum=max(max_workers, PUSH_MAX_CONCURRENCY))
+    client = WooCommerceClient(site, pool_size=limiter.maximum, product_fields=PUSH_STOCK_FIELDS, limiter=limiter, metrics=SyncMetrics(site))
+    
+    with metrics_phase(client.metrics, 'read_existing'):
+        rows = get_pending_pushes(supabase, site)
+    if skus:
+        wanted = set(skus)
+        rows = [row for row in rows if row['sku'] in wanted]
+    
+    # 未发布到该站点的商品没有 woo_id，保持 pending
+    skipped = [row['sku'] for row in rows if not (row.get('woo_ids') or {}).get(site)]
+    rows = [row for row in rows if (row.get('woo_ids') or {}).get(site)]
+    manage_stock = get_manage_stock(client, [int(row['woo_ids'][site]) for row in rows]) if rows else {}
+    groups: Dict[Optional[int], List[Dict[str, Any]]] = {None: []}
+    owners: Dict[Tuple[Optional[int], int], str] = {}
+    for row in rows:
+        item, variation_items = build_push_items(row, site, manage_stock.get(int(row['woo_ids'][site]), False))
+        groups[None].append(item)
+        owners[(None, item['id'])] = row['sku']
+        if variation_items:
+            groups[item['id']] = variation_items
+            for v in variation_items:
+                owners[(item['id'], v['id'])] = row['sku']
+    
+    items = len(owners)
+    logger.info(f"📤 [{site}] 推送 {len(rows)} 个商品（{items} 个更新项），跳过 {len(skipped)} 个未发布商品")
+    if dry_run:
+        return {'site': site, 'total': len(rows), 'items': items, 'skipped': skipped, 'dry_run': True}
+    
+    with AdaptiveThreadPool(limiter) as executor:
+        with metrics_phase(client.metrics, 'push'):
+            failures = send_push_batches(client, executor, groups)
+            for attempt in range(PUSH_ITEM_RETRIES):
+                retry_groups: Dict[Optional[int], List[Dict[str, Any]]] = {}
+                for (key, _), (item, _, retryable) in failures.items():
+                    if retryable:
+                        retry_groups.setdefault(key, []).append(item)
+                if not retry_groups:
+                    break
+                wait_time = 2 ** attempt
+                retries = sum(len(items) for items in retry_groups.values())
+                logger.warning(f"[{site}] {retries} 个更新项失败，{wait_time}秒后重试 ({attempt + 1}/{PUSH_ITEM_RETRIES})")
+                time.sleep(wait_time)
+                retried = send_push_batches(client, executor, retry_groups)
+                failures = {key: failure for key, failure in failures.items() if not failure[2]}
+                failures.update(retried)
+    
+    failed_skus = {owners[key] for key in failures}
+    now = datetime.utcnow().isoformat()
+    status_updates = [
+        {'sku': row['sku'], 'sync_status': {site: 'error' if row['sku'] in failed_skus else 'synced'}, 'last_synced_at': now}
+        for row in rows
+    ]
+    error = None
+    try:
+        batch_update_products(supabase, status_updates, site, client.metrics)
+    except Exception as e:
+        logger.error(f"❌ [{site}] 写入推送状态失败: {e}")
+        error = str(e)
+    
+    duration = (datetime.utcnow() - start_time).total_seconds()
+    logger.info(f"✅ [{site}] 推送完成: {len(rows) - len(failed_skus)} 成功, {len(failed_skus)} 失败 ({duration:.1f}s)")
+    result = {
+        'site': site,
+        'total': len(rows),
+        'success': len(rows) - len(failed_skus),
+        'failed': len(failed_skus),
+        'items': items,
+        'failed_items': [
+            {'sku': owners[key], 'product_id': key[0] or key[1], **({'variation_id': key[1]} if key[0] else {}), 'error': message}
+            for key, (_, message, _) in failures.items()
+        ],
+        'skipped': skipped,
+        'concurrency': limiter.stats(),
+        'duration': duration,
+        'metrics': client.metrics.to_dict(),
+    }
+    if error:
+        result['error'] = error
+    return result
+
+
+def push_all(supabase: Client, sites: Optional[List[str]] = None, max_workers: int = PUSH_DEFAULT_CONCURRENCY, **options) -> Dict[str, Any]:
+    """各站点并发推送，options 透传给 push_site"""
+    valid_sites = [site for site in (sites or SITES.keys()) if site in SITES]
+    start_time = datetime.utcnow()
+    results = {}
+    if valid_sites:
+        with ThreadPoolExecutor(max_workers=len(valid_sites)) as executor:
+            futures = {executor.submit(push_site, supabase, site, max_workers, **options): site for site in valid_sites}
+            for future in as_completed(futures):
+                site = futures[future]
+                try:
+                    results[site] = future.result()
+                except Exception as e:
+                    logger.error(f"❌ [{site}] 推送异常: {e}")
+                    results[site] = {'site': site, 'total': 0, 'success': 0, 'failed': 0, 'error': str(e)}
+    return {
+        'success': True,
+        'results': results,
+        'total_duration': (datetime.utcnow() - start_time).total_seconds(),
+    }
+
+
+# 可以同步执行或作为异步任务提交的动作
+JOB_ACTIONS = ('full-sync', 'sync-site', 'delta-sync', 'price-stock-sync', 'resume', 'push')
+# status 不指定 job_id 时返回的最近任务数
+JOB_STATUS_LIMIT = 20
+# 任务租约（秒）：执行中的任务每 JOB_HEARTBEAT_INTERVAL 秒续约一次，实例被回收后租约过期，任务由其他实例重新认领；
+# 同一任务最多认领 JOB_MAX_ATTEMPTS 次，之后标记为 error
+JOB_LEASE_SECONDS = 120
+JOB_HEARTBEAT_INTERVAL = 30
+JOB_MAX_ATTEMPTS = 3
+
+
+def parse_sync_options(request_json: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+    """从请求参数解析每个站点的并发数和 full_sync_site 选项"""
+    engine = request_json.get('engine', 'thread')  # thread | async
+    # 每个站点的并发数（async 引擎为在途请求数）
+    max_workers = int(request_json.get('max_workers') or (ASYNC_DEFAULT_CONCURRENCY if engine == 'async' else 10))
+    options = {
+        'stream': bool(request_json.get('stream')),  # 流式流水线模式
+        'engine': engine,
+    }
+    if request_json.get('adaptive'):
+        # 自适应并发（AIMD），max_workers 作为起始并发
+        options['adaptive'] = True
+    if request_json.get('resumable'):
+        # 可恢复的分段同步，超出时间预算后暂停，用 resume 动作继续
+        options['resumable'] = True
+    if request_json.get('time_budget'):
+        options['time_budget'] = float(request_json['time_budget'])
+    if request_json.get('refresh_variations'):
+        # 忽略变体缓存，重新获取所有变体
+        options['refresh_variations'] = True
+    if request_json.get('force_write'):
+        # 忽略内容指纹，写入所有商品
+        options['force_write'] = True
+    return max_workers, options
+
+
+def run_sync_action(supabase: Client, action: str, request_json: Dict[str, Any]) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """执行 JOB_ACTIONS 中的同步动作，返回 (响应内容, 各站点结果)"""
+    sites = request_json.get('sites')  # 可选，指定要同步的站点
+    max_workers, options = parse_sync_options(request_json)
+    
+    if action == 'full-sync':
+        if request_json.get('concurrent'):
+            result = full_sync_all_concurrent(supabase, sites, max_workers, **options)
+        else:
+            result = full_sync_all(supabase, sites, max_workers, **options)
+        return result, list(result['results'].values())
+    
+    if action == 'sync-site':
+        site = request_json.get('site', 'com')
+        result = full_sync_site(supabase, site, max_workers, **options)
+        return {'success': True, **result}, [result]
+    
+    if action == 'delta-sync':
+        # 增量同步，full=true 时忽略水位线做全量同步并重建水位线
+        full = bool(request_json.get('full'))
+        target_sites = sites or ([request_json['site']] if request_json.get('site') else list(SITES.keys()))
+        results = {
+            site: delta_sync_site(supabase, site, max_workers, full=full, **options)
+            for site in target_sites if site in SITES
+        }
+        return {'success': True, 'results': results}, list(results.values())
+    
+    if action == 'price-stock-sync':
+        # 价格/库存快速同步：不拉取内容和图片，只更新价格、库存、状态和变体
+        target_sites = sites or ([request_json['site']] if request_json.get('site') else None)
+        options['price_stock_only'] = True
+        if request_json.get('concurrent'):
+            result = full_sync_all_concurrent(supabase, target_sites, max_workers, **options)
+        else:
+            result = full_sync_all(supabase, target_sites, max_workers, **options)
+        return result, list(result['results'].values())
+    
+    if action == 'resume':
+        # 从检查点继续未完成的可恢复同步，返回的 pending 非空时需要再次调用
+        target_sites = sites or ([request_json['site']] if request_json.get('site') else None)
+        resume_options = {k: v for k, v in options.items() if k in ('adaptive', 'time_budget')}
+        result = resume_sync(supabase, target_sites, max_workers, **resume_options)
+        return result, list(result['results'].values())
+    
+    if action == 'push':
+        # 把 sync_status 为 pending 的价格/库存/状态推送到 WooCommerce，skus 可限定商品
+        target_sites = sites or ([request_json['site']] if request_json.get('site') else None)
+        result = push_all(
+            supabase, target_sites, int(request_json.get('max_workers') or PUSH_DEFAULT_CONCURRENCY),
+            skus=request_json.get('skus'), dry_run=bool(request_json.get('dry_run')),
+        )
+        return result, list(result['results'].values())
+    
+    raise ValueError(f"Unknown sync action: {action}")
+
+
+# 后台任务线程：每个实例最多一个，依次认领并执行排队的任务；_job_wakeup 表示有新提交的任务待认领
+job_lock = threading.Lock()
+_job_worker: Optional[threading.Thread] = None
+_job_wakeup = False
+
+
+def submit_sync_job(supabase: Client, job: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    提交异步同步任务并确保本实例的后台线程在运行，返回 {'job_id', 'status', 'deduplicated'}
+    与已排队或正在执行（租约未过期）的任务动作和参数完全相同时不重复排队，直接返回已有任务
+    注意：请求返回后仍要继续执行，函数需部署为 CPU 始终分配（deploy.sh 的 --no-cpu-throttling）
+    """
+    params = {k: v for k, v in job.items() if k != 'action'}
+    dedupe_key = hashlib.sha1(json.dumps([job['action'], params], sort_keys=True).encode()).hexdigest()
+    
+    def find_active() -> Optional[Dict[str, Any]]:
+        result = supabase.table('sync_jobs').select('id,status,lease_expires_at').eq('dedupe_key', dedupe_key).in_('status', ['queued', 'running']).execute()
+        now = datetime.utcnow().isoformat()
+        # 租约已过期的 running 任务的执行实例已被回收，不再视为重复
+        active = [row for row in result.data or [] if row['status'] == 'queued' or (row.get('lease_expires_at') or '') > now]
+        return min(active, key=lambda row: row['status'] != 'queued', default=None)
+    
+    existing = find_active()
+    if existing is None:
+        row = {'id': uuid.uuid4().hex, 'action': job['action'], 'params': params, 'dedupe_key': dedupe_key, 'status': 'queued'}
+        try:
+            supabase.table('sync_jobs').insert(row).execute()
+            logger.info(f"📥 提交任务 {row['id']}: {job['action']}")
+        except Exception as e:
+            # 并发提交相同任务时由唯一索引拒绝，返回先提交的那个
+            existing = find_active()
+            if existing is None:
+                raise
+            logger.info(f"任务已在队列中: {existing['id']} ({e})")
+    
+    start_job_worker(supabase)
+    if existing is not None:
+        return {'job_id': existing['id'], 'status': existing['status'], 'deduplicated': True}
+    return {'job_id': row['id'], 'status': 'queued', 'deduplicated': False}
+
+
+def start_job_worker(supabase: Client):
+    """唤醒本实例的后台任务线程（没有运行时启动一个）"""
+    global _job_worker, _job_wakeup
+    with job_lock:
+        _job_wakeup = True
+        if _job_worker is None:
+            _job_worker = threading.Thread(target=run_queued_jobs, args=(supabase,), daemon=True)
+            _job_worker.start()
+
+
+def job_lease_expiry() -> str:
+    return (datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS)).isoformat()
+
+
+def claim_next_job(supabase: Client) -> Optional[Dict[str, Any]]:
+    """
+    认领一个任务：先接手租约已过期的 running 任务（上次执行的实例已被回收），再按提交顺序认领排队任务。
+    条件更新（status 和租约条件在数据库中重新检查），多个实例同时认领时只有一个成功；
+    认领时生成新的 claim_id，续约和写入结果都以它为条件，被接手的旧执行者不会覆盖新的结果
+    """
+    now = datetime.utcnow().isoformat()
+    expired = supabase.table('sync_jobs').select('id,attempts').eq('status', 'running').lt('lease_expires_at', now).order('created_at').limit(5).execute()
+    for candidate in expired.data or []:
+        if (candidate.get('attempts') or 0) >= JOB_MAX_ATTEMPTS:
+            logger.error(f"❌ 任务 {candidate['id']} 已认领 {candidate.get('attempts')} 次仍未完成，标记为失败")
+            supabase.table('sync_jobs').update({
+                'status': 'error',
+                'error': f'lease expired after {candidate.get("attempts")} attempts',
+                'finished_at': now,
+            }).eq('id', candidate['id']).eq('status', 'running').lt('lease_expires_at', now).execute()
+            continue
+        claimed = supabase.table('sync_jobs').update({
+            'claim_id': uuid.uuid4().hex,
+            'attempts': (candidate.get('attempts') or 0) + 1,
+            'started_at': now,
+            'lease_expires_at': job_lease_expiry(),
+        }).eq('id', candidate['id']).eq('status', 'running').lt('lease_expires_at', now).execute()
+        if claimed.data:
+            logger.warning(f"♻️ 接手租约过期的任务 {candidate['id']}（第 {candidate.get('attempts', 0) + 1} 次）")
+            return claimed.data[0]
+    
+    queued = supabase.table('sync_jobs').select('id').eq('status', 'queued').order('created_at').limit(5).execute()
+    for candidate in queued.data or []:
+        claimed = supabase.table('sync_jobs').update({
+            'status': 'running',
+            'claim_id': uuid.uuid4().hex,
+            'attempts': 1,
+            'started_at': now,
+            'lease_expires_at': job_lease_expiry(),
+        }).eq('id', candidate['id']).eq('status', 'queued').execute()
+        if claimed.data:
+            return claimed.data[0]
+    return None
+
+
+def renew_job_lease(supabase: Client, job: Dict[str, Any]) -> bool:
+    """续约（只在本次认领仍有效时成功），返回是否仍持有任务"""
+    renewed = supabase.table('sync_jobs').update({
+        'lease_expires_at': job_lease_expiry(),
+        'heartbeat_at': datetime.utcnow().isoformat(),
+    }).eq('id', job['id']).eq('claim_id', job['claim_id']).eq('status', 'running').execute()
+    return bool(renewed.data)
+
+
+@contextmanager
+def job_heartbeat(supabase: Client, job: Dict[str, Any], interval: float = JOB_HEARTBEAT_INTERVAL):
+    """执行任务期间在后台线程定期续约"""
+    stopped = threading.Event()
+    
+    def beat():
+        while not stopped.wait(interval):
+            try:
+                if not renew_job_lease(supabase, job):
+                    logger.warning(f"任务 {job['id']} 的租约已被其他实例接手")
+                    return
+            except Exception as e:
+                logger.warning(f"任务 {job['id']} 续约失败: {e}")
+    
+    thread = threading.Thread(target=beat, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def run_queued_jobs(supabase: Client):
+    """后台任务线程：依次执行排队的任务（执行期间续约），队列为空且没有新提交时退出"""
+    global _job_worker, _job_wakeup
+    while True:
+        with job_lock:
+            _job_wakeup = False
+        try:
+            job = claim_next_job(supabase)
+        except Exception as e:
+            logger.error(f"❌ 认领任务失败: {e}")
+            job = None
+        if job is None:
+            with job_lock:
+                if not _job_wakeup:
+                    _job_worker = None
+                    return
+            continue
+        
+        logger.info(f"▶️ 开始任务 {job['id']}: {job['action']}")
+        update = {'status': 'completed'}
+        with job_heartbeat(supabase, job):
+            try:
+                result, site_results = run_sync_action(supabase, job['action'], job.get('params') or {})
+                record_sync_runs(supabase, job['action'], site_results)
+                update['result'] = result
+            except Exception as e:
+                logger.error(f"❌ 任务 {job['id']} 失败: {e}", exc_info=True)
+                update.update(status='error', error=str(e))
+        update['finished_at'] = datetime.utcnow().isoformat()
+        try:
+            supabase.table('sync_jobs').update(update).eq('id', job['id']).eq('claim_id', job['claim_id']).execute()
+        except Exception as e:
+            logger.error(f"❌ 保存任务 {job['id']} 结果失败: {e}")
+        logger.info(f"⏹️ 任务 {job['id']} 结束: {update['status']}")
+
+
+def get_sync_jobs(supabase: Client, job_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    查询任务（不指定 job_ids 时返回最近 JOB_STATUS_LIMIT 个），运行中的任务附带 sync_progress 中的实时进度：
+    并发同步为各站点的进度行，其他为 'current' 行；租约已过期（执行实例已被回收、等待重新认领）的任务带 stale: true
+    """
+    query = supabase.table('sync_jobs').select('id,action,params,status,result,error,attempts,created_at,started_at,finished_at,lease_expires_at')
+    if job_ids:
+        query = query.in_('id', job_ids)
+    else:
+        query = query.order('created_at', desc=True).limit(JOB_STATUS_LIMIT)
+    jobs = query.execute().data or []
+    
+    if any(job['status'] == 'running' for job in jobs):
+        rows = supabase.table('sync_progress').select('*').in_('id', ['current', *SITES.keys()]).execute().data or []
+        progress = {row['id']: row for row in rows}
+        now = datetime.utcnow()
+        for job in jobs:
+            if job['status'] != 'running':
+                continue
+            lease = job.get('lease_expires_at')
+            job['stale'] = bool(lease) and datetime.fromisoformat(lease.replace('Z', '+00:00')).replace(tzinfo=None) < now
+            params = job.get('params') or {}
+            if params.get('concurrent'):
+                job['progress'] = [progress[site] for site in (params.get('sites') or SITES.keys()) if site in progress]
+            else:
+                job['progress'] = [progress['current']] if 'current' in progress else []
+    return jobs
+
+
 @functions_framework.http
 def main(request: Request):
     """HTTP Cloud Function 入口"""
@@ -593,19 +3396,96 @@ def main(request: Request):
     try:
         # 解析请求
         request_json = request.get_json(silent=True) or {}
-        action = request_json.get('action', 'full-sync')
+        # Prometheus 抓取使用 GET，动作从查询参数读取（?action=metrics）
+        action = request_json.get('action') or request.args.get('action', 'full-sync')
         sites = request_json.get('sites')  # 可选，指定要同步的站点
         
+        if action == 'health':
+            # 不创建任何客户端；warm 表示实例已缓存 Supabase 客户端
+            return (json.dumps({'status': 'ok', 'timestamp': datetime.utcnow().isoformat(), 'warm': _supabase_client is not None}), 200, headers)
+        
         # 获取 Supabase 客户端
         supabase = get_supabase_client()
         
-        if action == 'full-sync':
-            result = full_sync_all(supabase, sites)
-            return (json.dumps(result), 200, headers)
+        max_workers, options = parse_sync_options(request_json)
+        # prometheus: 同步结束后以 Prometheus 文本格式返回各站点指标（默认返回 JSON，指标在各站点结果的 metrics 中）
+        metrics_format = request_json.get('metrics_format')
+        
+        def sync_response(payload: Dict[str, Any], site_results, record: bool = True):
+            """把站点结果写入 sync_runs 运行历史，并按 metrics_format 生成响应"""
+            site_results = list(site_results)
+            if record:
+                record_sync_runs(supabase, action, site_results)
+            if metrics_format == 'prometheus':
+                return (format_prometheus(site_results), 200, {**headers, 'Content-Type': PROMETHEUS_CONTENT_TYPE})
+            return (json.dumps(payload), 200, headers)
+        
+        if action in JOB_ACTIONS:
+            # full-sync / sync-site / delta-sync / price-stock-sync / resume / push，同步执行直到完成
+            result, site_results = run_sync_action(supabase, action, request_json)
+            return sync_response(result, site_results)
+        
+        elif action == 'submit':
+            # 异步任务：把 job 中的同步请求放入队列，立即返回任务 ID，由后台线程执行
+            job = request_json.get('job') or {}
+            if job.get('action') not in JOB_ACTIONS:
+                return (json.dumps({'error': f"job.action must be one of {', '.join(JOB_ACTIONS)}"}), 400, headers)
+            result = submit_sync_job(supabase, job)
+            return (json.dumps({'success': True, **result}), 200, headers)
+        
+        elif action == 'status':
+            # 查询任务状态和运行中任务的实时进度（不指定 job_id 时返回最近的任务）
+            job_ids = request_json.get('job_ids') or ([request_json['job_id']] if request_json.get('job_id') else None)
+            return (json.dumps({'success': True, 'jobs': get_sync_jobs(supabase, job_ids)}), 200, headers)
         
-        elif action == 'sync-site':
+        elif action == 'sharded-sync':
+            # 分片协调：把站点按页码范围切分，每个分片作为独立的 sync-shard 调用运行
             site = request_json.get('site', 'com')
-            result = full_sync_site(supabase, site)
+            shards = min(int(request_json.get('shards') or SHARD_DEFAULT_COUNT), SHARD_MAX_COUNT)
+            if request_json.get('dispatch') == 'subprocess':
+                dispatch = subprocess_shard_dispatcher()
+            else:
+                function_url = request_json.get('function_url') or SYNC_FUNCTION_URL or request.url_root
+                if request.headers.get('X-Forwarded-Proto') == 'https':
+                    function_url = function_url.replace('http://', 'https://', 1)
+                dispatch = http_shard_dispatcher(function_url)
+            result = coordinate_sharded_sync(
+                supabase, site, shards, dispatch, max_workers,
+                price_stock_only=bool(request_json.get('price_stock_only')),
+                adaptive=bool(options.get('adaptive')),
+            )
+            return sync_response({'success': True, **result}, [result])
+        
+        elif action == 'sync-shard':
+            # 单个分片（由 sharded-sync 分发），运行历史由协调器合并各分片指标后记录
+            result = run_shard_payload(supabase, request_json)
+            return sync_response({'success': True, **result}, [result], record=False)
+        
+        elif action == 'metrics':
+            # Prometheus 抓取：各站点最近一次同步运行的指标
+            target_sites = sites or ([request_json['site']] if request_json.get('site') else None)
+            runs = get_latest_sync_runs(supabase, target_sites)
+            return (format_prometheus(runs), 200, {**headers, 'Content-Type': PROMETHEUS_CONTENT_TYPE})
+        
+        elif action == 'sync-skus':
+            # 按 SKU 定向同步一批商品（例如价格活动涉及的商品）
+            skus = [str(sku) for sku in (request_json.get('skus') or []) if sku]
+            if not skus:
+                return (json.dumps({'error': 'skus required'}), 400, headers)
+            if len(skus) > SYNC_SKUS_MAX:
+                return (json.dumps({'error': f'at most {SYNC_SKUS_MAX} skus per request'}), 400, headers)
+            target_sites = sites or ([request_json['site']] if request_json.get('site') else None)
+            result = sync_skus(supabase, skus, target_sites, max_workers)
+            return (json.dumps({'success': 'error' not in result, **result}), 200, headers)
+        
+        elif action == 'tiered-refresh':
+            # 分层刷新：只定向同步到期层级的商品，tiers 可强制指定层级
+            tiers = request_json.get('tiers')
+            tier_names = [name for name, _, _ in REFRESH_TIERS]
+            if tiers and any(tier not in tier_names for tier in tiers):
+                return (json.dumps({'error': f'tiers must be in {tier_names}'}), 400, headers)
+            target_sites = sites or ([request_json['site']] if request_json.get('site') else None)
+            result = tiered_refresh(supabase, tiers, target_sites, max_workers, dry_run=bool(request_json.get('dry_run')))
             return (json.dumps({'success': True, **result}), 200, headers)
         
         elif action == 'test-product':
@@ -624,9 +3504,9 @@ def main(request: Request):
             # 测试 WooCommerce API 连接
             site = request_json.get('site', 'com')
             try:
-                client = WooCommerceClient(site)
+                client = get_woo_client(site)
                 url = f"{client.base_url}/products?per_page=1"
-                response = requests.get(url, auth=client.auth, timeout=10)
+                response = client.session.get(url, timeout=10)
                 return (json.dumps({
                     'success': True,
                     'site': site,
@@ -636,9 +3516,6 @@ def main(request: Request):
             except Exception as e:
                 return (json.dumps({'success': False, 'error': str(e)}), 200, headers)
         
-        elif action == 'health':
-            return (json.dumps({'status': 'ok', 'timestamp': datetime.utcnow().isoformat()}), 200, headers)
-        
         else:
             return (json.dumps({'error': f'Unknown action: {action}'}), 400, headers)
     
@@ -649,12 +3526,16 @@ def main(request: Request):
 
 # 本地测试
 if __name__ == '__main__':
-    import sys
     from dotenv import load_dotenv
     load_dotenv()
     
     supabase = get_supabase_client()
     
+    if len(sys.argv) > 2 and sys.argv[1] == '--shard':
+        # 本地分片子进程（subprocess_shard_dispatcher），stdout 最后一行输出结果 JSON
+        print(json.dumps(run_shard_payload(supabase, json.loads(sys.argv[2]))))
+        sys.exit(0)
+    
     if len(sys.argv) > 1:
         site = sys.argv[1]
         result = full_sync_site(supabase, site)
@@ -0,0 +1,11 @@
+"""
+full-sync 单元测试
+被测模块和 bench/ 下的替身（fake_woo / fake_supabase / fake_postgrest）直接从源码目录导入，不需要安装
+"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'bench'))
@@ -0,0 +1,119 @@
+"""自适应并发（AIMD）、Retry-After 处理和跟随并发上限的线程池"""
+
+import threading
+import time
+
+import requests
+
+import main
+
+
+def test_additive_increase_about_one_per_window():
+    limiter = main.AdaptiveConcurrency(initial=4, maximum=10)
+    for _ in range(4):
+        limiter.acquire()
+        limiter.release(latency=0.1)
+    assert int(limiter.limit) == 4 and limiter.limit > 4.9
+    limiter.acquire()
+    limiter.release(latency=0.1)
+    assert int(limiter.limit) == 5
+
+
+def test_no_increase_when_latency_degrades():
+    limiter = main.AdaptiveConcurrency(initial=4, maximum=10)
+    limiter.acquire()
+    limiter.release(latency=0.1)
+    before = limiter.limit
+    for _ in range(20):
+        limiter.acquire()
+        limiter.release(latency=5.0)
+    assert limiter.limit == before
+
+
+def test_multiplicative_decrease_once_per_window():
+    limiter = main.AdaptiveConcurrency(initial=16, minimum=2, maximum=50)
+    for _ in range(5):
+        limiter.acquire()
+        limiter.release(overloaded=True)
+    assert int(limiter.limit) == 8
+    assert limiter.stats()['backoffs'] == 1
+    
+    limiter._last_decrease -= 2  # 下一个窗口
+    limiter.acquire()
+    limiter.release(overloaded=True)
+    assert int(limiter.limit) == 4
+
+
+def test_decrease_stops_at_minimum():
+    limiter = main.AdaptiveConcurrency(initial=3, minimum=2, maximum=50)
+    for _ in range(3):
+        limiter._last_decrease = float('-inf')
+        limiter.acquire()
+        limiter.release(overloaded=True)
+    assert int(limiter.limit) == 2
+
+
+def test_overload_does_not_pause_other_requests():
+    limiter = main.AdaptiveConcurrency(initial=4, maximum=10)
+    limiter.acquire()
+    limiter.release(overloaded=True)
+    acquired = threading.Event()
+    threading.Thread(target=lambda: (limiter.acquire(), acquired.set()), daemon=True).start()
+    assert acquired.wait(0.5)
+
+
+def make_response(status, headers=None, body=b'[]'):
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    response._content = body
+    return response
+
+
+def test_retry_after_delays_only_that_request(monkeypatch):
+    limiter = main.AdaptiveConcurrency(initial=4, maximum=10)
+    client = main.WooCommerceClient('com', limiter=limiter)
+    responses = [make_response(503, {'Retry-After': '3'}), make_response(200)]
+    monkeypatch.setattr(client.session, 'get', lambda *args, **kwargs: responses.pop(0))
+    sleeps = []
+    
+    def sleep(seconds):
+        # 等待 Retry-After 时不占用在途名额
+        assert limiter.in_flight == 0
+        sleeps.append(seconds)
+    monkeypatch.setattr(main.time, 'sleep', sleep)
+    
+    assert client._request_with_retry('http://example.test/products').status_code == 200
+    assert sleeps == [3.0]
+    assert int(limiter.limit) == 2 and limiter.in_flight == 0
+
+
+def test_retry_after_seconds():
+    assert main.retry_after_seconds({'Retry-After': '5'}) == 5.0
+    assert main.retry_after_seconds({'Retry-After': '9999'}) == main.RETRY_AFTER_MAX
+    assert main.retry_after_seconds({}, 2) == 2
+    assert main.retry_after_seconds({'Retry-After': 'soon'}, 4) == 4
+
+
+def test_thread_pool_follows_current_limit():
+    limiter = main.AdaptiveConcurrency(initial=3, maximum=50)
+    running, peak, lock = [0], [0], threading.Lock()
+    
+    def task(n):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.01)
+        with lock:
+            running[0] -= 1
+        return n
+    
+    with main.AdaptiveThreadPool(limiter) as pool:
+        assert list(pool.map(task, range(30))) == list(range(30))
+    assert pool.peak_threads == 3 and peak[0] <= 3
+    
+    limiter.limit = 6.0
+    with main.AdaptiveThreadPool(limiter) as pool:
+        futures = [pool.submit(task, n) for n in range(30)]
+    assert [f.result() for f in futures] == list(range(30))
+    assert pool.peak_threads == 6
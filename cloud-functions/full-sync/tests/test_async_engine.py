@@ -0,0 +1,112 @@
+"""asyncio 引擎：在途请求上限和与线程引擎一致的写入数据"""
+
+import asyncio
+
+import httpx
+import pytest
+
+import async_engine
+import main
+from fake_supabase import FakeSupabase
+from fake_woo import FakeWooServer, make_catalog
+
+
+@pytest.fixture
+def woo(monkeypatch):
+    catalog, variations = make_catalog(products=1000, variations=2)
+    server = FakeWooServer(catalog, variations, latency=0.005).start()
+    monkeypatch.setitem(main.SITES, 'com', {'url': server.url, 'key': 'k', 'secret': 's'})
+    monkeypatch.setattr(main, 'SYNC_WRITE_MODE', 'rpc')
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def in_flight(monkeypatch):
+    """记录 httpx 在途请求数的峰值"""
+    state = {'active': 0, 'peak': 0, 'pages': 0}
+    get = httpx.AsyncClient.get
+
+    async def counting_get(self, url, **kwargs):
+        state['active'] += 1
+        state['peak'] = max(state['peak'], state['active'])
+        if url.endswith('/products'):
+            state['pages'] += 1
+        try:
+            await asyncio.sleep(0)
+            return await get(self, url, **kwargs)
+        finally:
+            state['active'] -= 1
+
+    monkeypatch.setattr(httpx.AsyncClient, 'get', counting_get)
+    return state
+
+
+def test_page_and_variation_requests_share_concurrency_limit(woo, in_flight):
+    supabase = FakeSupabase()
+    result = async_engine.async_sync_site(supabase, 'com', concurrency=3)
+
+    assert result['success'] == 1000 and result['failed'] == 0
+    assert in_flight['pages'] == 10
+    assert in_flight['peak'] <= 3
+
+
+def test_results_match_thread_engine(woo):
+    thread_db, async_db = FakeSupabase(), FakeSupabase()
+    main.full_sync_site(thread_db, 'com', max_workers=4)
+    async_engine.async_sync_site(async_db, 'com', concurrency=4)
+
+    # 只有同步时间戳不同
+    strip = lambda row: {k: v for k, v in row.items() if k not in ('last_synced_at', 'variation_cache')}
+    thread_rows = {sku: strip(row) for sku, row in thread_db.tables['products'].items()}
+    async_rows = {sku: strip(row) for sku, row in async_db.tables['products'].items()}
+    assert async_rows == thread_rows
+    assert all(len(row['variations']['com']) == 2 for row in async_rows.values())
+
+
+def test_client_errors_are_not_retried(woo, monkeypatch):
+    sleeps = []
+
+    async def no_sleep(seconds):
+        sleeps.append(seconds)
+
+    monkeypatch.setattr(async_engine.asyncio, 'sleep', no_sleep)
+
+    async def request():
+        client = async_engine.AsyncWooCommerceClient('com', concurrency=2, metrics=main.SyncMetrics('com'))
+        try:
+            with pytest.raises(httpx.HTTPStatusError) as error:
+                await client._request_with_retry(f"{client.base_url}/products/999999", endpoint='product')
+            return error.value.response.status_code, client.metrics.to_dict()
+        finally:
+            await client.aclose()
+
+    status, metrics = asyncio.run(request())
+    assert status == 404
+    assert sleeps == []
+    assert metrics['retries'] == 0
+
+
+def test_overload_responses_are_retried(monkeypatch):
+    server = FakeWooServer(*make_catalog(products=1, variations=0), error_rate=1.0).start()
+    monkeypatch.setitem(main.SITES, 'com', {'url': server.url, 'key': 'k', 'secret': 's'})
+    sleeps = []
+
+    async def no_sleep(seconds):
+        sleeps.append(seconds)
+
+    monkeypatch.setattr(async_engine.asyncio, 'sleep', no_sleep)
+
+    async def request():
+        client = async_engine.AsyncWooCommerceClient('com', concurrency=2)
+        try:
+            with pytest.raises(httpx.HTTPStatusError):
+                await client._request_with_retry(f"{client.base_url}/products", endpoint='products')
+        finally:
+            await client.aclose()
+
+    try:
+        asyncio.run(request())
+    finally:
+        server.stop()
+    assert len(sleeps) == 2
@@ -0,0 +1,84 @@
+"""批量获取变体：支持时每 VARIATION_BULK_PARENTS 个父商品一个请求，不支持时回退为逐个获取"""
+
+import pytest
+
+import main
+from fake_supabase import FakeSupabase
+from fake_woo import FakeWooServer, make_catalog
+
+
+PRODUCTS = 100
+
+
+@pytest.fixture
+def servers(monkeypatch):
+    """启动替身站点并设为 'com' 站点（可多次调用，后启动的替换前一个）"""
+    started = []
+    monkeypatch.setattr(main, 'SYNC_WRITE_MODE', 'rpc')
+
+    def start(products=PRODUCTS, variations=3, bulk_variations=False):
+        server = FakeWooServer(*make_catalog(products=products, variations=variations), bulk_variations=bulk_variations).start()
+        monkeypatch.setitem(main.SITES, 'com', {'url': server.url, 'key': 'k', 'secret': 's'})
+        started.append(server)
+        return server
+
+    yield start
+    for server in started:
+        server.stop()
+
+
+def requests_by_endpoint(result):
+    return {endpoint: entry['count'] for endpoint, entry in result['metrics']['requests'].items()}
+
+
+def synced_variations(supabase):
+    return {sku: row['variations'] for sku, row in supabase.tables['products'].items()}
+
+
+def test_bulk_listing_groups_parents(servers):
+    server = servers(bulk_variations=True)
+    supabase = FakeSupabase()
+    result = main.full_sync_site(supabase, 'com', max_workers=4, refresh_variations=True)
+
+    counts = requests_by_endpoint(result)
+    assert counts['variations_bulk'] == PRODUCTS // main.VARIATION_BULK_PARENTS
+    assert 'variations' not in counts
+    row = supabase.tables['products']['BENCH-000042']
+    assert [v['sku'] for v in row['variations']['com']] == [v['sku'] for v in server.variations[1042]]
+
+
+def test_unsupported_bulk_listing_falls_back_to_per_product(servers):
+    bulk = FakeSupabase()
+    servers(bulk_variations=True)
+    main.full_sync_site(bulk, 'com', max_workers=4, refresh_variations=True)
+
+    servers(bulk_variations=False)
+    fallback = FakeSupabase()
+    result = main.full_sync_site(fallback, 'com', max_workers=4, refresh_variations=True)
+
+    counts = requests_by_endpoint(result)
+    # 第一次批量请求得到 400 后不再尝试（并发的少数几组可能同时发出）
+    assert 1 <= counts['variations_bulk'] <= 4
+    assert counts['variations'] == PRODUCTS
+    assert result['success'] == PRODUCTS and result['failed'] == 0
+    assert synced_variations(fallback) == synced_variations(bulk)
+
+
+def test_bulk_listing_pages_past_100_variations(servers):
+    servers(products=10, variations=30, bulk_variations=True)
+    client = main.WooCommerceClient('com', metrics=main.SyncMetrics('com'))
+
+    grouped = client.get_variations_bulk(list(range(1000, 1010)))
+
+    assert client.bulk_variations is True
+    assert {pid: len(items) for pid, items in grouped.items()} == {pid: 30 for pid in range(1000, 1010)}
+    assert client.metrics.to_dict()['requests']['variations_bulk']['count'] == 3
+
+
+def test_per_product_listing_pages_past_100_variations(servers):
+    servers(products=1, variations=120)
+    client = main.WooCommerceClient('com')
+
+    assert client.get_variations_bulk([1000]) is None and client.bulk_variations is False
+    variations = client.get_product_variations(1000)
+    assert [v['id'] for v in variations] == [1000 * 1000 + n for n in range(120)]
@@ -0,0 +1,52 @@
+"""热实例客户端复用：每个站点一个共享客户端，连接池只增不减，导入时不加载重型依赖"""
+
+import subprocess
+import sys
+
+import pytest
+
+import main
+from fake_woo import FakeWooServer, make_catalog
+
+
+@pytest.fixture
+def woo(monkeypatch):
+    server = FakeWooServer(*make_catalog(products=10, variations=1)).start()
+    monkeypatch.setitem(main.SITES, 'com', {'url': server.url, 'key': 'k', 'secret': 's'})
+    monkeypatch.setattr(main, '_woo_clients', {})
+    yield server
+    server.stop()
+
+
+def pool_maxsize(client):
+    return client.session.get_adapter('http://').poolmanager.connection_pool_kw['maxsize']
+
+
+def test_one_cached_client_per_site_regardless_of_pool_size(woo):
+    client = main.get_woo_client('com')
+    for pool_size in (4, 10, 25, 7):
+        assert main.get_woo_client('com', pool_size=pool_size) is client
+    assert list(main._woo_clients) == ['com']
+    # 连接池扩大到请求过的最大值，不会缩小
+    assert client.pool_size == 25 and pool_maxsize(client) == 25
+
+
+def test_site_config_change_creates_new_client(woo, monkeypatch):
+    client = main.get_woo_client('com')
+    monkeypatch.setitem(main.SITES, 'com', {**main.SITES['com'], 'secret': 'rotated'})
+    assert main.get_woo_client('com') is not client
+    assert list(main._woo_clients) == ['com']
+
+
+def test_shared_client_reuses_connection(woo):
+    client = main.get_woo_client('com')
+    for _ in range(5):
+        client.get_products_page()
+    pools = client.session.get_adapter('http://').poolmanager.pools
+    assert [pools[key].num_connections for key in pools.keys()] == [1]
+
+
+def test_import_does_not_load_optional_engines():
+    code = 'import sys, main; print(",".join(m for m in ("async_engine", "httpx", "supabase", "dotenv") if m in sys.modules))'
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, cwd=main.__file__.rsplit('/', 1)[0], check=True)
+    assert output.stdout.strip() == ''
@@ -0,0 +1,65 @@
+"""多站点并发全量同步：各站点独立进度行，运行期间汇总到 'current' 行"""
+
+import pytest
+
+import main
+from fake_supabase import FakeSupabase
+from fake_woo import FakeWooServer, make_catalog
+
+
+PRODUCTS = 300
+
+
+@pytest.fixture
+def woo(monkeypatch):
+    catalog, variations = make_catalog(products=PRODUCTS, variations=2)
+    server = FakeWooServer(catalog, variations, latency=0.01).start()
+    for site in ('com', 'uk'):
+        monkeypatch.setitem(main.SITES, site, {'url': server.url, 'key': 'k', 'secret': 's'})
+    monkeypatch.setattr(main, 'SYNC_WRITE_MODE', 'rpc')
+    yield server
+    server.stop()
+
+
+class ProgressRecordingSupabase(FakeSupabase):
+    """记录写入 sync_progress 的每一行"""
+
+    def __init__(self):
+        super().__init__()
+        self.progress_writes = []
+
+    def table(self, name):
+        query = super().table(name)
+        if name == 'sync_progress':
+            upsert = query.upsert
+
+            def recording_upsert(rows, **kwargs):
+                self.progress_writes.append(dict(rows))
+                return upsert(rows, **kwargs)
+            query.upsert = recording_upsert
+        return query
+
+
+def test_concurrent_sync_writes_every_site(woo):
+    supabase = FakeSupabase()
+    result = main.full_sync_all_concurrent(supabase, ['com', 'uk', 'xx'], max_workers=4)
+
+    assert set(result['results']) == {'com', 'uk'}
+    assert all(r['success'] == PRODUCTS and r['failed'] == 0 for r in result['results'].values())
+    row = supabase.tables['products']['BENCH-000001']
+    assert set(row['prices']) == {'com', 'uk'}
+    assert set(row['variations']) == {'com', 'uk'}
+    progress = supabase.tables['sync_progress']
+    assert progress['com']['status'] == progress['uk']['status'] == 'completed'
+    assert progress['current']['status'] == 'completed' and progress['current']['success'] == 2 * PRODUCTS
+
+
+def test_current_row_aggregates_site_progress_while_running(woo, monkeypatch):
+    monkeypatch.setattr(main, 'PROGRESS_INTERVAL', 0.05)
+    supabase = ProgressRecordingSupabase()
+    main.full_sync_all_concurrent(supabase, ['com', 'uk'], max_workers=2)
+
+    running = [w for w in supabase.progress_writes if w['id'] == 'current' and w['status'] == 'running']
+    # 开始时的一次写入之外，还有运行期间的汇总进度
+    assert any(w['current'] > 0 for w in running)
+    assert all(w['current'] <= 2 * PRODUCTS for w in running)
@@ -0,0 +1,80 @@
+"""增量同步：水位线的建立和推进，只拉取水位线之后修改过的商品"""
+
+import pytest
+
+import main
+from fake_supabase import FakeSupabase
+from fake_woo import FakeWooServer, make_catalog
+
+
+PRODUCTS = 150
+
+
+@pytest.fixture
+def woo(monkeypatch):
+    catalog, variations = make_catalog(products=PRODUCTS, variations=1)
+    server = FakeWooServer(catalog, variations).start()
+    monkeypatch.setitem(main.SITES, 'com', {'url': server.url, 'key': 'k', 'secret': 's'})
+    monkeypatch.setattr(main, 'SYNC_WRITE_MODE', 'rpc')
+    yield server
+    server.stop()
+
+
+def modify(woo, product_id, modified, sale_price='9.99'):
+    woo.by_id[product_id].update(date_modified_gmt=modified, sale_price=sale_price)
+
+
+def test_first_run_is_full_and_saves_max_modified(woo):
+    supabase = FakeSupabase()
+    result = main.delta_sync_site(supabase, 'com', max_workers=4)
+
+    assert result['mode'] == 'full' and result['success'] == PRODUCTS
+    assert main.get_sync_watermark(supabase, 'com') == max(p['date_modified_gmt'] for p in woo.catalog)
+
+
+def test_delta_run_only_fetches_modified_products(woo):
+    supabase = FakeSupabase()
+    main.delta_sync_site(supabase, 'com', max_workers=4)
+    modify(woo, 1003, '2025-03-01T00:00:00')
+    modify(woo, 1007, '2025-03-02T00:00:00')
+
+    result = main.delta_sync_site(supabase, 'com', max_workers=4)
+
+    assert result['mode'] == 'delta' and result['total'] == 2 and result['success'] == 2
+    assert main.get_sync_watermark(supabase, 'com') == '2025-03-02T00:00:00'
+    products = supabase.tables['products']
+    assert products['BENCH-000003']['prices']['com'] == products['BENCH-000007']['prices']['com'] == 9.99
+    assert products['BENCH-000004']['prices']['com'] == 29.99
+
+    # 没有新的修改：不拉取商品，水位线不变
+    result = main.delta_sync_site(supabase, 'com', max_workers=4)
+    assert result['total'] == 0 and main.get_sync_watermark(supabase, 'com') == '2025-03-02T00:00:00'
+
+
+def test_write_failure_keeps_watermark(woo, monkeypatch):
+    supabase = FakeSupabase()
+    main.delta_sync_site(supabase, 'com', max_workers=4)
+    watermark = main.get_sync_watermark(supabase, 'com')
+    modify(woo, 1003, '2025-03-01T00:00:00')
+
+    def failing_merge(supabase, updates):
+        raise RuntimeError('boom')
+
+    monkeypatch.setattr(main, 'batch_merge_products', failing_merge)
+    monkeypatch.setattr(main.time, 'sleep', lambda seconds: None)
+    result = main.delta_sync_site(supabase, 'com', max_workers=4)
+
+    # 失败的商品下次增量同步重新拉取
+    assert result['failed'] == 1
+    assert main.get_sync_watermark(supabase, 'com') == watermark
+
+
+def test_full_flag_ignores_watermark(woo):
+    supabase = FakeSupabase()
+    main.save_sync_watermark(supabase, 'com', '2030-01-01T00:00:00')
+
+    result = main.delta_sync_site(supabase, 'com', max_workers=4, full=True)
+
+    assert result['mode'] == 'full' and result['total'] == PRODUCTS
+    # 重建的水位线是本次看到的最大修改时间
+    assert main.get_sync_watermark(supabase, 'com') == max(p['date_modified_gmt'] for p in woo.catalog)
@@ -0,0 +1,98 @@
+"""内容指纹：未变化的商品跳过写入，只有变体缓存标记过期时只写标记"""
+
+import pytest
+
+import main
+from fake_supabase import FakeSupabase
+from fake_woo import FakeWooServer, make_catalog
+
+
+PRODUCTS = 200
+
+
+@pytest.fixture
+def woo(monkeypatch):
+    catalog, variations = make_catalog(products=PRODUCTS, variations=2)
+    server = FakeWooServer(catalog, variations).start()
+    monkeypatch.setitem(main.SITES, 'com', {'url': server.url, 'key': 'k', 'secret': 's'})
+    monkeypatch.setattr(main, 'SYNC_WRITE_MODE', 'rpc')
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def written(monkeypatch):
+    """记录每次 rpc 写入的补丁"""
+    patches = []
+    merge = main.batch_merge_products
+
+    def recording_merge(supabase, updates):
+        patches.extend(main.merge_patches(updates))
+        return merge(supabase, updates)
+
+    monkeypatch.setattr(main, 'batch_merge_products', recording_merge)
+    return patches
+
+
+def update(sku='A', price=10.0, **extra):
+    return {'sku': sku, 'prices': {'com': price}, 'last_synced_at': '2026-01-01T00:00:00', **extra}
+
+
+def test_unchanged_update_is_skipped():
+    fingerprints = main.ContentFingerprints('com', {})
+    first = update()
+    assert fingerprints.changed(first)
+    stored = main.ContentFingerprints('com', {'A': first['content_hashes']['com']})
+
+    assert not stored.changed(update())
+    assert stored.changed(update(price=11.0))
+    assert stored.stats() == {'changed': 1, 'unchanged': 1, 'marker_only': 0}
+
+
+def test_only_new_variation_cache_marker_writes_marker_only():
+    first = update(variations={'com': [{'id': 1}]})
+    main.ContentFingerprints('com', {}).changed(first)
+    fingerprints = main.ContentFingerprints('com', {'A': first['content_hashes']['com']})
+
+    marker = {'com': {'modified': 'm', 'fetched_at': 'f'}}
+    refreshed = update(variations={'com': [{'id': 1}]}, variation_cache=marker)
+    assert fingerprints.changed(refreshed)
+    assert refreshed == {'sku': 'A', 'variation_cache': marker, 'last_synced_at': '2026-01-01T00:00:00'}
+    assert fingerprints.stats() == {'changed': 0, 'unchanged': 0, 'marker_only': 1}
+
+    # 变体本身变化时仍是完整写入
+    changed = update(variations={'com': [{'id': 2}]}, variation_cache=marker)
+    assert fingerprints.changed(changed)
+    assert 'variations' in changed and fingerprints.changed_count == 1
+
+
+def test_content_change_increments_change_score():
+    first = update()
+    main.ContentFingerprints('com', {}).changed(first)
+    fingerprints = main.ContentFingerprints('com', {'A': first['content_hashes']['com']})
+    changed = update(price=12.0)
+    fingerprints.changed(changed)
+    assert changed['change_stats']['com']['score'] == 1.0
+
+
+def test_second_sync_skips_unchanged_and_expired_cache_writes_only_markers(woo, written):
+    supabase = FakeSupabase()
+    first = main.full_sync_site(supabase, 'com', max_workers=4)
+    assert first['changes']['changed'] == PRODUCTS
+    assert len(written) == PRODUCTS
+
+    written.clear()
+    second = main.full_sync_site(supabase, 'com', max_workers=4)
+    assert second['changes'] == {'changed': 0, 'unchanged': PRODUCTS, 'marker_only': 0}
+    assert written == []
+
+    # 变体缓存过期：重新获取变体，内容未变，只写缓存标记
+    for row in supabase.tables['products'].values():
+        row['variation_cache']['com']['fetched_at'] = '2000-01-01T00:00:00'
+    content = {sku: row['content'] for sku, row in supabase.tables['products'].items()}
+    third = main.full_sync_site(supabase, 'com', max_workers=4)
+
+    variable = sum(1 for row in supabase.tables['products'].values() if row['variations']['com'])
+    assert third['changes'] == {'changed': 0, 'unchanged': PRODUCTS - variable, 'marker_only': variable}
+    assert {tuple(sorted(p)) for p in written} == {('last_synced_at', 'sku', 'variation_cache')}
+    assert {sku: row['content'] for sku, row in supabase.tables['products'].items()} == content
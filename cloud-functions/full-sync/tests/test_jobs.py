@@ -0,0 +1,105 @@
+"""异步任务：认领、租约续约和接手租约过期的任务"""
+
+from datetime import datetime, timedelta
+
+import main
+from fake_supabase import FakeSupabase
+
+
+def add_job(supabase, job_id, status='queued', created_at='2026-01-01T00:00:00', **fields):
+    supabase.table('sync_jobs').insert({
+        'id': job_id, 'action': 'sync-site', 'params': {}, 'dedupe_key': job_id,
+        'status': status, 'created_at': created_at, 'attempts': 0, **fields,
+    }).execute()
+
+
+def job_row(supabase, job_id):
+    return supabase.table('sync_jobs').select().eq('id', job_id).execute().data[0]
+
+
+def test_claims_queued_jobs_in_order_with_lease():
+    supabase = FakeSupabase()
+    add_job(supabase, 'second', created_at='2026-01-02T00:00:00')
+    add_job(supabase, 'first')
+    
+    job = main.claim_next_job(supabase)
+    
+    assert job['id'] == 'first' and job['status'] == 'running' and job['attempts'] == 1
+    assert job['lease_expires_at'] > datetime.utcnow().isoformat()
+    assert main.claim_next_job(supabase)['id'] == 'second'
+    assert main.claim_next_job(supabase) is None
+
+
+def test_running_job_with_live_lease_is_not_reclaimed():
+    supabase = FakeSupabase()
+    add_job(supabase, 'job')
+    main.claim_next_job(supabase)
+    assert main.claim_next_job(supabase) is None
+
+
+def test_reclaims_running_job_with_expired_lease():
+    supabase = FakeSupabase()
+    expired = (datetime.utcnow() - timedelta(seconds=1)).isoformat()
+    add_job(supabase, 'dead', status='running', attempts=1, claim_id='old', lease_expires_at=expired)
+    
+    job = main.claim_next_job(supabase)
+    
+    assert job['id'] == 'dead' and job['attempts'] == 2 and job['claim_id'] != 'old'
+    assert job['lease_expires_at'] > datetime.utcnow().isoformat()
+    # 被接手的旧执行者不能再续约
+    assert not main.renew_job_lease(supabase, {'id': 'dead', 'claim_id': 'old'})
+    assert main.renew_job_lease(supabase, job)
+
+
+def test_expired_job_fails_after_max_attempts():
+    supabase = FakeSupabase()
+    expired = (datetime.utcnow() - timedelta(seconds=1)).isoformat()
+    add_job(supabase, 'dead', status='running', attempts=main.JOB_MAX_ATTEMPTS, lease_expires_at=expired)
+    
+    assert main.claim_next_job(supabase) is None
+    assert job_row(supabase, 'dead')['status'] == 'error'
+
+
+def test_status_marks_expired_running_jobs_stale():
+    supabase = FakeSupabase()
+    expired = (datetime.utcnow() - timedelta(seconds=1)).isoformat()
+    add_job(supabase, 'dead', status='running', attempts=1, lease_expires_at=expired)
+    add_job(supabase, 'live')
+    main.claim_next_job(supabase)  # 先接手 dead
+    main.claim_next_job(supabase)  # 再认领 live
+    supabase.table('sync_jobs').update({'lease_expires_at': expired}).eq('id', 'dead').execute()
+    
+    jobs = {job['id']: job for job in main.get_sync_jobs(supabase, ['dead', 'live'])}
+    
+    assert jobs['dead']['stale'] is True and jobs['live']['stale'] is False
+
+
+def test_run_queued_jobs_records_result(monkeypatch):
+    supabase = FakeSupabase()
+    add_job(supabase, 'job')
+    monkeypatch.setattr(main, 'run_sync_action', lambda supabase, action, params: ({'success': True}, []))
+    
+    main.run_queued_jobs(supabase)
+    
+    row = job_row(supabase, 'job')
+    assert row['status'] == 'completed' and row['result'] == {'success': True}
+
+
+def test_submit_dedupes_against_queued_and_live_running_jobs(monkeypatch):
+    monkeypatch.setattr(main, 'start_job_worker', lambda supabase: None)
+    supabase = FakeSupabase()
+    job = {'action': 'sync-site', 'site': 'com'}
+    
+    first = main.submit_sync_job(supabase, job)
+    assert first['deduplicated'] is False
+    assert main.submit_sync_job(supabase, job) == {'job_id': first['job_id'], 'status': 'queued', 'deduplicated': True}
+    
+    # 执行中（租约有效）的相同任务也不重复排队
+    main.claim_next_job(supabase)
+    assert main.submit_sync_job(supabase, job) == {'job_id': first['job_id'], 'status': 'running', 'deduplicated': True}
+    assert main.submit_sync_job(supabase, {**job, 'site': 'uk'})['deduplicated'] is False
+    
+    # 租约过期后执行实例已被回收，重新排队
+    expired = (datetime.utcnow() - timedelta(seconds=1)).isoformat()
+    supabase.table('sync_jobs').update({'lease_expires_at': expired}).eq('id', first['job_id']).execute()
+    assert main.submit_sync_job(supabase, job)['deduplicated'] is False
@@ -0,0 +1,88 @@
+"""同步指标：阶段耗时、按接口的请求直方图、运行历史和 Prometheus 文本格式"""
+
+import pytest
+
+import main
+from fake_supabase import FakeSupabase
+from fake_woo import FakeWooServer, make_catalog
+
+
+PRODUCTS = 250
+
+
+@pytest.fixture
+def woo(monkeypatch):
+    catalog, variations = make_catalog(products=PRODUCTS, variations=2)
+    server = FakeWooServer(catalog, variations).start()
+    monkeypatch.setitem(main.SITES, 'com', {'url': server.url, 'key': 'k', 'secret': 's'})
+    monkeypatch.setattr(main, 'SYNC_WRITE_MODE', 'rpc')
+    yield server
+    server.stop()
+
+
+def prometheus_samples(text):
+    return dict(line.rsplit(' ', 1) for line in text.splitlines() if line and not line.startswith('#'))
+
+
+def test_sync_result_metrics_match_requests_made(woo):
+    result = main.full_sync_site(FakeSupabase(), 'com', max_workers=4)
+    metrics = result['metrics']
+
+    assert set(metrics['phases']) == set(main.SyncMetrics.PHASES)
+    assert metrics['phases']['fetch_variations'] > 0 and metrics['phases']['upsert'] > 0
+    assert metrics['requests']['products']['count'] == 3
+    assert metrics['requests']['variations']['count'] == PRODUCTS
+    for entry in metrics['requests'].values():
+        assert sum(entry['buckets'].values()) == entry['count']
+    assert sum(metrics['statuses'].values()) == woo.stats['requests']
+    # 替身站点不支持批量列出变体：探测请求得到 400
+    assert metrics['statuses']['400'] == metrics['requests']['variations_bulk']['count']
+    assert metrics['bytes_received'] == woo.stats['bytes_sent']
+    assert metrics['retries'] == 0
+
+
+def test_retries_and_overload_statuses_are_recorded(monkeypatch):
+    catalog, variations = make_catalog(products=10, variations=1)
+    server = FakeWooServer(catalog, variations, error_rate=0.3, seed=1).start()
+    monkeypatch.setitem(main.SITES, 'com', {'url': server.url, 'key': 'k', 'secret': 's'})
+    monkeypatch.setattr(main.time, 'sleep', lambda seconds: None)
+    try:
+        client = main.WooCommerceClient('com', metrics=main.SyncMetrics('com'))
+        for product in client.get_products_page():
+            client.get_product_variations(product['id'])
+    finally:
+        server.stop()
+
+    metrics = client.metrics.to_dict()
+    assert metrics['statuses']['503'] == server.stats['errors'] == metrics['retries'] > 0
+    assert metrics['statuses']['200'] == 11
+
+
+def test_merge_adds_shard_snapshots():
+    first, second = main.SyncMetrics('com'), main.SyncMetrics('com')
+    first.record_request('products', 0.07, 200, 100)
+    second.record_request('products', 3.0, 503, 10)
+    second.record_retry()
+
+    merged = main.SyncMetrics.merge([first.to_dict(), second.to_dict(), None])
+
+    assert merged['requests']['products']['count'] == 2
+    assert merged['requests']['products']['buckets']['0.1'] == merged['requests']['products']['buckets']['5'] == 1
+    assert merged['statuses'] == {'200': 1, '503': 1}
+    assert merged['retries'] == 1 and merged['bytes_received'] == 110
+
+
+def test_recorded_runs_render_as_prometheus(woo):
+    supabase = FakeSupabase()
+    result = main.full_sync_site(supabase, 'com', max_workers=4)
+    main.record_sync_runs(supabase, 'sync-site', [result, {'site': 'uk', 'success': 0}])
+
+    runs = main.get_latest_sync_runs(supabase, ['com', 'uk'])
+    assert [run['site'] for run in runs] == ['com'] and runs[0]['status'] == 'completed'
+
+    samples = prometheus_samples(main.format_prometheus(runs))
+    assert samples['full_sync_products{site="com",result="success"}'] == str(PRODUCTS)
+    assert samples['full_sync_request_duration_seconds_count{site="com",endpoint="variations"}'] == str(PRODUCTS)
+    # 直方图的桶是累积的，+Inf 桶等于请求总数
+    assert samples['full_sync_request_duration_seconds_bucket{site="com",endpoint="variations",le="+Inf"}'] == str(PRODUCTS)
+    assert samples['full_sync_retries{site="com"}'] == '0'
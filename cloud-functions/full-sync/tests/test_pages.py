@@ -0,0 +1,78 @@
+"""并行预取商品页面：按页码顺序产出，在途页面数不超过 max_workers"""
+
+import threading
+
+import pytest
+
+import main
+from fake_woo import FakeWooServer, make_catalog
+
+
+PRODUCTS = 1050
+
+
+@pytest.fixture
+def woo(monkeypatch):
+    catalog, variations = make_catalog(products=PRODUCTS, variations=0)
+    server = FakeWooServer(catalog, variations, latency=0.02).start()
+    monkeypatch.setitem(main.SITES, 'com', {'url': server.url, 'key': 'k', 'secret': 's'})
+    monkeypatch.setattr(main, '_woo_clients', {})
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def in_flight(woo, monkeypatch):
+    """记录 get_products_page 的最大并发数"""
+    client = main.get_woo_client('com')
+    get_page = client.get_products_page
+    state = {'current': 0, 'max': 0, 'pages': []}
+    lock = threading.Lock()
+
+    def counting_get_page(page=1, **kwargs):
+        with lock:
+            state['current'] += 1
+            state['max'] = max(state['max'], state['current'])
+            state['pages'].append(page)
+        try:
+            return get_page(page=page, **kwargs)
+        finally:
+            with lock:
+                state['current'] -= 1
+
+    monkeypatch.setattr(client, 'get_products_page', counting_get_page)
+    return client, state
+
+
+def test_pages_are_yielded_in_order_with_bounded_prefetch(in_flight):
+    client, state = in_flight
+    pages = list(client.iter_product_pages(max_workers=4))
+
+    assert [page for page, _, _ in pages] == list(range(1, 12))
+    assert {total for _, _, total in pages} == {PRODUCTS}
+    assert [p['id'] for _, products, _ in pages for p in products] == list(range(1000, 1000 + PRODUCTS))
+    # 第 1 页确定总页数，后续 10 页并行预取
+    assert sorted(state['pages']) == list(range(2, 12))
+    assert 1 < state['max'] <= 4
+
+
+def test_page_range(in_flight):
+    client, state = in_flight
+    pages = [page for page, _, _ in client.iter_product_pages(start_page=3, end_page=6)]
+    assert pages == [3, 4, 5, 6]
+    assert sorted(state['pages']) == [4, 5, 6]
+
+
+def test_closing_iterator_stops_prefetching(in_flight):
+    client, state = in_flight
+    pages = client.iter_product_pages(max_workers=2)
+    assert next(pages)[0] == 1 and next(pages)[0] == 2
+    pages.close()
+
+    # 只提交了滑动窗口内的页面，关闭后不再预取
+    assert len(state['pages']) <= 3
+
+
+def test_get_all_products_merges_pages(woo):
+    products = main.get_woo_client('com').get_all_products()
+    assert len(products) == PRODUCTS and len({p['id'] for p in products}) == PRODUCTS
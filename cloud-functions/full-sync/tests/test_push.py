@@ -0,0 +1,101 @@
+"""push 动作：推送载荷（PIM 价格、库存管理开关）和回显校验"""
+
+import pytest
+
+import main
+from fake_supabase import FakeSupabase
+from fake_woo import FakeWooServer, make_catalog
+
+
+@pytest.fixture
+def woo(monkeypatch):
+    catalog, variations = make_catalog(products=2, variations=2)
+    # 第二个商品为开启库存管理的简单商品
+    catalog[1].update(type='simple', manage_stock=True, stock_quantity=7)
+    variations[catalog[1]['id']] = []
+    server = FakeWooServer(catalog, variations).start()
+    monkeypatch.setitem(main.SITES, 'com', {'url': server.url, 'key': 'k', 'secret': 's'})
+    yield server
+    server.stop()
+
+
+def pending_row(sku, woo_id, price, regular_price, stock=100, variations=None):
+    return {
+        'sku': sku,
+        'woo_ids': {'com': woo_id},
+        'prices': {'com': price},
+        'regular_prices': {'com': regular_price},
+        'stock_quantities': {'com': stock},
+        'stock_statuses': {'com': 'instock'},
+        'statuses': {'com': 'publish'},
+        'variations': {'com': variations or []},
+        'variation_counts': {'com': len(variations or [])},
+        'sync_status': {'com': 'pending'},
+    }
+
+
+def test_variable_product_pushes_pim_prices_to_variations():
+    pulled = [{'id': 11, 'regular_price': '39.99', 'sale_price': '29.99', 'stock_quantity': 20}]
+    row = pending_row('A', 10, 19.99, 49.99, variations=pulled)
+    item, variation_items = main.build_push_items(row, 'com')
+    
+    assert item == {'id': 10, 'status': 'publish'}
+    assert variation_items == [{'id': 11, 'regular_price': '49.99', 'sale_price': '19.99'}]
+
+
+def test_price_without_discount_clears_sale_price():
+    item, _ = main.build_push_items(pending_row('A', 10, 30, 30), 'com')
+    assert item['regular_price'] == '30.00' and item['sale_price'] == ''
+
+
+def test_stock_quantity_only_sent_when_stock_managed():
+    row = pending_row('A', 10, 30, 40, stock=100)
+    unmanaged, _ = main.build_push_items(row, 'com')
+    managed, _ = main.build_push_items(row, 'com', manage_stock=True)
+    
+    assert 'stock_quantity' not in unmanaged and unmanaged['stock_status'] == 'instock'
+    assert managed['stock_quantity'] == 100 and 'stock_status' not in managed
+
+
+def test_push_mismatches():
+    item = {'id': 1, 'regular_price': '49.99', 'sale_price': '', 'stock_quantity': 5}
+    assert main.push_mismatches(item, {'id': 1, 'regular_price': '49.990', 'sale_price': '', 'stock_quantity': 5}) == []
+    assert main.push_mismatches(item, {'id': 1, 'regular_price': '39.99', 'sale_price': '29.99', 'stock_quantity': None}) == ['regular_price', 'sale_price', 'stock_quantity']
+
+
+def test_push_site_applies_pim_edit(woo):
+    variable, simple = woo.catalog
+    supabase = FakeSupabase()
+    pulled = main.build_site_variations(woo.variations[variable['id']])
+    supabase.table('products').upsert([
+        pending_row(variable['sku'], variable['id'], 19.99, 49.99, variations=pulled),
+        pending_row(simple['sku'], simple['id'], 25, 20, stock=3),
+    ], on_conflict='sku').execute()
+    
+    result = main.push_site(supabase, 'com')
+    
+    assert result['success'] == 2 and result['failed'] == 0
+    for v in woo.variations[variable['id']]:
+        assert (v['regular_price'], v['sale_price']) == ('49.99', '19.99')
+    # 未管理库存的可变商品不推送拉取时的默认库存 100
+    assert variable['stock_quantity'] is None
+    assert (simple['regular_price'], simple['sale_price'], simple['stock_quantity']) == ('25.00', '', 3)
+    rows = supabase.table('products').select().execute().data
+    assert {row['sync_status']['com'] for row in rows} == {'synced'}
+
+
+def test_push_site_marks_unapplied_items_as_error(woo, monkeypatch):
+    variable, _ = woo.catalog
+    supabase = FakeSupabase()
+    pulled = main.build_site_variations(woo.variations[variable['id']])
+    supabase.table('products').upsert([pending_row(variable['sku'], variable['id'], 19.99, 49.99, variations=pulled)], on_conflict='sku').execute()
+    # 站点接受请求但不应用价格，回显旧值
+    monkeypatch.setattr(main.WooCommerceClient, 'update_variations_batch', lambda self, pid, updates: [
+        {'id': u['id'], 'regular_price': '39.99', 'sale_price': '29.99'} for u in updates
+    ])
+    
+    result = main.push_site(supabase, 'com')
+    
+    assert result['failed'] == 1
+    assert all('not applied' in item['error'] for item in result['failed_items'])
+    assert supabase.table('products').select().execute().data[0]['sync_status']['com'] == 'error'
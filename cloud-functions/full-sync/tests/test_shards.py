@@ -0,0 +1,111 @@
+"""分片规划、分片同步和可恢复同步：页码范围、进度心跳、写入"""
+
+import pytest
+
+import main
+from fake_supabase import FakeSupabase
+from fake_woo import FakeWooServer, make_catalog
+
+
+PRODUCTS = 1000
+
+
+@pytest.fixture
+def woo(monkeypatch):
+    catalog, variations = make_catalog(products=PRODUCTS, variations=1)
+    server = FakeWooServer(catalog, variations).start()
+    monkeypatch.setitem(main.SITES, 'com', {'url': server.url, 'key': 'k', 'secret': 's'})
+    monkeypatch.setattr(main, 'SYNC_WRITE_MODE', 'rpc')
+    yield server
+    server.stop()
+
+
+class CountingSupabase(FakeSupabase):
+    """记录每个表的请求次数"""
+
+    def __init__(self):
+        super().__init__()
+        self.table_calls = {}
+
+    def table(self, name):
+        self.table_calls[name] = self.table_calls.get(name, 0) + 1
+        return super().table(name)
+
+
+@pytest.mark.parametrize('total, shards, per_page', [(1000, 4, 100), (1001, 4, 100), (250, 8, 100), (1000, 3, 50), (1, 5, 100)])
+def test_plan_shards_covers_every_page_once(total, shards, per_page):
+    ranges = main.plan_shards(total, shards, per_page)
+    pages = [page for start, end in ranges for page in range(start, end + 1)]
+    assert pages == list(range(1, -(-total // per_page) + 1))
+    assert len(ranges) <= shards
+    sizes = [end - start + 1 for start, end in ranges]
+    assert max(sizes) - min(sizes) <= 1
+
+
+def test_plan_shards_without_products():
+    assert main.plan_shards(0, 4) == []
+
+
+def test_coordinator_passes_per_page_to_shards(woo, monkeypatch):
+    supabase = FakeSupabase()
+    monkeypatch.setattr(main.get_woo_client('com'), 'per_page', 50)
+    payloads = []
+    
+    def dispatch(payload):
+        payloads.append(payload)
+        return main.run_shard_payload(supabase, payload)
+    
+    result = main.coordinate_sharded_sync(supabase, 'com', 3, dispatch)
+    
+    assert {p['per_page'] for p in payloads} == {50}
+    assert sorted((p['start_page'], p['end_page']) for p in payloads) == [(1, 7), (8, 14), (15, 20)]
+    assert result['success'] == PRODUCTS and result['failed'] == 0
+    assert len(supabase.tables['products']) == PRODUCTS
+
+
+def test_sync_shard_reports_progress_through_heartbeat(woo):
+    supabase = CountingSupabase()
+    result = main.sync_shard(supabase, 'com', 1, 10)
+
+    assert result['success'] == PRODUCTS and result['failed'] == 0
+    assert len(supabase.tables['products']) == PRODUCTS
+    # 10 页只有开始、心跳和最终状态写入，不再每页查询取消标志和写入进度
+    assert supabase.table_calls['sync_progress'] < 10
+    assert supabase.tables['sync_progress']['current']['status'] == 'completed'
+
+
+def test_resumable_sync_reports_progress_through_heartbeat(woo):
+    supabase = CountingSupabase()
+    result = main.resumable_sync_site(supabase, 'com')
+
+    assert result['status'] == 'completed' and result['success'] == PRODUCTS
+    assert len(supabase.tables['products']) == PRODUCTS
+    assert supabase.table_calls['sync_progress'] < 10
+    checkpoint = supabase.tables['sync_checkpoints']['com']
+    assert checkpoint['status'] == 'completed' and checkpoint['last_page'] == 10
+
+
+def test_completed_resume_advances_watermark_to_run_start(woo):
+    supabase = FakeSupabase()
+    paused = main.resumable_sync_site(supabase, 'com', time_budget=0)
+    assert paused['status'] == 'paused' and paused['last_page'] == 1
+    started_at = supabase.tables['sync_checkpoints']['com']['started_at']
+    assert main.get_sync_watermark(supabase, 'com') is None
+    
+    result = main.resume_sync(supabase, ['com'])
+    
+    assert result['results']['com']['status'] == 'completed' and result['pending'] == []
+    assert len(supabase.tables['products']) == PRODUCTS
+    assert main.get_sync_watermark(supabase, 'com') == started_at[:19]
+
+
+def test_completed_price_stock_resume_keeps_watermark(woo):
+    supabase = FakeSupabase()
+    paused = main.resumable_sync_site(supabase, 'com', price_stock_only=True, time_budget=0)
+    assert paused['status'] == 'paused'
+    
+    result = main.resume_sync(supabase, ['com'])
+    
+    assert result['results']['com']['status'] == 'completed'
+    # 价格/库存同步没有写入内容，下次增量同步仍需拉取此前的内容变化
+    assert main.get_sync_watermark(supabase, 'com') is None
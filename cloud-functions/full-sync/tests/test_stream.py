@@ -0,0 +1,85 @@
+"""流式流水线：与批量模式写入相同的数据，获取页面、处理和写入重叠执行"""
+
+import threading
+
+import pytest
+
+import main
+from fake_supabase import FakeSupabase
+from fake_woo import FakeWooServer, make_catalog
+
+
+PRODUCTS = 600
+
+
+@pytest.fixture
+def woo(monkeypatch):
+    catalog, variations = make_catalog(products=PRODUCTS, variations=2)
+    server = FakeWooServer(catalog, variations, latency=0.005).start()
+    monkeypatch.setitem(main.SITES, 'com', {'url': server.url, 'key': 'k', 'secret': 's'})
+    monkeypatch.setattr(main, 'SYNC_WRITE_MODE', 'rpc')
+    yield server
+    server.stop()
+
+
+def synced_rows(supabase):
+    """去掉每次运行都不同的同步时间"""
+    rows = {}
+    for sku, row in supabase.tables['products'].items():
+        row = {k: v for k, v in row.items() if k != 'last_synced_at'}
+        row['variation_cache'] = {site: {k: v for k, v in marker.items() if k != 'fetched_at'} for site, marker in row['variation_cache'].items()}
+        rows[sku] = row
+    return rows
+
+
+def test_stream_writes_same_rows_as_batch_mode(woo):
+    batch, stream = FakeSupabase(), FakeSupabase()
+    batch_result = main.full_sync_site(batch, 'com', max_workers=8)
+    stream_result = main.full_sync_site(stream, 'com', max_workers=8, stream=True)
+
+    assert stream_result['total'] == stream_result['success'] == PRODUCTS and stream_result['failed'] == 0
+    assert stream_result['watermark'] == batch_result['watermark']
+    assert synced_rows(stream) == synced_rows(batch)
+    assert stream.tables['sync_progress']['current']['status'] == 'completed'
+
+
+def test_writes_start_before_last_page_is_fetched(woo, monkeypatch):
+    # 站点限制每页 20 个，共 30 页
+    woo.page_size = 20
+    events = []
+    lock = threading.Lock()
+    get_page, merge = main.WooCommerceClient.get_products_page, main.batch_merge_products
+
+    def recording_get_page(self, page=1, **kwargs):
+        with lock:
+            events.append(('page', page))
+        return get_page(self, page=page, **kwargs)
+
+    def recording_merge(supabase, updates):
+        with lock:
+            events.append(('write', len(updates)))
+        return merge(supabase, updates)
+
+    monkeypatch.setattr(main.WooCommerceClient, 'get_products_page', recording_get_page)
+    monkeypatch.setattr(main, 'batch_merge_products', recording_merge)
+    supabase = FakeSupabase()
+    result = main.stream_sync_site(supabase, 'com', max_workers=8)
+
+    assert result['success'] == PRODUCTS and len(supabase.tables['products']) == PRODUCTS
+    last_page = events.index(('page', PRODUCTS // 20))
+    first_write = next(i for i, event in enumerate(events) if event[0] == 'write')
+    # 页面队列有界：最后一页要等前面的商品处理、写入后才会获取
+    assert first_write < last_page
+
+
+def test_page_fetch_error_reports_error(woo, monkeypatch):
+    def failing_pages(self, *args, **kwargs):
+        raise RuntimeError('boom')
+        yield
+
+    monkeypatch.setattr(main.WooCommerceClient, 'iter_product_pages', failing_pages)
+    supabase = FakeSupabase()
+    result = main.stream_sync_site(supabase, 'com', max_workers=4)
+
+    assert result['total'] == 0 and result.get('error') == 'boom'
+    assert supabase.tables['sync_progress']['current']['status'] == 'error'
@@ -0,0 +1,59 @@
+"""按 SKU 定向同步：以数据库 SKU 为准写入，写入失败重试后进入死信列表"""
+
+import pytest
+
+import main
+from fake_supabase import FakeSupabase
+from fake_woo import FakeWooServer, make_catalog
+
+
+PRODUCTS = 20
+
+
+@pytest.fixture
+def woo(monkeypatch):
+    catalog, variations = make_catalog(products=PRODUCTS, variations=2)
+    server = FakeWooServer(catalog, variations).start()
+    monkeypatch.setitem(main.SITES, 'com', {'url': server.url, 'key': 'k', 'secret': 's'})
+    monkeypatch.setattr(main, 'SYNC_WRITE_MODE', 'rpc')
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def supabase(woo):
+    supabase = FakeSupabase()
+    main.full_sync_site(supabase, 'com', max_workers=4)
+    return supabase
+
+
+def test_updates_are_keyed_by_database_sku(woo, supabase):
+    # 站点上修改了 SKU，数据库仍通过 woo_ids 关联到原来的行
+    woo.by_id[1000]['sku'] = 'RENAMED-000000'
+    woo.by_id[1001]['sku'] = ''
+    woo.by_id[1000]['sale_price'] = woo.by_id[1001]['sale_price'] = '19.99'
+
+    result = main.sync_skus(supabase, ['BENCH-000000', 'BENCH-000001'], ['com'])
+
+    assert result['written'] == 2 and result['sites']['com']['not_found'] == []
+    products = supabase.tables['products']
+    assert 'RENAMED-000000' not in products and '' not in products
+    assert products['BENCH-000000']['prices']['com'] == products['BENCH-000001']['prices']['com'] == 19.99
+
+
+def test_write_failures_go_to_dead_letter(woo, supabase, monkeypatch):
+    calls = []
+
+    def failing_merge(supabase, updates):
+        calls.append(len(updates))
+        raise RuntimeError('boom')
+
+    monkeypatch.setattr(main, 'batch_merge_products', failing_merge)
+    monkeypatch.setattr(main.time, 'sleep', lambda seconds: None)
+
+    result = main.sync_skus(supabase, ['BENCH-000002', 'BENCH-000003', 'MISSING'], ['com'])
+
+    assert len(calls) == main.WRITE_MAX_RETRIES
+    assert result['written'] == 0 and result['missing'] == ['MISSING']
+    assert result['dead_letter'] == [{'skus': ['BENCH-000002', 'BENCH-000003'], 'error': 'boom'}]
+    assert 'error' in result
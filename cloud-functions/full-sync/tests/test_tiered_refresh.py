@@ -0,0 +1,85 @@
+"""分层刷新：按衰减的变化分数分层，只刷新到期的层级，未变化的商品不写入"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import main
+from fake_supabase import FakeSupabase
+from fake_woo import FakeWooServer, make_catalog
+
+
+PRODUCTS = 30
+HOT = ['BENCH-000000', 'BENCH-000001']
+WARM = ['BENCH-000002']
+
+
+@pytest.fixture
+def woo(monkeypatch):
+    catalog, variations = make_catalog(products=PRODUCTS, variations=1)
+    server = FakeWooServer(catalog, variations).start()
+    monkeypatch.setitem(main.SITES, 'com', {'url': server.url, 'key': 'k', 'secret': 's'})
+    monkeypatch.setattr(main, 'SYNC_WRITE_MODE', 'rpc')
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def supabase(woo):
+    """全量同步后给部分商品设置变化分数"""
+    supabase = FakeSupabase()
+    main.full_sync_site(supabase, 'com', max_workers=4)
+    now = datetime.utcnow().isoformat()
+    products = supabase.tables['products']
+    for sku in HOT:
+        products[sku]['change_stats'] = {'com': {'score': 3.0, 'changed_at': now}}
+    for sku in WARM:
+        products[sku]['change_stats'] = {'com': {'score': 0.5, 'changed_at': now}}
+    return supabase
+
+
+def test_refresh_tier_uses_decayed_max_site_score():
+    now = datetime.utcnow()
+    week_ago = (now - timedelta(seconds=main.REFRESH_HALF_LIFE)).isoformat()
+
+    assert main.refresh_tier({'com': {'score': 4.0, 'changed_at': week_ago}}, now) == 'hot'
+    assert main.refresh_tier({'com': {'score': 3.0, 'changed_at': week_ago}}, now) == 'warm'
+    assert main.refresh_tier({'com': {'score': 0.1, 'changed_at': now.isoformat()}, 'uk': {'score': 2.5, 'changed_at': now.isoformat()}}, now) == 'hot'
+    assert main.refresh_tier(None, now) == 'cold'
+
+
+def test_dry_run_only_reports_tiers(supabase):
+    result = main.tiered_refresh(supabase, dry_run=True)
+
+    assert {name: tier['skus'] for name, tier in result['tiers'].items()} == {'hot': 2, 'warm': 1, 'cold': PRODUCTS - 3}
+    assert all(tier['due'] for tier in result['tiers'].values())
+    assert not supabase.tables.get('sync_refresh_tiers')
+
+
+def test_refreshes_due_tiers_and_writes_only_changes(woo, supabase):
+    woo.by_id[1000]['sale_price'] = '9.99'
+
+    first = main.tiered_refresh(supabase, max_workers=4)
+
+    tiers = first['tiers']
+    assert (tiers['hot']['changed'], tiers['hot']['unchanged']) == (1, 1)
+    assert (tiers['warm']['changed'], tiers['cold']['changed']) == (0, 0)
+    assert supabase.tables['products']['BENCH-000000']['prices']['com'] == 9.99
+    assert set(supabase.tables['sync_refresh_tiers']) == {'hot', 'warm', 'cold'}
+
+    # 刚刷新过，没有到期的层级；指定层级时强制刷新
+    second = main.tiered_refresh(supabase, max_workers=4)
+    assert not any(tier['due'] for tier in second['tiers'].values()) and 'changed' not in second['tiers']['hot']
+    forced = main.tiered_refresh(supabase, tiers=['warm'], max_workers=4)
+    assert forced['tiers']['warm']['unchanged'] == 1 and 'changed' not in forced['tiers']['cold']
+
+
+def test_failed_tier_is_not_marked_as_run(supabase, monkeypatch):
+    def failing_get(self, ids):
+        raise RuntimeError('boom')
+
+    monkeypatch.setattr(main.WooCommerceClient, 'get_products_by_ids', failing_get)
+    result = main.tiered_refresh(supabase, tiers=['hot'], max_workers=4)
+
+    assert result['tiers']['hot']['errors'] == ['com: boom'] and result['tiers']['hot']['failed'] == 2
+    assert not supabase.tables.get('sync_refresh_tiers')
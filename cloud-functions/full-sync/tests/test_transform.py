@@ -0,0 +1,21 @@
+"""整页转换：没有 SKU 的商品跳过，转换失败的商品记录日志并计为失败"""
+
+import logging
+
+import main
+
+
+def test_transform_failure_is_logged_and_counted(caplog):
+    products = [
+        {'id': 1, 'sku': 'OK', 'price': '10'},
+        {'id': 2, 'sku': 'BAD', 'price': 'not-a-number'},
+        {'id': 3, 'sku': '', 'price': '10'},
+    ]
+    with caplog.at_level(logging.ERROR, logger=main.logger.name):
+        transformed = main.ProductTransformer('com').transform_page(products)
+    assert '[BAD] 处理失败' in caplog.text
+    
+    results = [main.process_woo_product(None, p, 'com', update_data=u) for p, u in zip(products, transformed)]
+    assert results[0]['success'] and results[0]['data']['prices'] == {'com': 10.0}
+    assert results[1]['success'] is False and results[1]['sku'] == 'BAD'
+    assert results[2] is None
@@ -0,0 +1,54 @@
+"""WooCommerce 请求传输：长连接复用、gzip 压缩和字段投影"""
+
+import pytest
+
+import main
+from fake_supabase import FakeSupabase
+from fake_woo import FakeWooServer, make_catalog
+
+
+PRODUCTS = 300
+
+
+@pytest.fixture
+def woo(monkeypatch):
+    catalog, variations = make_catalog(products=PRODUCTS, variations=2)
+    server = FakeWooServer(catalog, variations).start()
+    monkeypatch.setitem(main.SITES, 'com', {'url': server.url, 'key': 'k', 'secret': 's'})
+    monkeypatch.setattr(main, 'SYNC_WRITE_MODE', 'rpc')
+    yield server
+    server.stop()
+
+
+def test_responses_are_gzip_compressed(woo):
+    client = main.WooCommerceClient('com', metrics=main.SyncMetrics('com'))
+    products = client.get_products_page()
+
+    assert len(products) == 100
+    assert woo.stats['gzip_responses'] == woo.stats['requests'] == 1
+    # 接收字节数按压缩后的传输大小记录
+    received = client.metrics.to_dict()['bytes_received']
+    assert received == woo.stats['bytes_sent'] < len(main.codec.dumps(products))
+
+
+def test_requests_project_only_used_fields(woo):
+    client = main.WooCommerceClient('com')
+    product = client.get_products_page()[0]
+    variation = client.get_product_variations(product['id'])[0]
+
+    assert set(product) == set(main.PRODUCT_FIELDS)
+    # 变体的 price、parent_id 不在投影字段中
+    assert set(variation) == set(main.VARIATION_FIELDS)
+
+    price_stock = main.WooCommerceClient('com', product_fields=main.PRICE_STOCK_FIELDS).get_products_page()[0]
+    assert set(price_stock) == set(main.PRICE_STOCK_FIELDS)
+
+
+def test_sync_reuses_pooled_connections(woo):
+    supabase = FakeSupabase()
+    result = main.full_sync_site(supabase, 'com', max_workers=4)
+
+    assert result['success'] == PRODUCTS
+    # 每个商品都要请求变体，但连接数不超过连接池大小（并发线程 + 页面预取线程）
+    assert woo.stats['requests'] > PRODUCTS
+    assert woo.stats['connections'] <= 4 + main.PAGE_FETCH_WORKERS
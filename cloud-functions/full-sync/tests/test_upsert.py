@@ -0,0 +1,125 @@
+"""upsert 写入模式：直接 POST 到 PostgREST 的批量请求体"""
+
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+import main
+from fake_postgrest import FakePostgrestServer
+from fake_supabase import FakeSupabase
+
+
+@pytest.fixture
+def postgrest():
+    server = FakePostgrestServer().start()
+    session = httpx.Client(base_url=f"{server.url}/rest/v1/")
+    # 读取走内存存储，写入走 HTTP，与 supabase-py 客户端的 postgrest.session 相同
+    yield server, SimpleNamespace(table=server.store.table, postgrest=SimpleNamespace(session=session))
+    session.close()
+    server.stop()
+
+
+def com_update(sku, attributes=None):
+    update = main.ProductTransformer('com').transform({
+        'id': 1, 'sku': sku, 'name': sku, 'price': '10', 'attributes': attributes or [],
+    })
+    update.update(variations={'com': []}, variation_counts={'com': 0})
+    return update
+
+
+def test_postgrest_columns_is_union_of_keys():
+    assert main.postgrest_columns([{'sku': 'A', 'name': 'x'}, {'sku': 'B', 'attributes': {}}]) == '"attributes","name","sku"'
+
+
+def test_fake_rejects_mixed_keys_without_columns(postgrest):
+    server, _ = postgrest
+    response = httpx.post(f"{server.url}/rest/v1/products?on_conflict=sku", json=[{'sku': 'A', 'name': 'x'}, {'sku': 'B'}])
+    assert response.status_code == 400 and response.json()['code'] == 'PGRST102'
+
+
+def test_upsert_batch_mixing_products_with_and_without_attributes(postgrest):
+    server, supabase = postgrest
+    updates = [
+        com_update('WITH', [{'name': 'Season', 'options': ['2024/25']}]),
+        com_update('WITHOUT'),
+    ]
+    assert 'attributes' in updates[0] and 'attributes' not in updates[1]
+    
+    main._merge_and_upsert(supabase, main.merge_patches(updates))
+    
+    rows = {row['sku']: row for row in server.store.table('products').select().execute().data}
+    assert rows['WITH']['attributes'] == {'season': '2024/25'}
+    assert rows['WITHOUT']['prices'] == {'com': 10.0}
+
+
+def test_price_stock_batch_only_reads_and_writes_price_stock_columns(postgrest):
+    server, supabase = postgrest
+    main._merge_and_upsert(supabase, [com_update('A')])
+    
+    selects = []
+    
+    def recording_table(name):
+        query = server.store.table(name)
+        select = query.select
+        query.select = lambda columns='*', **kwargs: (selects.append(columns), select(columns, **kwargs))[1]
+        return query
+    
+    supabase.table = recording_table
+    update = main.ProductTransformer('uk', price_stock_only=True).transform({'sku': 'A', 'price': '12'})
+    assert set(update) == set(main.PRICE_STOCK_KEYS)
+    main._merge_and_upsert(supabase, [update])
+    
+    assert selects == ['sku, prices, regular_prices, stock_quantities, stock_statuses, statuses']
+    row = server.store.table('products').select().execute().data[0]
+    assert row['prices'] == {'com': 10.0, 'uk': 12.0}
+    # content 没有被读取，也没有被改写
+    assert row['content'] == {'com': {'name': 'A', 'description': '', 'short_description': ''}}
+
+
+def test_marker_only_rows_keep_shared_fields_in_mixed_batch(postgrest):
+    server, supabase = postgrest
+    main._merge_and_upsert(supabase, [com_update('MARKER'), com_update('FULL')])
+    
+    marker = {'com': {'modified': 'm', 'fetched_at': 'f'}}
+    main._merge_and_upsert(supabase, [
+        {'sku': 'MARKER', 'variation_cache': marker, 'last_synced_at': '2026-01-01T00:00:00'},
+        com_update('FULL'),
+    ])
+    
+    rows = {row['sku']: row for row in server.store.table('products').select().execute().data}
+    assert rows['MARKER']['name'] == 'MARKER'
+    assert rows['MARKER']['variation_cache'] == marker
+    assert rows['MARKER']['prices'] == {'com': 10.0}
+
+
+def test_postgrest_session_only_for_usable_sessions(postgrest):
+    _, supabase = postgrest
+    assert main.postgrest_session(supabase) is supabase.postgrest.session
+    assert main.postgrest_session(FakeSupabase()) is None
+    assert main.postgrest_session(SimpleNamespace(postgrest=SimpleNamespace())) is None
+    assert main.postgrest_session(SimpleNamespace(postgrest=SimpleNamespace(session=object()))) is None
+
+
+def test_writer_posts_through_session(postgrest):
+    server, supabase = postgrest
+    writer = main.PostgrestWriter(supabase)
+    
+    writer.upsert('products', [{'sku': 'A', 'name': 'x'}, {'sku': 'B'}], on_conflict='sku')
+    assert writer.rpc('merge_product_patches', {'patches': [{'sku': 'A', 'prices': {'com': 1.0}}]}) == 1
+    
+    assert server.stats['requests'] == 2
+    rows = {row['sku']: row for row in server.store.table('products').select().execute().data}
+    assert rows['A'] == {'sku': 'A', 'name': 'x', 'prices': {'com': 1.0}}
+    assert rows['B']['name'] is None
+
+
+def test_writer_falls_back_to_client_without_session():
+    supabase = FakeSupabase()
+    writer = main.PostgrestWriter(supabase)
+    assert writer.session is None
+    
+    writer.upsert('products', [{'sku': 'A', 'name': 'x'}], on_conflict='sku')
+    assert writer.rpc('merge_product_patches', {'patches': [{'sku': 'A', 'prices': {'com': 1.0}}]}) == 1
+    
+    assert supabase.tables['products']['A'] == {'sku': 'A', 'name': 'x', 'prices': {'com': 1.0}}
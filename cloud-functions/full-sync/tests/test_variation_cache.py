@@ -0,0 +1,77 @@
+"""变体缓存：父商品未修改且未过期时跳过变体请求，保留已存储的变体"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import main
+from fake_supabase import FakeSupabase
+from fake_woo import FakeWooServer, make_catalog
+
+
+PRODUCTS = 120
+
+
+@pytest.fixture
+def woo(monkeypatch):
+    catalog, variations = make_catalog(products=PRODUCTS, variations=3)
+    server = FakeWooServer(catalog, variations).start()
+    monkeypatch.setitem(main.SITES, 'com', {'url': server.url, 'key': 'k', 'secret': 's'})
+    monkeypatch.setattr(main, 'SYNC_WRITE_MODE', 'rpc')
+    yield server
+    server.stop()
+
+
+def variation_requests(result):
+    return result['metrics']['requests'].get('variations', {}).get('count', 0)
+
+
+def test_is_cached_requires_same_modified_and_unexpired_entry():
+    fetched = (datetime.utcnow() - timedelta(hours=1)).isoformat()
+    cache = main.VariationCache('com', {'A': {'modified': 'm1', 'fetched_at': fetched}}, ttl=7200)
+
+    assert cache.is_cached('A', 'm1')
+    assert not cache.is_cached('A', 'm2')
+    assert not cache.is_cached('B', 'm1')
+    assert not main.VariationCache('com', cache.entries, ttl=1800).is_cached('A', 'm1')
+    assert not main.VariationCache('com', {'A': {'modified': 'm1'}}).is_cached('A', 'm1')
+
+
+def test_second_sync_skips_variation_requests(woo):
+    supabase = FakeSupabase()
+    first = main.full_sync_site(supabase, 'com', max_workers=4)
+    assert variation_requests(first) == PRODUCTS
+    variations = {sku: row['variations'] for sku, row in supabase.tables['products'].items()}
+
+    second = main.full_sync_site(supabase, 'com', max_workers=4)
+
+    assert second['success'] == PRODUCTS
+    assert variation_requests(second) == 0
+    assert second['variation_cache'] == {'hits': PRODUCTS, 'misses': 0}
+    assert {sku: row['variations'] for sku, row in supabase.tables['products'].items()} == variations
+
+
+def test_modified_parent_refetches_its_variations(woo):
+    supabase = FakeSupabase()
+    main.full_sync_site(supabase, 'com', max_workers=4)
+    woo.by_id[1005]['date_modified_gmt'] = '2025-06-01T00:00:00'
+    woo.variations[1005][0]['stock_quantity'] = 0
+
+    result = main.full_sync_site(supabase, 'com', max_workers=4)
+
+    assert variation_requests(result) == 1
+    assert result['variation_cache'] == {'hits': PRODUCTS - 1, 'misses': 1}
+    row = supabase.tables['products']['BENCH-000005']
+    assert row['variations']['com'][0]['stock_quantity'] == 0
+    assert row['variation_cache']['com']['modified'] == '2025-06-01T00:00:00'
+
+
+@pytest.mark.parametrize('options', [{'refresh_variations': True}, {'price_stock_only': True}])
+def test_refresh_and_price_stock_sync_bypass_cache(woo, options):
+    supabase = FakeSupabase()
+    main.full_sync_site(supabase, 'com', max_workers=4)
+
+    result = main.full_sync_site(supabase, 'com', max_workers=4, **options)
+
+    assert variation_requests(result) == PRODUCTS
+    assert 'variation_cache' not in result
@@ -0,0 +1,69 @@
+"""upsert 模式按 SKU 集合加锁，以及 BatchWriter 的并行写入和 drain"""
+
+import threading
+import time
+
+import main
+
+
+def _track_concurrency(monkeypatch, delay=0.1):
+    """把 _merge_and_upsert 换成记录并发数的慢写入"""
+    state = {'active': 0, 'peak': 0, 'written': []}
+    lock = threading.Lock()
+
+    def fake_merge_and_upsert(supabase, updates, metrics=None):
+        with lock:
+            state['active'] += 1
+            state['peak'] = max(state['peak'], state['active'])
+        time.sleep(delay)
+        with lock:
+            state['active'] -= 1
+            state['written'].extend(u['sku'] for u in updates)
+
+    monkeypatch.setattr(main, 'SYNC_WRITE_MODE', 'upsert')
+    monkeypatch.setattr(main, '_merge_and_upsert', fake_merge_and_upsert)
+    return state
+
+
+def _write_in_threads(batches):
+    threads = [threading.Thread(target=main.batch_update_products, args=(None, batch, 'com')) for batch in batches]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_disjoint_sku_sets_write_in_parallel(monkeypatch):
+    state = _track_concurrency(monkeypatch)
+    _write_in_threads([[{'sku': 'A'}, {'sku': 'B'}], [{'sku': 'C'}, {'sku': 'D'}]])
+    assert state['peak'] == 2
+    assert sorted(state['written']) == ['A', 'B', 'C', 'D']
+
+
+def test_overlapping_sku_sets_are_serialized(monkeypatch):
+    state = _track_concurrency(monkeypatch)
+    _write_in_threads([[{'sku': 'A'}, {'sku': 'B'}], [{'sku': 'B'}, {'sku': 'C'}]])
+    assert state['peak'] == 1
+    assert sorted(state['written']) == ['A', 'B', 'B', 'C']
+
+
+def test_batch_writer_workers_write_concurrently(monkeypatch):
+    state = _track_concurrency(monkeypatch)
+    writer = main.BatchWriter(None, 'com', workers=2, batch_size=2)
+    for sku in 'ABCD':
+        writer.add({'sku': sku})
+    stats = writer.close()
+    assert state['peak'] == 2
+    assert stats['written'] == 4 and stats['batches'] == 2
+
+
+def test_drain_waits_for_pending_batches(monkeypatch):
+    state = _track_concurrency(monkeypatch, delay=0.05)
+    writer = main.BatchWriter(None, 'com', workers=2, batch_size=10)
+    for sku in 'ABC':
+        writer.add({'sku': sku})
+    writer.drain()
+    assert sorted(state['written']) == ['A', 'B', 'C']
+    writer.add({'sku': 'D'})
+    writer.close(discard_pending=True)
+    assert 'D' not in state['written']
@@ -0,0 +1 @@
+../cloud-functions/full-sync/codec.py
\ No newline at end of file
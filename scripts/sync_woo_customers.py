@@ -11,6 +11,8 @@ from base64 import b64encode
 import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+import codec  # JSON 编码：有 orjson 时使用 orjson（与 full-sync 共用）
+
 sys.stdout.reconfigure(line_buffering=True)
 
 # Supabase 配置
@@ -85,7 +87,7 @@ def batch_upsert_customers(customers_data: list):
         "Prefer": "resolution=merge-duplicates",
     }
 
-    response = session.post(url, headers=headers, json=customers_data, timeout=30)
+    response = session.post(url, headers=headers, data=codec.dumps(customers_data), timeout=30)
     return response.status_code in [200, 201]
 
 
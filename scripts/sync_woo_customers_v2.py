@@ -11,6 +11,8 @@ from base64 import b64encode
 import time
 import argparse
 
+import codec  # JSON 编码：有 orjson 时使用 orjson（与 full-sync 共用）
+
 sys.stdout.reconfigure(line_buffering=True)
 
 # Supabase 配置
@@ -146,7 +148,7 @@ def batch_upsert_customers(updates: list, creates: list) -> tuple:
     # 1. 处理更新
     if updates:
         try:
-            response = session.post(url, headers=headers, json=updates, timeout=60)
+            response = session.post(url, headers=headers, data=codec.dumps(updates), timeout=60)
             if response.status_code not in [200, 201]:
                 errors.append(f"Updates failed: HTTP {response.status_code}: {response.text[:100]}")
         except Exception as e:
@@ -155,7 +157,7 @@ def batch_upsert_customers(updates: list, creates: list) -> tuple:
     # 2. 处理创建
     if creates:
         try:
-            response = session.post(url, headers=headers, json=creates, timeout=60)
+            response = session.post(url, headers=headers, data=codec.dumps(creates), timeout=60)
             if response.status_code not in [200, 201]:
                 errors.append(f"Creates failed: HTTP {response.status_code}: {response.text[:100]}")
         except Exception as e:
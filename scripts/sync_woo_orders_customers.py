@@ -10,6 +10,8 @@ from base64 import b64encode
 import time
 import argparse
 
+import codec  # JSON 编码：有 orjson 时使用 orjson（与 full-sync 共用）
+
 sys.stdout.reconfigure(line_buffering=True)
 
 # Supabase 配置
@@ -143,7 +145,7 @@ def batch_upsert_customers(updates: list, creates: list) -> tuple:
 
     if updates:
         try:
-            response = session.post(url, headers=headers, json=updates, timeout=60)
+            response = session.post(url, headers=headers, data=codec.dumps(updates), timeout=60)
             if response.status_code not in [200, 201]:
                 errors.append(f"Updates: HTTP {response.status_code}: {response.text[:100]}")
         except Exception as e:
@@ -151,7 +153,7 @@ def batch_upsert_customers(updates: list, creates: list) -> tuple:
 
     if creates:
         try:
-            response = session.post(url, headers=headers, json=creates, timeout=60)
+            response = session.post(url, headers=headers, data=codec.dumps(creates), timeout=60)
             if response.status_code not in [200, 201]:
                 errors.append(f"Creates: HTTP {response.status_code}: {response.text[:100]}")
         except Exception as e:
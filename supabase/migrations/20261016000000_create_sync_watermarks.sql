@@ -0,0 +1,14 @@
+-- 增量同步水位线表
+-- 每个站点记录上次同步到的最大 date_modified_gmt，供 full-sync Cloud Function 的 delta-sync 使用
+
+CREATE TABLE IF NOT EXISTS sync_watermarks (
+  site TEXT PRIMARY KEY,                       -- 站点: com, uk, de, fr
+  modified_after TEXT NOT NULL,                -- WooCommerce date_modified_gmt（ISO8601，GMT，无时区后缀）
+  updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+ALTER TABLE sync_watermarks ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Allow all access to sync_watermarks" ON sync_watermarks FOR ALL USING (true);
+
+COMMENT ON TABLE sync_watermarks IS '各站点增量同步水位线，delta-sync 只拉取 modified_after 之后修改过的商品';
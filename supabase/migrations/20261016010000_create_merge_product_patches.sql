@@ -0,0 +1,79 @@
+-- 服务端 JSONB 合并写入
+-- full-sync Cloud Function 按批次提交各站点的商品补丁，在一个函数调用（一个事务）内完成
+-- 各站点字段的 jsonb || 合并，不再需要「先读取现有数据、在 Python 中合并、再整行写回」
+
+-- 确保合并用到的各站点字段存在（线上已存在，本地数据库补齐）
+ALTER TABLE products ADD COLUMN IF NOT EXISTS regular_prices JSONB DEFAULT '{}'::jsonb;
+ALTER TABLE products ADD COLUMN IF NOT EXISTS stock_quantities JSONB DEFAULT '{}'::jsonb;
+ALTER TABLE products ADD COLUMN IF NOT EXISTS stock_statuses JSONB DEFAULT '{}'::jsonb;
+ALTER TABLE products ADD COLUMN IF NOT EXISTS statuses JSONB DEFAULT '{}'::jsonb;
+ALTER TABLE products ADD COLUMN IF NOT EXISTS variations JSONB DEFAULT '{}'::jsonb;
+ALTER TABLE products ADD COLUMN IF NOT EXISTS variation_counts JSONB DEFAULT '{}'::jsonb;
+
+-- patches: [{ sku, prices: {site: ...}, content: {site: {...}}, ..., name?, images?, categories?, attributes? }]
+-- 各站点字段（prices, content, variations 等）与现有值做浅合并（jsonb ||），与 Python 中 {**existing, **update} 语义一致；
+-- 共享字段（name, images, categories, attributes）只有补丁中存在时才覆盖。
+-- 返回更新的行数
+CREATE OR REPLACE FUNCTION merge_product_patches(patches JSONB)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  affected INTEGER;
+BEGIN
+  -- 1. 新 SKU 先插入空行（name 优先取补丁中的共享名称，其次取站点内容名称，最后用 SKU 兜底）
+  INSERT INTO products (sku, name)
+  SELECT
+    x.sku,
+    COALESCE(
+      x.name,
+      (SELECT c.value ->> 'name' FROM jsonb_each(COALESCE(x.content, '{}'::jsonb)) AS c LIMIT 1),
+      x.sku
+    )
+  FROM jsonb_to_recordset(patches) AS x(sku TEXT, name TEXT, content JSONB)
+  WHERE x.sku IS NOT NULL AND x.sku <> ''
+  ON CONFLICT (sku) DO NOTHING;
+
+  -- 2. 行级原子合并：UPDATE 在行锁下读取最新值，多个站点并发写入同一 SKU 也不会丢失更新
+  UPDATE products AS p SET
+    prices           = COALESCE(p.prices, '{}'::jsonb)           || COALESCE(x.prices, '{}'::jsonb),
+    regular_prices   = COALESCE(p.regular_prices, '{}'::jsonb)   || COALESCE(x.regular_prices, '{}'::jsonb),
+    stock_quantities = COALESCE(p.stock_quantities, '{}'::jsonb) || COALESCE(x.stock_quantities, '{}'::jsonb),
+    stock_statuses   = COALESCE(p.stock_statuses, '{}'::jsonb)   || COALESCE(x.stock_statuses, '{}'::jsonb),
+    statuses         = COALESCE(p.statuses, '{}'::jsonb)         || COALESCE(x.statuses, '{}'::jsonb),
+    content          = COALESCE(p.content, '{}'::jsonb)          || COALESCE(x.content, '{}'::jsonb),
+    sync_status      = COALESCE(p.sync_status, '{}'::jsonb)      || COALESCE(x.sync_status, '{}'::jsonb),
+    variations       = COALESCE(p.variations, '{}'::jsonb)       || COALESCE(x.variations, '{}'::jsonb),
+    variation_counts = COALESCE(p.variation_counts, '{}'::jsonb) || COALESCE(x.variation_counts, '{}'::jsonb),
+    woo_ids          = COALESCE(p.woo_ids, '{}'::jsonb)          || COALESCE(x.woo_ids, '{}'::jsonb),
+    name             = COALESCE(x.name, p.name),
+    images           = COALESCE(x.images, p.images),
+    categories       = COALESCE(x.categories, p.categories),
+    attributes       = COALESCE(x.attributes, p.attributes),
+    last_synced_at   = COALESCE(x.last_synced_at, p.last_synced_at)
+  FROM jsonb_to_recordset(patches) AS x(
+    sku TEXT,
+    name TEXT,
+    images JSONB,
+    categories JSONB,
+    attributes JSONB,
+    prices JSONB,
+    regular_prices JSONB,
+    stock_quantities JSONB,
+    stock_statuses JSONB,
+    statuses JSONB,
+    content JSONB,
+    sync_status JSONB,
+    variations JSONB,
+    variation_counts JSONB,
+    woo_ids JSONB,
+    last_synced_at TIMESTAMPTZ
+  )
+  WHERE p.sku = x.sku;
+
+  GET DIAGNOSTICS affected = ROW_COUNT;
+  RETURN affected;
+END;
+$$;
+
+COMMENT ON FUNCTION merge_product_patches(JSONB) IS '批量合并各站点商品补丁（jsonb || 浅合并），供 full-sync Cloud Function 使用';
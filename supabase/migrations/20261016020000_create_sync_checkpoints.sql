@@ -0,0 +1,26 @@
+-- 可恢复同步检查点表
+-- full-sync Cloud Function 的 resumable 同步每写入一批商品就更新一次检查点，
+-- 函数超时或被终止后，resume 动作从 last_page / last_product_id 继续
+
+CREATE TABLE IF NOT EXISTS sync_checkpoints (
+  site TEXT PRIMARY KEY,                       -- 站点: com, uk, de, fr（每个站点只保留最近一次运行）
+  run_id TEXT NOT NULL,                        -- 运行 ID，恢复时沿用
+  status TEXT NOT NULL DEFAULT 'running',      -- running / paused / error 可恢复；completed / cancelled 已结束
+  last_page INTEGER NOT NULL DEFAULT 0,        -- 已写入数据库的最后一页（按商品 ID 升序分页）
+  last_product_id BIGINT NOT NULL DEFAULT 0,   -- 已写入数据库的最大 WooCommerce 商品 ID
+  total INTEGER NOT NULL DEFAULT 0,
+  success INTEGER NOT NULL DEFAULT 0,
+  failed INTEGER NOT NULL DEFAULT 0,
+  modified_after TEXT,                         -- 增量运行的起始水位线，恢复时沿用
+  watermark TEXT,                              -- 已处理商品的最大 date_modified_gmt
+  price_stock_only BOOLEAN NOT NULL DEFAULT FALSE,
+  error TEXT,
+  started_at TIMESTAMPTZ DEFAULT NOW(),
+  updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+ALTER TABLE sync_checkpoints ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Allow all access to sync_checkpoints" ON sync_checkpoints FOR ALL USING (true);
+
+COMMENT ON TABLE sync_checkpoints IS '各站点可恢复同步的检查点，resume 动作从这里继续未完成的运行';
@@ -0,0 +1,76 @@
+-- 内容指纹
+-- full-sync 写入商品时按站点记录各字段值的哈希：{site: {字段: 哈希}}。
+-- 下次同步提取的字段哈希与记录一致时跳过该商品的写入，减少 products 表的写入量和 WAL
+
+ALTER TABLE products ADD COLUMN IF NOT EXISTS content_hashes JSONB DEFAULT '{}'::jsonb;
+
+COMMENT ON COLUMN products.content_hashes IS '各站点上次写入的字段哈希，full-sync 据此跳过内容未变化的商品';
+
+-- merge_product_patches 增加 content_hashes 的合并
+CREATE OR REPLACE FUNCTION merge_product_patches(patches JSONB)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  affected INTEGER;
+BEGIN
+  -- 1. 新 SKU 先插入空行（name 优先取补丁中的共享名称，其次取站点内容名称，最后用 SKU 兜底）
+  INSERT INTO products (sku, name)
+  SELECT
+    x.sku,
+    COALESCE(
+      x.name,
+      (SELECT c.value ->> 'name' FROM jsonb_each(COALESCE(x.content, '{}'::jsonb)) AS c LIMIT 1),
+      x.sku
+    )
+  FROM jsonb_to_recordset(patches) AS x(sku TEXT, name TEXT, content JSONB)
+  WHERE x.sku IS NOT NULL AND x.sku <> ''
+  ON CONFLICT (sku) DO NOTHING;
+
+  -- 2. 行级原子合并：UPDATE 在行锁下读取最新值，多个站点并发写入同一 SKU 也不会丢失更新
+  UPDATE products AS p SET
+    prices           = COALESCE(p.prices, '{}'::jsonb)           || COALESCE(x.prices, '{}'::jsonb),
+    regular_prices   = COALESCE(p.regular_prices, '{}'::jsonb)   || COALESCE(x.regular_prices, '{}'::jsonb),
+    stock_quantities = COALESCE(p.stock_quantities, '{}'::jsonb) || COALESCE(x.stock_quantities, '{}'::jsonb),
+    stock_statuses   = COALESCE(p.stock_statuses, '{}'::jsonb)   || COALESCE(x.stock_statuses, '{}'::jsonb),
+    statuses         = COALESCE(p.statuses, '{}'::jsonb)         || COALESCE(x.statuses, '{}'::jsonb),
+    content          = COALESCE(p.content, '{}'::jsonb)          || COALESCE(x.content, '{}'::jsonb),
+    sync_status      = COALESCE(p.sync_status, '{}'::jsonb)      || COALESCE(x.sync_status, '{}'::jsonb),
+    variations       = COALESCE(p.variations, '{}'::jsonb)       || COALESCE(x.variations, '{}'::jsonb),
+    variation_counts = COALESCE(p.variation_counts, '{}'::jsonb) || COALESCE(x.variation_counts, '{}'::jsonb),
+    variation_cache  = COALESCE(p.variation_cache, '{}'::jsonb)  || COALESCE(x.variation_cache, '{}'::jsonb),
+    content_hashes   = COALESCE(p.content_hashes, '{}'::jsonb)   || COALESCE(x.content_hashes, '{}'::jsonb),
+    woo_ids          = COALESCE(p.woo_ids, '{}'::jsonb)          || COALESCE(x.woo_ids, '{}'::jsonb),
+    name             = COALESCE(x.name, p.name),
+    images           = COALESCE(x.images, p.images),
+    categories       = COALESCE(x.categories, p.categories),
+    attributes       = COALESCE(x.attributes, p.attributes),
+    last_synced_at   = COALESCE(x.last_synced_at, p.last_synced_at)
+  FROM jsonb_to_recordset(patches) AS x(
+    sku TEXT,
+    name TEXT,
+    images JSONB,
+    categories JSONB,
+    attributes JSONB,
+    prices JSONB,
+    regular_prices JSONB,
+    stock_quantities JSONB,
+    stock_statuses JSONB,
+    statuses JSONB,
+    content JSONB,
+    sync_status JSONB,
+    variations JSONB,
+    variation_counts JSONB,
+    variation_cache JSONB,
+    content_hashes JSONB,
+    woo_ids JSONB,
+    last_synced_at TIMESTAMPTZ
+  )
+  WHERE p.sku = x.sku;
+
+  GET DIAGNOSTICS affected = ROW_COUNT;
+  RETURN affected;
+END;
+$$;
+
+COMMENT ON FUNCTION merge_product_patches(JSONB) IS '批量合并各站点商品补丁（jsonb || 浅合并），供 full-sync Cloud Function 使用';
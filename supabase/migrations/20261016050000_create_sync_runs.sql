@@ -0,0 +1,24 @@
+-- 同步运行历史表
+-- full-sync Cloud Function 每个站点每次运行写入一行：结果计数、耗时和结构化指标
+-- （各阶段耗时、按接口的请求延迟直方图、响应状态码计数、重试次数、接收字节数），用于定位耗时和发现性能回退
+
+CREATE TABLE IF NOT EXISTS sync_runs (
+  id BIGSERIAL PRIMARY KEY,
+  site TEXT NOT NULL,                          -- 站点: com, uk, de, fr
+  action TEXT NOT NULL,                        -- 请求动作: full-sync / sync-site / delta-sync / price-stock-sync / resume / sharded-sync
+  status TEXT NOT NULL,                        -- completed / cancelled / paused / error
+  total INTEGER NOT NULL DEFAULT 0,
+  success INTEGER NOT NULL DEFAULT 0,
+  failed INTEGER NOT NULL DEFAULT 0,
+  duration DOUBLE PRECISION,                   -- 运行耗时（秒）
+  metrics JSONB NOT NULL DEFAULT '{}'::jsonb,  -- SyncMetrics.to_dict() 的输出
+  created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_sync_runs_site_created_at ON sync_runs (site, created_at DESC);
+
+ALTER TABLE sync_runs ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Allow all access to sync_runs" ON sync_runs FOR ALL USING (true);
+
+COMMENT ON TABLE sync_runs IS 'full-sync 各站点每次运行的结果和指标（阶段耗时、请求延迟直方图、状态码、重试、接收字节数）';
@@ -0,0 +1,26 @@
+-- 同步任务队列表
+-- full-sync Cloud Function 的 submit 动作把同步请求写入这里并立即返回任务 ID，
+-- 由实例内的后台线程按提交顺序认领执行；status 动作查询任务状态和实时进度
+
+CREATE TABLE IF NOT EXISTS sync_jobs (
+  id TEXT PRIMARY KEY,                         -- 任务 ID
+  action TEXT NOT NULL,                        -- 同步动作: full-sync / sync-site / delta-sync / price-stock-sync / resume
+  params JSONB NOT NULL DEFAULT '{}'::jsonb,   -- 请求参数（与同步请求的 JSON 相同，不含 action）
+  dedupe_key TEXT NOT NULL,                    -- 动作和参数的哈希，相同的排队任务只保留一个
+  status TEXT NOT NULL DEFAULT 'queued',       -- queued / running / completed / error
+  result JSONB,                                -- 同步结果（与同步请求的响应相同）
+  error TEXT,
+  created_at TIMESTAMPTZ DEFAULT NOW(),
+  started_at TIMESTAMPTZ,
+  finished_at TIMESTAMPTZ
+);
+
+-- 同一时刻相同参数的排队任务只能有一个，并发提交时由数据库保证去重
+CREATE UNIQUE INDEX IF NOT EXISTS idx_sync_jobs_queued_dedupe ON sync_jobs (dedupe_key) WHERE status = 'queued';
+CREATE INDEX IF NOT EXISTS idx_sync_jobs_status_created_at ON sync_jobs (status, created_at);
+
+ALTER TABLE sync_jobs ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Allow all access to sync_jobs" ON sync_jobs FOR ALL USING (true);
+
+COMMENT ON TABLE sync_jobs IS 'full-sync 异步任务队列，submit 提交、后台线程执行、status 查询';
@@ -0,0 +1,16 @@
+-- 同步任务租约
+-- 认领任务时写入 lease_expires_at，执行期间后台线程定期续约；执行任务的 Cloud Run 实例被回收后租约过期，
+-- 其他实例认领时接手该任务（最多 attempts 次），status 动作把租约过期的 running 任务标记为 stale
+
+ALTER TABLE sync_jobs ADD COLUMN IF NOT EXISTS claim_id TEXT;                -- 本次认领的 ID，续约和写入结果以它为条件
+ALTER TABLE sync_jobs ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE sync_jobs ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMPTZ;
+ALTER TABLE sync_jobs ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMPTZ;
+
+-- 迁移前认领的任务没有租约，视为已过期，由下一次认领接手
+UPDATE sync_jobs SET lease_expires_at = NOW(), attempts = GREATEST(attempts, 1)
+WHERE status = 'running' AND lease_expires_at IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_sync_jobs_running_lease ON sync_jobs (lease_expires_at) WHERE status = 'running';
+
+COMMENT ON COLUMN sync_jobs.lease_expires_at IS '执行中任务的租约到期时间，过期后其他实例可以接手';
@@ -0,0 +1,56 @@
+-- merge_product_patches 合并语义（pgTAP，运行: supabase test db）
+-- 各站点字段与现有值浅合并，补丁中没有的字段和站点保持不变；共享字段只有补丁中存在时才覆盖；新 SKU 自动插入
+
+BEGIN;
+CREATE EXTENSION IF NOT EXISTS pgtap WITH SCHEMA extensions;
+
+SELECT plan(12);
+
+INSERT INTO products (sku, name, prices, content, variations)
+VALUES (
+  'TAP-1',
+  'Original',
+  '{"com": 10}'::jsonb,
+  '{"com": {"name": "Original"}}'::jsonb,
+  '{"com": [{"id": 1}]}'::jsonb
+);
+
+SELECT is(
+  merge_product_patches('[
+    {"sku": "TAP-1", "prices": {"uk": 12}, "stock_statuses": {"uk": "instock"}},
+    {"sku": "TAP-NEW", "prices": {"de": 5}, "content": {"de": {"name": "Neu"}}},
+    {"sku": ""}
+  ]'::jsonb),
+  2,
+  '返回更新的行数，空 SKU 被忽略'
+);
+
+SELECT is((SELECT prices FROM products WHERE sku = 'TAP-1'), '{"com": 10, "uk": 12}'::jsonb, '站点字段与现有值浅合并');
+SELECT is((SELECT stock_statuses FROM products WHERE sku = 'TAP-1') -> 'uk', '"instock"'::jsonb, '原来为空的站点字段写入补丁值');
+SELECT is((SELECT content FROM products WHERE sku = 'TAP-1'), '{"com": {"name": "Original"}}'::jsonb, '补丁中没有的字段保持不变');
+SELECT is((SELECT variations FROM products WHERE sku = 'TAP-1'), '{"com": [{"id": 1}]}'::jsonb, '补丁中没有的变体保持不变');
+SELECT is((SELECT name FROM products WHERE sku = 'TAP-1'), 'Original', '补丁中没有共享字段时不覆盖');
+SELECT is((SELECT name FROM products WHERE sku = 'TAP-NEW'), 'Neu', '新 SKU 的名称取站点内容名称');
+SELECT is((SELECT prices FROM products WHERE sku = 'TAP-NEW'), '{"de": 5}'::jsonb, '新 SKU 写入站点字段');
+
+SELECT merge_product_patches('[{
+  "sku": "TAP-1",
+  "name": "Renamed",
+  "prices": {"com": 11},
+  "variations": {"com": []},
+  "variation_cache": {"com": {"modified": "2026-01-01T00:00:00"}},
+  "content_hashes": {"com": {"prices": "abc"}},
+  "change_stats": {"com": {"score": 1}}
+}]'::jsonb);
+
+SELECT is((SELECT prices FROM products WHERE sku = 'TAP-1'), '{"com": 11, "uk": 12}'::jsonb, '同一站点的值被覆盖，其他站点保留');
+SELECT is((SELECT variations FROM products WHERE sku = 'TAP-1'), '{"com": []}'::jsonb, '站点的变体整体替换（浅合并）');
+SELECT is((SELECT name FROM products WHERE sku = 'TAP-1'), 'Renamed', '补丁中有共享字段时覆盖');
+SELECT is(
+  (SELECT jsonb_build_array(variation_cache, content_hashes, change_stats) FROM products WHERE sku = 'TAP-1'),
+  '[{"com": {"modified": "2026-01-01T00:00:00"}}, {"com": {"prices": "abc"}}, {"com": {"score": 1}}]'::jsonb,
+  '变体缓存、内容指纹和变化分数列参与合并'
+);
+
+SELECT * FROM finish();
+ROLLBACK;